@@ -1,14 +1,19 @@
 from flask import Flask
 import os
 
-def create_app():
+def create_app(service_address=None):
+    """
+    Without service_address the visualizer and all background work run in this process (run.py),
+    otherwise the app connects to the visualizer service on that Unix socket (wsgi.py).
+    """
     app = Flask(__name__)
     app.config.from_object('config.Config')
 
-    from app.routes import bp
-    app.register_blueprint(bp)
-
     if not os.path.exists(app.config['MUSIC_FOLDER']):
         os.makedirs(app.config['MUSIC_FOLDER'])
+
+    from app.routes import bp, init_service
+    init_service(service_address)
+    app.register_blueprint(bp)
     
-    return app
\ No newline at end of file
+    return app
@@ -0,0 +1,143 @@
+"""
+Library Catalog
+---
+
+Persistent list of the songs in the music folder, stored in a SQLite file next
+to the music. The server starts with the songs of the last run and keeps the
+catalog up to date in a background thread: the music folder is listed every few
+seconds and whenever a file was added, removed, renamed or rewritten (e.g. by
+rsync or a download, compared by size and mtime in ns) the folder is diffed
+against the catalog, so only new or changed files are read.
+
+Every song stores its title, path, size, mtime, duration and sample rate.
+Whether its analysis is in the analysis cache is asked from the cache every
+time, so the flag is also right after the cache evicted an entry or another
+part of the player analyzed the song.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from tools.analysis.decode import probe
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    title TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL,
+    sample_rate INTEGER
+)
+"""
+TEMP_PREFIX = "___"  # files of running downloads
+
+
+class Catalog:
+    def __init__(self, path: str, music_folder: str, extensions: List[str],
+                 is_analyzed: Optional[Callable[[str], bool]] = None):
+        self.music_folder = music_folder
+        self.extensions = [extension.lower() for extension in extensions]
+        self.is_analyzed = is_analyzed  # e.g. AnalysisCache.contains, no song is analyzed without it
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute(SCHEMA)
+
+        self._listeners: List[Callable[[List[str], List[str]], None]] = []
+        self._files = None  # scan of the last refresh
+        self._refresh_lock = threading.Lock()
+        self._watcher = None
+
+    # === QUERIES ===============================================================
+    def titles(self, analyzed: Optional[bool] = None) -> List[str]:
+        """All titles, or only the (not) analyzed ones"""
+        with self._lock:
+            rows = self._db.execute("SELECT title, path FROM songs").fetchall()
+        return [row["title"] for row in rows if analyzed is None or self.analyzed(row["path"]) == analyzed]
+
+    def get(self, title: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT title, path, size, mtime_ns, duration, sample_rate FROM songs WHERE title = ?", (title,)).fetchone()
+        return {**row, "analyzed": self.analyzed(row["path"])} if row else None
+
+    def analyzed(self, path: str) -> bool:
+        """Whether the analysis of the file at path is in the analysis cache"""
+        try:
+            return self.is_analyzed is not None and self.is_analyzed(path)
+        except OSError:
+            return False  # removed in the meantime
+
+    def path_of(self, title: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT path FROM songs WHERE title = ?", (title,)).fetchone()
+        return row["path"] if row else None
+
+    # === UPDATES ===============================================================
+    def subscribe(self, listener: Callable[[List[str], List[str]], None]) -> None:
+        """listener(added, removed) is called with the titles after every refresh that changed the catalog"""
+        self._listeners.append(listener)
+
+    def scan(self) -> Dict[str, Tuple[str, int, int]]:
+        """title -> (path, size, mtime_ns) of the songs in the music folder"""
+        files = {}
+        priorities = {}
+        for entry in os.scandir(self.music_folder):
+            title, extension = os.path.splitext(entry.name)
+            extension = extension.lower()
+            if entry.name.startswith((".", TEMP_PREFIX)) or extension not in self.extensions or not entry.is_file():
+                continue
+            if title in priorities and priorities[title] <= self.extensions.index(extension):
+                continue  # same title in a preferred format
+            stat = entry.stat()
+            files[title] = (os.path.abspath(entry.path), stat.st_size, stat.st_mtime_ns)
+            priorities[title] = self.extensions.index(extension)
+        return files
+
+    def refresh(self, files: Optional[Dict[str, Tuple[str, int, int]]] = None) -> None:
+        """Diff the music folder (or a scan of it) against the catalog"""
+        with self._refresh_lock:
+            files = self.scan() if files is None else files
+            self._files = files
+
+            with self._lock:
+                known = {row["title"]: (row["path"], row["size"], row["mtime_ns"]) for row in self._db.execute("SELECT title, path, size, mtime_ns FROM songs")}
+
+            added = [title for title in files if title not in known]
+            changed = [title for title in files if title in known and known[title] != files[title]]
+            removed = [title for title in known if title not in files]
+            if not (added or changed or removed):
+                return
+
+            rows = [(title, *files[title], *probe(files[title][0])) for title in added + changed]
+            with self._lock, self._db:
+                self._db.executemany("DELETE FROM songs WHERE title = ?", [(title,) for title in removed])
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO songs (title, path, size, mtime_ns, duration, sample_rate) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        for listener in self._listeners:
+            try:
+                listener(added + changed, removed)
+            except Exception as e:
+                print(f"Catalog listener failed: {e}")
+
+    def watch(self, interval: float) -> None:
+        """Refresh in a background thread whenever a song of the music folder changed"""
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+            self._watcher.start()
+
+    def _watch(self, interval: float) -> None:
+        while True:
+            try:
+                files = self.scan()  # a file rewritten in place doesn't change the mtime of the folder
+                if files != self._files:
+                    self.refresh(files)
+            except Exception as e:
+                print(f"Could not refresh the catalog: {e}")
+            time.sleep(interval)
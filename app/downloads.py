@@ -0,0 +1,161 @@
+"""
+Download Queue
+---
+
+Downloads songs with yt-dlp in a small pool of background threads, so a
+download doesn't block a request of the web server for minutes.
+
+Every download is a job with an id which the player polls for its progress.
+A job extracts the video information once, checks the name against the library
+and then downloads and converts the audio into its own temporary file
+(`___<job id>.<ext>`), which is renamed into the library when it's done.
+Submitting a URL which is already queued or downloading returns the running job.
+"""
+
+import os
+import glob
+import time
+import uuid
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from yt_dlp import YoutubeDL
+
+TEMP_PREFIX = "___"
+MAX_FINISHED_JOBS = 100  # finished jobs are kept this long for polling
+
+QUEUED, DOWNLOADING, CONVERTING, DONE, FAILED = "queued", "downloading", "converting", "done", "failed"
+
+
+class DownloadJob:
+    def __init__(self, url: str, rename: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.url = url
+        self.rename = rename
+        self.status = QUEUED
+        self.progress = 0.0
+        self.name = None
+        self.error = None
+        self.created = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "url": self.url,
+            "status": self.status,
+            "progress": self.progress,
+            "name": self.name,
+            "error": self.error,
+        }
+
+
+class DownloadQueue:
+    def __init__(self, music_folder: str, ytdl_options: Dict, extension: str, library_extensions: List[str],
+                 forbidden_chars: List[str], workers: int = 1, on_done: Optional[Callable[[str], None]] = None):
+        self.music_folder = music_folder
+        self.ytdl_options = ytdl_options
+        self.extension = extension  # of downloaded songs
+        self.library_extensions = library_extensions
+        self.forbidden_chars = forbidden_chars
+        self.on_done = on_done  # on_done(path) after a song was added to the library
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download")
+        self._lock = Lock()
+        self._jobs: Dict[str, DownloadJob] = {}
+        self._by_url: Dict[str, DownloadJob] = {}  # latest job of every URL
+
+    def submit(self, url: str, rename: Optional[str] = None) -> DownloadJob:
+        """Queue a download, returns the running job if the URL is already queued or downloading"""
+        with self._lock:
+            job = self._by_url.get(url)
+            if job and not job.finished:
+                return job
+
+            job = DownloadJob(url, rename)
+            self._jobs[job.id] = job
+            self._by_url[url] = job
+            self._forget_finished()
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[DownloadJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[DownloadJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # === DOWNLOAD ==============================================================
+    def _run(self, job: DownloadJob) -> None:
+        temp = os.path.join(self.music_folder, TEMP_PREFIX + job.id)
+        try:
+            options = dict(self.ytdl_options)
+            options.update({
+                "outtmpl": temp + ".%(ext)s",
+                "noplaylist": True,
+                "progress_hooks": [lambda d: self._progress(job, d)],
+            })
+            with YoutubeDL(options) as ydl:
+                info = ydl.extract_info(job.url, download=False)
+                if info.get("_type", "video") != "video":
+                    raise ValueError("Playlists are not supported")
+
+                name = self._safe_name(job.rename or info.get("title") or "")
+                if not name:
+                    raise ValueError("Empty song name")
+                target_path = os.path.join(self.music_folder, name + self.extension)
+                # Check that it is a new song before downloading
+                if self._exists(name):
+                    raise ValueError("Already a song in library with this name")
+
+                job.status = DOWNLOADING
+                ydl.process_info(info)  # downloads the extracted video without extracting it again
+
+            if not os.path.exists(temp + self.extension):
+                raise ValueError("Download produced no audio file")
+            with self._lock:  # two jobs could have ended with the same name
+                if self._exists(name):
+                    raise ValueError("Already a song in library with this name")
+                os.rename(temp + self.extension, target_path)
+
+            job.name = name
+            job.progress = 1.0
+            if self.on_done:
+                self.on_done(target_path)
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            for path in glob.glob(glob.escape(temp) + ".*"):
+                os.remove(path)
+
+    def _progress(self, job: DownloadJob, d: Dict) -> None:
+        if d["status"] == "downloading":
+            total = d.get("total_bytes") or d.get("total_bytes_estimate")
+            if total:
+                job.progress = min(d.get("downloaded_bytes", 0) / total, 1.0)
+        elif d["status"] == "finished":
+            job.progress = 1.0
+            job.status = CONVERTING
+
+    def _exists(self, name: str) -> bool:
+        return any(os.path.exists(os.path.join(self.music_folder, name + extension)) for extension in self.library_extensions)
+
+    def _safe_name(self, name: str) -> str:
+        return "".join(c for c in name if c not in self.forbidden_chars).rstrip()
+
+    def _forget_finished(self) -> None:
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda job: job.created)[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job.id]
+            if self._by_url.get(job.url) is job:
+                del self._by_url[job.url]
@@ -0,0 +1,98 @@
+"""
+Event Hub
+---
+
+Pushes state changes to every open player over one long-lived HTTP response per
+browser (Server-Sent Events, `/api/events`), instead of every browser polling
+for them. An event is serialized once and put into the queue of every
+subscriber, the response of each subscriber streams its queue.
+
+A subscriber that doesn't keep up (e.g. a phone that went to sleep) is dropped
+once its queue is full, the browser's `EventSource` reconnects by itself.
+Connections that are idle get a comment every `HEARTBEAT` seconds, so dead ones
+are noticed and closed.
+"""
+
+import json
+import time
+import queue
+import threading
+from typing import Callable, Iterator, List, Optional
+
+HEARTBEAT = 15.0  # seconds between two keep-alive comments of an idle stream
+QUEUE_SIZE = 256  # events buffered per subscriber
+
+
+class Subscriber:
+    def __init__(self, raw: bool = False):
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.raw = raw  # gets (event, data) tuples instead of formatted messages
+        self.closed = False
+
+
+class EventHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscriber] = []
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, raw: bool = False) -> Subscriber:
+        subscriber = Subscriber(raw)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscriber.closed = True
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def publish(self, event: str, data) -> None:
+        """Send an event with JSON data to every subscriber"""
+        message = None
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if message is None and not subscriber.raw:
+                message = format_event(event, data)
+            try:
+                subscriber.queue.put_nowait((event, data) if subscriber.raw else message)
+            except queue.Full:
+                self.unsubscribe(subscriber)
+
+    def stream(self, subscriber: Subscriber, first: Optional[str] = None) -> Iterator[str]:
+        """Body of the event stream response of a subscriber, first is sent before all other events"""
+        try:
+            if first:
+                yield first
+            while not subscriber.closed:
+                try:
+                    yield subscriber.queue.get(timeout=HEARTBEAT)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscriber)  # also when the browser disconnected
+
+    def start_feed(self, event: str, interval: float, producer: Callable[[], object]) -> None:
+        """Publish producer() every interval seconds in a background thread, only while anyone listens"""
+        threading.Thread(target=self._feed, args=(event, interval, producer), daemon=True).start()
+
+    def _feed(self, event: str, interval: float, producer: Callable[[], object]) -> None:
+        deadline = time.monotonic()
+        while True:
+            deadline = max(deadline + interval, time.monotonic())
+            if self._subscribers:
+                try:
+                    data = producer()
+                    if data is not None:
+                        self.publish(event, data)
+                except Exception as e:
+                    print(f"Could not publish {event}: {e}")
+            time.sleep(max(deadline - time.monotonic(), 0))
+
+
+def format_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
@@ -0,0 +1,83 @@
+"""
+Remote Service
+---
+
+The `Service` of the visualizer process as seen from a web server worker
+(see `app/service.py`). Calls are sent over one Unix socket connection per
+worker, which is opened again if the service was restarted. The events of the
+service arrive over a second connection in a background thread.
+"""
+
+import time
+import threading
+from multiprocessing.connection import Client
+from typing import Callable, Optional
+from app.service import Service
+
+CONNECT_TIMEOUT = 10.0  # seconds to wait for the service when the worker starts
+RECONNECT_INTERVAL = 1.0
+
+
+class RemoteService:
+    def __init__(self, address: str, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def __getattr__(self, name: str):
+        if name not in Service.REMOTE_METHODS:
+            raise AttributeError(name)
+        return lambda *args: self.call(name, *args)
+
+    def _connect(self, timeout: float = 0.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            except (OSError, EOFError):
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f"Visualizer service is not running on {self.address}")
+                time.sleep(0.1)
+
+    def call(self, method: str, *args):
+        with self._lock:
+            for attempt in range(2):  # once more on a fresh connection if the service was restarted
+                try:
+                    if self._connection is None:
+                        self._connection = self._connect(CONNECT_TIMEOUT if attempt else 0.0)
+                    self._connection.send((method, args))
+                    status, result = self._connection.recv()
+                    break
+                except (OSError, EOFError):
+                    if self._connection is not None:
+                        self._connection.close()
+                        self._connection = None
+                    if attempt:
+                        raise ConnectionError(f"Lost the connection to the visualizer service on {self.address}")
+        if status == 'error':
+            raise RuntimeError(result)
+        return result
+
+    def relay(self, listener: Callable[[str, object], None], on_connect: Optional[Callable[[], None]] = None) -> None:
+        """
+        Call listener(event, data) for every event of the service in a background thread.
+        on_connect is called after every (re)connect, events may have been missed in between.
+        """
+        threading.Thread(target=self._relay, args=(listener, on_connect), daemon=True).start()
+
+    def _relay(self, listener: Callable[[str, object], None], on_connect: Optional[Callable[[], None]]) -> None:
+        while True:
+            try:
+                connection = self._connect(CONNECT_TIMEOUT)
+                connection.send(('subscribe', ()))
+                if on_connect:
+                    on_connect()
+                while True:
+                    event, data = connection.recv()
+                    try:
+                        listener(event, data)
+                    except Exception as e:
+                        print(f"Event listener failed: {e}")
+            except (OSError, EOFError, ConnectionError):
+                time.sleep(RECONNECT_INTERVAL)
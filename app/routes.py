@@ -1,17 +1,49 @@
-from flask import Blueprint, jsonify, request, render_template, send_from_directory
+from flask import Blueprint, Response, jsonify, redirect, request, render_template, send_file, url_for
 import os
-from yt_dlp import YoutubeDL
 from config import Config
-import time
-import subprocess
-from threading import Thread, Lock
+from app.search import SongIndex
+from app.service import Service, authkey
+from app.remote import RemoteService
+from app.transcode import FORMATS, mimetype_of
+from app.events import EventHub, format_event
 
 bp = Blueprint('main', __name__)
 
-db = [os.path.splitext(f)[0] for f in os.listdir(Config.MUSIC_FOLDER) if f.endswith(Config.ALLOWED_EXTENSION)]
+service = None  # Service, or RemoteService of the visualizer process with several workers
+events = None  # EventHub the players are connected to
+db = SongIndex()
 
-vis = Config.VISUALIZER_CLASS(Config.WIDTH, Config.HEIGHT, Config.MAPPER_CLASS)
-vis.start()
+def init_service(address=None):
+    """
+    Creates the service in this process (development server),
+    or connects to the visualizer process on the Unix socket at address (production).
+    """
+    global service, events
+    if address is None:
+        service = Service(Config)
+        events = service.events
+        service.catalog.subscribe(_update_index)
+        _sync_index()
+    else:
+        service = RemoteService(address, authkey(Config))
+        events = EventHub()
+        _sync_index()
+        service.relay(_relay_event, on_connect=_sync_index)
+
+def _update_index(added, removed):
+    for song in removed:
+        db.remove(song)
+    for song in added:
+        db.add(song)
+
+def _sync_index():
+    titles = set(service.titles())
+    _update_index(titles, [song for song in db if song not in titles])
+
+def _relay_event(event, data):
+    if event == 'library':
+        _update_index(data['added'], data['removed'])
+    events.publish(event, data)
 
 @bp.route('/')
 def index():
@@ -19,17 +51,50 @@ def index():
 
 @bp.route('/api/play/')
 def play_song():
-    song = request.args.get('song')
-    return send_from_directory(Config.MUSIC_FOLDER, _get_filename(song))
+    """
+    Streams a song (with range requests and ETag revalidation).
+    format=opus/aac streams a compressed copy once it is transcoded, the original file until then.
+    Such a request is redirected to the URL of the chosen file (file=original/opus/aac), so every range
+    request of a playback reads the same file even if the transcode finishes in the middle of the song.
+    """
+    song = _get_songtitle(request.args.get('song', ''))
+    fmt = request.args.get('format', 'wav')
+    if fmt != 'wav' and fmt not in FORMATS:
+        return jsonify({'error': 'Unknown format'}), 400
+
+    served = request.args.get('file', 'original' if fmt == 'wav' else None)
+    if served is None:
+        if service.stream_path(song, 'original') is None:
+            return jsonify({'error': 'Song not in library'}), 404
+        served = fmt if service.stream_path(song, fmt) else 'original'
+        response = redirect(url_for('main.play_song', song=song, format=fmt, file=served))
+        response.headers['Cache-Control'] = 'no-store'  # the choice changes once the song is transcoded
+        return response
+    if served != 'original' and served not in FORMATS:
+        return jsonify({'error': 'Unknown format'}), 400
+
+    path = service.stream_path(song, served)
+    if path is None:
+        return jsonify({'error': 'Song not in library' if served == 'original' else 'Song not transcoded'}), 404
+
+    return send_file(path, mimetype=mimetype_of(path), conditional=True, etag=True, max_age=Config.STREAM_MAX_AGE)
 
 @bp.route('/api/songs/')
 def list_songs():
-    query = request.args.get('q', '').strip().lower()
+    """
+    Ranked titles matching q, paginated with limit and offset.
+    fuzzy=1 also returns similar titles, the total number of matches is sent as X-Total-Count.
+    """
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', type=int)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    fuzzy = request.args.get('fuzzy', '').lower() in ('1', 'true')
 
-    matching_songs = [f for f in db if query in f.lower()]
-    sorted_songs = sorted(matching_songs, key=lambda f: (f.lower().find(query), f.lower()))
+    songs, total = db.search(query, limit, offset, fuzzy)
 
-    return jsonify(sorted_songs)
+    response = jsonify(songs)
+    response.headers['X-Total-Count'] = str(total)
+    return response
 
 
 @bp.route('/api/queue', methods=['POST'])
@@ -40,45 +105,32 @@ def validate_song():
         if not url:
             return jsonify({'error': 'Empty URL'}), 400
         
-        try:
-            with YoutubeDL(Config.YTDL_OPTIONS) as ydl:
-                info = ydl.extract_info(url, download=False)
-                original_filename = f"___temp.wav"
-                
-                if data['rename'] and len(data['rename']) > 0:
-                    safe_rename = "".join(c for c in data['rename'] if not c in Config.FORBIDDEN_CHARS_IN_NAME).rstrip()
-                else:
-                    safe_rename = "".join(c for c in info['title'] if not c in Config.FORBIDDEN_CHARS_IN_NAME).rstrip()
-                new_filename = f"{safe_rename}.wav"
-
-                original_path = os.path.join(Config.MUSIC_FOLDER, original_filename)
-                target_path = os.path.join(Config.MUSIC_FOLDER, new_filename)
-                # Check that it is a new song before downloading
-                if os.path.exists(target_path):
-                    return jsonify({'error': 'Already a song in library with this name'})
-                
-                info = ydl.extract_info(url, download=True)
-
-                if os.path.exists(original_path):
-                    os.rename(original_path, target_path)
-
-                db.append(_get_songtitle(new_filename))
-
-                return jsonify({'success': True, 'name': _get_songtitle(new_filename)})
-        
-        except Exception as e:
-            return jsonify({'error': str(e)}), 400
+        job = service.submit_download(url, data.get('rename') or None)
+        return jsonify({'success': True, 'job': job}), 202
 
     else:
-        song = data.get('song', '').strip()
+        song = _get_songtitle(data.get('song', '').strip())
         if not song:
             return jsonify({'error': 'Empty song name'}), 400
         
-        if not os.path.exists(os.path.join(Config.MUSIC_FOLDER, song)):
+        if song not in db:
             return jsonify({'error': 'Song not in library'}), 404
         
         # player.add_to_queue(song)
-        return jsonify({'success': True, 'name': _get_songtitle(song)})
+        return jsonify({'success': True, 'name': song})
+
+
+@bp.route('/api/downloads', methods=['GET'])
+def list_downloads():
+    return jsonify({'jobs': service.downloads(), 'success': True})
+
+
+@bp.route('/api/downloads/<job_id>', methods=['GET'])
+def get_download(job_id):
+    job = service.download(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown download'}), 404
+    return jsonify({**job, 'success': True})
 
 
 @bp.route('/api/player/status', methods=['POST'])
@@ -90,25 +142,64 @@ def set_info():
     - name: name of song
     - position: position in song
     """
-    data = request.json
-    vis.update(data)
+    service.update_status(request.json)
     return jsonify({'success': True})
 
 
+@bp.route('/api/clock', methods=['POST'])
+def sync_clock():
+    """
+    One NTP-style sample for the client clock offset,
+    the client keeps the sample with the smallest round trip.
+    """
+    received = Config.VISUALIZER_CLASS.server_time()  # a monotonic clock, the same in every process
+    data = request.get_json(silent=True) or {}
+    return jsonify({'client': data.get('client'), 'received': received, 'sent': Config.VISUALIZER_CLASS.server_time()})
+
+
 @bp.route('/api/player/status', methods=['GET'])
 def get_info():
-    vis.song_playing = False
-    return jsonify({
-        'name': vis.song_name,
-        'time': vis.elapsed_time,
-        'playing': vis.song_playing,
-        'success': True
-    })
+    return jsonify({**service.player_status(), 'success': True})
 
-# Help Functions
 
-def _get_filename(song : str) -> str:
-    return song if song.endswith(".wav") else song + ".wav"
+@bp.route('/api/events', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events, starting with the current player status:
+    - status: the player state changed (name, position at server time timestamp, playing, live)
+    - features: analysis features at the visualized position (FEATURE_EVENT_RATE per second)
+    - library: titles added to or removed from the library
+    """
+    subscriber = events.subscribe()
+    response = Response(events.stream(subscriber, format_event('status', service.player_status())), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a reverse proxy buffer the stream
+    return response
+
+@bp.route('/api/analysis/status', methods=['GET'])
+def get_analysis_status():
+    status = service.analysis_status()
+    if status is None:
+        return jsonify({'error': 'Analysis cache is disabled'}), 404
+    return jsonify({**status, 'success': True})
+
+@bp.route('/api/visualizer/stats', methods=['GET'])
+def get_visualizer_stats():
+    return jsonify({**service.visualizer_stats(), 'success': True})
+
+@bp.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Runtime metrics of the visualizer in the Prometheus text format.
+    """
+    text = service.metrics()
+    if text is None:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+# Help Functions
 
 def _get_songtitle(song : str) -> str:
-    return song if not song.endswith(".wav") else song[:-4]
\ No newline at end of file
+    title, extension = os.path.splitext(song)
+    return title if extension.lower() in Config.AUDIO_EXTENSIONS else song
+
@@ -0,0 +1,195 @@
+"""
+Song Search
+---
+
+In-memory index over the titles of the library for the search-as-you-type of
+the player. Every title is lowercased and encoded once into a NumPy byte string
+array, so matching and ranking a query are vectorized instead of looping over
+the library in Python. Queries of three or more characters only look at the
+titles containing all trigrams of the query, taken from posting lists (compact
+`array`s of song ids). Titles can be added and removed at any time, the arrays
+are rebuilt on the next search after a title was added. Removed titles stay in
+the index as dead ids until they are more than `COMPACT_FRACTION` of it, then
+the index is rebuilt from the remaining titles.
+
+Results are ranked by:
+1. matches at the start of a word before matches inside a word
+2. position of the match in the title
+3. title (case-insensitive)
+
+With `fuzzy` titles that share enough trigrams with the query (typos, swapped
+words) are appended after the exact matches, most similar first.
+"""
+
+import numpy as np
+from array import array
+from threading import Lock
+from typing import Iterable, List, Optional, Tuple
+
+FUZZY_MIN_SIMILARITY = 0.3  # share of the query trigrams a fuzzy match must contain
+FUZZY_STEPS = 1000  # resolution of the similarity in the ranking
+COMPACT_FRACTION = 0.25  # share of removed ids in the index at which it is rebuilt without them
+
+# Bytes that continue a word: ASCII letters and digits and every byte of a multi-byte UTF-8 character
+_WORD_BYTES = np.zeros(256, dtype=bool)
+_WORD_BYTES[[ord(c) for c in "abcdefghijklmnopqrstuvwxyz0123456789"]] = True
+_WORD_BYTES[128:] = True
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SongIndex:
+    def __init__(self, titles: Iterable[str] = ()):
+        self._lock = Lock()
+        self._titles: List[str] = []  # by song id
+        self._encoded: List[bytes] = []  # lowercased UTF-8 titles by song id
+        self._ids = {}  # title -> song id, only titles that weren't removed
+        self._postings = {}  # trigram -> array of song ids (ascending)
+        self._dead = 0  # ids of removed titles
+
+        # Rebuilt by _refresh when stale
+        self._stale = True
+        self._bytes = None  # byte string array of the lowercased titles
+        self._alive = None  # False for removed song ids
+        self._rank = None  # alphabetical rank of every song id
+
+        for title in titles:
+            self.add(title)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, title: str) -> bool:
+        return title in self._ids
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._ids))
+
+    # === UPDATES ===============================================================
+    def add(self, title: str) -> bool:
+        """Add a title to the index, False if it is already in it"""
+        with self._lock:
+            if title in self._ids:
+                return False
+            self._insert(title)
+            self._stale = True
+            return True
+
+    def _insert(self, title: str) -> None:
+        song_id = len(self._titles)
+        lower = title.lower()
+        self._titles.append(title)
+        self._encoded.append(lower.encode())
+        self._ids[title] = song_id
+        for gram in _trigrams(lower):
+            self._postings.setdefault(gram, array("I")).append(song_id)
+
+    def remove(self, title: str) -> bool:
+        """Remove a title from the index, False if it isn't in it"""
+        with self._lock:
+            song_id = self._ids.pop(title, None)
+            if song_id is None:
+                return False
+            self._dead += 1
+            if self._dead > COMPACT_FRACTION * len(self._titles):
+                self._stale = True  # compacted by the next search
+            elif not self._stale:
+                self._alive[song_id] = False  # ids stay in the posting lists and arrays
+            return True
+
+    def _compact(self) -> None:
+        """Number the remaining titles again and rebuild the posting lists without the removed ones"""
+        titles = list(self._ids)  # in the order of their ids, the posting lists stay ascending
+        self._titles, self._encoded, self._ids, self._postings = [], [], {}, {}
+        for title in titles:
+            self._insert(title)
+        self._dead = 0
+
+    def _refresh(self) -> None:
+        if not self._stale:
+            return
+        if self._dead > COMPACT_FRACTION * len(self._titles):
+            self._compact()
+        self._bytes = np.array(self._encoded, dtype=bytes) if self._encoded else np.zeros(0, dtype="S1")
+        self._alive = np.zeros(len(self._titles), dtype=bool)
+        self._alive[list(self._ids.values())] = True
+        self._rank = np.empty(len(self._titles), dtype=np.int64)
+        self._rank[np.argsort(self._bytes, kind="stable")] = np.arange(len(self._titles))
+        self._stale = False
+
+    # === SEARCH ================================================================
+    def search(self, query: str, limit: Optional[int] = None, offset: int = 0, fuzzy: bool = False) -> Tuple[List[str], int]:
+        """Ranked titles matching the query from offset on (at most limit) and the total number of matches"""
+        query = query.strip().lower()
+        with self._lock:
+            self._refresh()
+            count = len(self._titles)
+            width = self._bytes.dtype.itemsize + 1
+
+            ids, positions = self._matches(query)
+            previous = self._bytes.view(np.uint8).reshape(count, -1)[ids, np.maximum(positions - 1, 0)] if count else ids
+            inside_word = (positions > 0) & _WORD_BYTES[previous]
+            keys = ((inside_word * width + positions) * count + self._rank[ids]).astype(np.int64)
+
+            if fuzzy:
+                similar, similarity = self._similar(query)
+                keep = self._alive[similar] & ~np.isin(similar, ids, assume_unique=True)
+                similar, similarity = similar[keep], similarity[keep]
+                distance = np.round((1 - similarity) * FUZZY_STEPS).astype(np.int64)
+                ids = np.concatenate([ids, similar])
+                keys = np.concatenate([keys, (2 * width + distance) * count + self._rank[similar]])
+
+            total = len(keys)
+            end = total if limit is None else min(offset + limit, total)
+            if offset >= end:
+                return [], total
+            if end < total:
+                top = np.argpartition(keys, end - 1)[:end]
+                order = top[np.argsort(keys[top])]
+            else:
+                order = np.argsort(keys)
+            return [self._titles[song_id] for song_id in ids[order[offset:end]].tolist()], total
+
+    def _matches(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Ids of the titles containing query and the byte position of the first match"""
+        needle = query.encode()
+        candidates = self._candidates(query)
+        if candidates is None:
+            positions = np.char.find(self._bytes, needle)
+            ids = np.flatnonzero((positions >= 0) & self._alive)
+            return ids, positions[ids]
+
+        candidates = candidates[self._alive[candidates]]
+        positions = np.char.find(self._bytes[candidates], needle)
+        found = positions >= 0
+        return candidates[found], positions[found]
+
+    def _candidates(self, query: str) -> Optional[np.ndarray]:
+        """Song ids that may contain query, None if all of them may (queries shorter than a trigram)"""
+        if len(query) < 3:
+            return None
+
+        postings = [self._postings.get(gram) for gram in _trigrams(query)]
+        if any(posting is None for posting in postings):
+            return np.zeros(0, dtype=np.intp)
+        postings.sort(key=len)
+        ids = np.array(postings[0], dtype=np.intp)
+        for posting in postings[1:]:
+            ids = np.intersect1d(ids, np.array(posting, dtype=np.intp), assume_unique=True)
+            if not len(ids):
+                break
+        return ids
+
+    def _similar(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Ids of the titles sharing enough trigrams with query and their similarity"""
+        grams = _trigrams(query)
+        postings = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not postings:
+            return np.zeros(0, dtype=np.intp), np.zeros(0)
+        ids, counts = np.unique(np.concatenate([np.array(p, dtype=np.intp) for p in postings]), return_counts=True)
+        similarity = counts / len(grams)
+        keep = similarity >= FUZZY_MIN_SIMILARITY
+        return ids[keep], similarity[keep]
@@ -0,0 +1,237 @@
+"""
+Visualizer Service
+---
+
+Everything of the player that must exist exactly once: the visualizer (and its
+live input), the library catalog and its watcher, the background analysis,
+downloads and transcoding, and the hub that pushes events to the players.
+
+The development server (`run.py`) creates the service inside its own process.
+In production it runs in a process of its own (`python -m app.service`), so
+the web server can use as many worker processes as it wants: every worker calls
+the methods in `REMOTE_METHODS` over a local Unix socket (`app/remote.py`) and
+receives the events of the hub over a second connection.
+
+The socket transfers pickled messages, so only processes that know the random
+key in `SERVICE_KEY_FILE` may talk to the service. The key file is created with
+mode 0600 and the service refuses to start if others could read it.
+"""
+
+import os
+import queue
+import secrets
+import threading
+import numpy as np
+from multiprocessing.connection import Listener
+from typing import Dict, List, Optional
+from tools.analysis.pre_analysis import PreAnalyzer
+from tools.analysis.streaming import open_source
+from tools.metrics import metrics
+from app.catalog import Catalog
+from app.downloads import DownloadQueue
+from app.transcode import TranscodeCache
+from app.events import EventHub
+
+
+class Service:
+    # Methods the web server workers may call
+    REMOTE_METHODS = ("titles", "player_status", "update_status", "features", "visualizer_stats", "analysis_status",
+                      "stream_path", "submit_download", "download", "downloads", "metrics")
+
+    def __init__(self, config):
+        self.config = config
+        metrics.enabled = config.METRICS_ENABLED
+        os.makedirs(config.MUSIC_FOLDER, exist_ok=True)
+        self.vis = config.VISUALIZER_CLASS(config.WIDTH, config.HEIGHT, config.MAPPER_CLASS)
+        self.vis.start()
+        if config.LIVE_INPUT:
+            try:
+                self.vis.listen(open_source(config.LIVE_INPUT, config.LIVE_BLOCK_SIZE, config.LIVE_SAMPLE_RATE))
+            except Exception as e:
+                print(f"Could not open live input {config.LIVE_INPUT}: {e}")
+
+        cache = self.vis.analysis_cache
+        self.catalog = Catalog(config.CATALOG_PATH, config.MUSIC_FOLDER, config.AUDIO_EXTENSIONS, cache.contains if cache else None)
+
+        # Analyze the library in the background, so song changes only load cached features
+        self.pre_analyzer = None
+        if self.vis.analysis_cache:
+            self.pre_analyzer = PreAnalyzer(self.vis.analysis_cache, config.ANALYSIS_WORKERS)
+            # Finding the songs that aren't cached hashes new files, which mustn't delay the start
+            threading.Thread(target=lambda: self.pre_analyzer.submit_all(
+                self.catalog.path_of(song) for song in self.catalog.titles(analyzed=False)), daemon=True).start()
+            self.vis.pre_analyzer = self.pre_analyzer
+
+        # Compressed copies of the songs for streaming
+        self.transcodes = None
+        if config.TRANSCODE_FOLDER:
+            self.transcodes = TranscodeCache(config.TRANSCODE_FOLDER, config.TRANSCODE_MAX_MB * 1024 * 1024, config.TRANSCODE_BITRATE)
+            if not self.transcodes.available:
+                print("ffmpeg not installed. Songs are streamed uncompressed")
+
+        # Player state, live features and library changes are pushed to every open player
+        self.events = EventHub()
+        if config.FEATURE_EVENT_RATE:
+            self.events.start_feed('features', 1 / config.FEATURE_EVENT_RATE, self.features)
+
+        # Songs added or removed outside of the player show up without a restart
+        self.catalog.subscribe(self._library_changed)
+        self.catalog.watch(config.CATALOG_POLL_INTERVAL)
+
+        self.download_queue = DownloadQueue(config.MUSIC_FOLDER, config.YTDL_OPTIONS, config.ALLOWED_EXTENSION, config.AUDIO_EXTENSIONS,
+                                            config.FORBIDDEN_CHARS_IN_NAME, config.DOWNLOAD_WORKERS, on_done=lambda path: self.catalog.refresh())
+
+    def _library_changed(self, added: List[str], removed: List[str]) -> None:
+        for song in added:
+            if self.pre_analyzer:
+                self.pre_analyzer.submit(self.catalog.path_of(song))
+            if self.transcodes and self.config.TRANSCODE_PREFETCH:
+                self.transcodes.prefetch(self.catalog.path_of(song), self.config.TRANSCODE_PREFETCH)
+        self.events.publish('library', {'added': added, 'removed': removed})
+
+    # === LIBRARY ===============================================================
+    def titles(self) -> List[str]:
+        return self.catalog.titles()
+
+    def stream_path(self, song: str, fmt: str) -> Optional[str]:
+        """
+        File of a song in format fmt ('original' for the library file), None if it isn't in the library
+        or not transcoded yet (it is transcoded in the background then)
+        """
+        path = self.catalog.path_of(song)
+        if path is None or not os.path.isfile(path):
+            return None
+        if fmt != 'original':
+            path = self.transcodes.get(path, fmt) if self.transcodes else None
+        return path
+
+    # === PLAYER ================================================================
+    def player_status(self) -> Dict:
+        vis = self.vis
+        return {
+            'name': vis.song_name,
+            'position': vis.song_pos,
+            'timestamp': vis.song_timestamp,  # server time at which the song was at position
+            'playing': vis.song_playing,
+            'live': vis.live is not None,
+            'time': vis.elapsed_time,  # position the visualizer shows
+        }
+
+    def update_status(self, data: Dict) -> None:
+        self.vis.update(data)
+        self.events.publish('status', {**self.player_status(), 'client': data.get('client')})
+
+    def features(self) -> Optional[Dict]:
+        """Scalar analysis features at the visualized position, None while nothing is playing"""
+        position = self.vis.output_position()
+        track = self.vis.track
+        if position is None or track is None:
+            return None
+        features = {'position': position}
+        for key, value in track.analyze(position).items():
+            if isinstance(value, (bool, np.bool_)):
+                features[key] = bool(value)
+            elif isinstance(value, (int, float, np.number)):
+                features[key] = float(value)
+        return features
+
+    def visualizer_stats(self) -> Dict:
+        return {**self.vis.scheduler.stats(), **self.vis.pipeline.stats()}
+
+    def analysis_status(self) -> Optional[Dict]:
+        return self.pre_analyzer.status() if self.pre_analyzer else None
+
+    def metrics(self) -> Optional[str]:
+        """Metrics of the visualizer in the Prometheus text format, None if they are disabled"""
+        return metrics.render() if metrics.enabled else None
+
+    # === DOWNLOADS =============================================================
+    def submit_download(self, url: str, rename: Optional[str] = None) -> Dict:
+        return self.download_queue.submit(url, rename).to_dict()
+
+    def download(self, job_id: str) -> Optional[Dict]:
+        job = self.download_queue.get(job_id)
+        return job.to_dict() if job else None
+
+    def downloads(self) -> List[Dict]:
+        return [job.to_dict() for job in self.download_queue.jobs()]
+
+    # === SOCKET ================================================================
+    def serve(self, address: str, authkey: bytes) -> None:
+        """Answer the calls of the web server workers on a Unix socket, runs until the process ends"""
+        if os.path.exists(address):
+            os.remove(address)  # left over from a previous run
+        with Listener(address, family='AF_UNIX', authkey=authkey) as listener:
+            os.chmod(address, 0o600)  # only the user of the service (and its workers) can connect at all
+            print(f"Visualizer service listening on {address}")
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:
+                    print(f"Rejected connection to the service: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def _handle(self, connection) -> None:
+        try:
+            while True:
+                method, args = connection.recv()
+                if method == 'subscribe':
+                    self._send_events(connection)
+                    return
+                if method not in self.REMOTE_METHODS:
+                    connection.send(('error', f"Unknown method {method}"))
+                    continue
+                try:
+                    connection.send(('ok', getattr(self, method)(*args)))
+                except Exception as e:
+                    connection.send(('error', f"{type(e).__name__}: {e}"))
+        except (EOFError, OSError):
+            pass  # the worker disconnected
+        finally:
+            connection.close()
+
+    def _send_events(self, connection) -> None:
+        """Forward every event of the hub to a worker until it disconnects"""
+        subscriber = self.events.subscribe(raw=True)
+        try:
+            while not subscriber.closed:  # closed by the hub if the worker doesn't keep up
+                try:
+                    connection.send(subscriber.queue.get(timeout=1.0))
+                except queue.Empty:
+                    continue
+        finally:
+            self.events.unsubscribe(subscriber)
+
+
+KEY_BYTES = 32
+
+
+def authkey(config) -> bytes:
+    """
+    Key the workers authenticate with at the service, from SERVICE_KEY_FILE.
+    The first process that needs it (service or worker) creates it with random bytes and mode 0600.
+    """
+    path = config.SERVICE_KEY_FILE
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(KEY_BYTES))
+    except FileExistsError:
+        pass
+
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+    with os.fdopen(fd) as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+            raise PermissionError(f"{path} must belong to this user and be readable only by it (chmod 600), "
+                                  f"otherwise other users could run code in the visualizer service")
+        key = f.read().strip()
+    if len(key) < 2 * KEY_BYTES:
+        raise ValueError(f"{path} doesn't hold a key, delete it to create a new one")
+    return key.encode()
+
+
+if __name__ == '__main__':
+    from config import Config
+    Service(Config).serve(Config.SERVICE_SOCKET, authkey(Config))
@@ -6,6 +6,11 @@ let selectedSearchIndex = -1;
 let isDragging = false;
 let queue = [];
 
+const SEARCH_LIMIT = 50;
+const DOWNLOAD_POLL_INTERVAL = 1000;
+const AUDIO_FORMAT = preferredAudioFormat();
+const CLIENT_ID = Math.random().toString(36).slice(2); // tells the events of this browser from the ones of others
+
 $(document).ready(function() {
     // Event Listeners
     $('#search-input').on('input', handleSearchInput);
@@ -24,7 +29,11 @@ $(document).ready(function() {
     // Initial UI setup
     applyTranslations();
     handleSearchInput();
-    getCurrentData();
+    connectEvents();
+    syncClock();
+    setInterval(syncClock, CLOCK_SYNC_INTERVAL);
+    setInterval(() => { if (audioElement && !audioElement.paused) sendPlayerStatus(); }, STATUS_RESEND_INTERVAL);
+    $(document).on('keydown', handleLatencyCalibration);
 
     $('#search-input').on('blur', function () {
         setTimeout(() => $('#search-results').hide(), 200); // Kurze Verzögerung, damit Klicks auf Suchergebnisse registriert werden
@@ -61,7 +70,7 @@ function playTrack(song, play=true) {
         audioElement.pause();
         audioElement = null;
     }
-    audioElement = new Audio(`api/play?song=${song}`);
+    audioElement = new Audio(`api/play?song=${encodeURIComponent(song)}&format=${AUDIO_FORMAT}`);
     if (play) {
         audioElement.play();
         $('#play-pause-btn').html('<i class="bi bi-pause"></i>');
@@ -73,6 +82,20 @@ function playTrack(song, play=true) {
 
     audioElement.addEventListener("timeupdate", updateProgressBar);
     audioElement.addEventListener("ended", skipTrack);
+    // currentTime only matches the sound once the audio actually started or jumped
+    audioElement.addEventListener("playing", sendPlayerStatus);
+    audioElement.addEventListener("seeked", () => {
+        if (followingSeek) followingSeek = false; // jumped to the position of another player, nothing to report
+        else sendPlayerStatus();
+    });
+}
+
+// Compressed formats load and seek faster, the server falls back to WAV until they are transcoded
+function preferredAudioFormat() {
+    const probe = document.createElement('audio');
+    if (probe.canPlayType('audio/ogg; codecs="opus"')) return 'opus';
+    if (probe.canPlayType('audio/mp4; codecs="mp4a.40.2"')) return 'aac';
+    return 'wav';
 }
 
 function togglePlayPause() {
@@ -133,7 +156,7 @@ function handleSearchInput() {
             return;
         } */
         
-        fetch(`/api/songs?q=${encodeURIComponent(query)}`)
+        fetch(`/api/songs?q=${encodeURIComponent(query)}&limit=${SEARCH_LIMIT}&fuzzy=1`)
             .then(response => response.json())
             .then(handleSearchResults)
             .catch(error => showError(error.message));
@@ -215,7 +238,7 @@ function addToQueue() {
 
     const payload = isYoutube ? 
         { url: input, rename: rename } : 
-        { song: input + '.wav' };
+        { song: input };
 
     fetch('/api/queue', {
         method: 'POST',
@@ -225,7 +248,10 @@ function addToQueue() {
     .then(response => response.json())
     .then(data => {
         if (data.error) throw new Error(data.error);
-        queue.push(data.name);
+        return data.job ? waitForDownload(data.job.id) : data.name;
+    })
+    .then(name => {
+        queue.push(name);
         updateQueue();
         if (!audioElement) {
             skipTrack();
@@ -237,6 +263,26 @@ function addToQueue() {
     $('#search-input').val('');
 }
 
+// Polls the download job until the song is in the library, resolves with its name
+function waitForDownload(jobId) {
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(`/api/downloads/${jobId}`)
+                .then(response => response.json())
+                .then(job => {
+                    if (job.error) return reject(new Error(job.error));
+                    if (job.status === 'done') return resolve(job.name);
+
+                    const btnText = document.getElementById("add-btn").querySelector(".btn-text");
+                    btnText.innerHTML = `<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> ${lang.downloading} ${Math.round(job.progress * 100)}%`;
+                    setTimeout(poll, DOWNLOAD_POLL_INTERVAL);
+                })
+                .catch(reject);
+        };
+        poll();
+    });
+}
+
 function showLoadingState(isYoutube) {
     const btn = $('#add-btn');
     btn.prop('disabled', true);
@@ -392,11 +438,7 @@ function updateQueue() {
 function updateProgressBar() {
     if (isDragging || !audioElement || !audioElement.duration) return;
 
-    const progress = (audioElement.currentTime / audioElement.duration) * 100;
-    let time = `${formatTime(audioElement.currentTime)} / ${formatTime(audioElement.duration)}`;
-    $('#progress-bar').css('width', `${progress}%`);
-    $('#progress-thumb').css('left', `${progress}%`);
-    $('#time-display').text(time);
+    const progress = showProgress(audioElement.currentTime, audioElement.duration);
 
     // document.title = `${formatTime(audioElement.currentTime)}` + " " + document.getElementById("current-song").textContent;
 
@@ -405,6 +447,14 @@ function updateProgressBar() {
     }
 }
 
+function showProgress(position, duration) {
+    const progress = Math.min(position / duration, 1) * 100;
+    $('#progress-bar').css('width', `${progress}%`);
+    $('#progress-thumb').css('left', `${progress}%`);
+    $('#time-display').text(`${formatTime(position)} / ${formatTime(duration)}`);
+    return progress;
+}
+
 // Click on progress bar to seek to a specific position
 function seekAudio(event) {
     if (!audioElement || !audioElement.duration) return;
@@ -440,6 +490,70 @@ function stopDrag() {
     sendPlayerStatus();
 }
 
+/* ----- Clock Sync & Latency ----- */
+const CLOCK_SAMPLES = 8;
+const CLOCK_SYNC_INTERVAL = 60000;
+const STATUS_RESEND_INTERVAL = 10000;
+const LATENCY_STEP = 0.01;
+
+let clockOffset = null; // server clock - client clock in seconds
+let audioContext = null;
+
+function clientTime() {
+    return (performance.timeOrigin + performance.now()) / 1000;
+}
+
+// NTP-style exchange, the sample with the smallest round trip has the smallest error
+async function syncClock() {
+    let best = null;
+    for (let i = 0; i < CLOCK_SAMPLES; i++) {
+        try {
+            const t0 = clientTime();
+            const response = await fetch('/api/clock', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ client: t0 })
+            });
+            const data = await response.json();
+            const t3 = clientTime();
+
+            const roundTrip = (t3 - t0) - (data.sent - data.received);
+            const offset = ((data.received - t0) + (data.sent - t3)) / 2;
+            if (!best || roundTrip < best.roundTrip) best = { roundTrip: roundTrip, offset: offset };
+        } catch (err) {
+            console.error(err);
+        }
+    }
+    if (best) clockOffset = best.offset;
+}
+
+// Seconds until a sample at currentTime is audible: reported by the browser plus the calibration of this device
+function outputLatency() {
+    let latency = 0;
+    try {
+        audioContext = audioContext || new AudioContext();
+        latency = (audioContext.outputLatency || 0) + (audioContext.baseLatency || 0);
+    } catch (err) {}
+    return latency + latencyCorrection();
+}
+
+function latencyCorrection() {
+    return parseFloat(localStorage.getItem('outputLatencyCorrection')) || 0;
+}
+
+// Shift + Arrow Left/Right moves the visualizer earlier/later by 10 ms, stored per device
+function handleLatencyCalibration(event) {
+    if (!event.shiftKey || $(event.target).is('input')) return;
+    if (event.key !== 'ArrowLeft' && event.key !== 'ArrowRight') return;
+
+    const step = event.key === 'ArrowRight' ? LATENCY_STEP : -LATENCY_STEP;
+    const correction = Math.round((latencyCorrection() + step) * 1000) / 1000;
+    localStorage.setItem('outputLatencyCorrection', correction);
+    console.log(`Output latency correction: ${Math.round(correction * 1000)} ms`);
+    event.preventDefault();
+    sendPlayerStatus();
+}
+
 /* ----- Feedback to Back-End ----- */
 let statusUpdateTimeout = null;
 
@@ -459,31 +573,61 @@ function sendPlayerStatus() {
                 name: audioElement ? $('#current-song').text().trim(): "",
                 position: audioElement ? audioElement.currentTime: 0,
                 playing: audioElement ? !audioElement.paused: false,
-                time: Date.now()
+                time: clientTime(), // when position was read
+                clock_offset: clockOffset,
+                output_latency: outputLatency(),
+                client: CLIENT_ID
             })
         }).catch(err => console.error(err));
     }, 10);
 }
 
-function getCurrentData() {
-    fetch('/api/player/status')
-    .then(response => response.json())
-    .then(data => {
-        if (data.error) throw new Error(data.error);
-        if (data.name) {
-            playTrack(data.name, false);
-            if (!audioElement || (!audioElement.src && audioElement.paused)) return;
-
-            if (data.time) {
-                audioElement.currentTime = data.time;
-            } else {
-                audioElement.currentTime = 0;
-            }
-            updateProgressBar();
-        }
+/* ----- Events from the Back-End ----- */
+let followingSeek = false;
+
+// One stream for all pushed state, the browser reconnects by itself if it breaks
+function connectEvents() {
+    const events = new EventSource('/api/events');
+    events.addEventListener('status', event => followStatus(JSON.parse(event.data)));
+    events.addEventListener('features', event => showFeatures(JSON.parse(event.data)));
+    events.addEventListener('library', () => {
+        if (!$('#search-results').is(':visible')) return;
+        lastSearchQuery = null; // search again, songs were added or removed
+        handleSearchInput();
     });
 }
 
+// Shows the state of the player of another browser (or the state when connecting), as long as this one isn't playing
+function followStatus(status) {
+    if (status.client === CLIENT_ID || !status.name) return;
+    if (audioElement && !audioElement.paused) return;
+
+    if (status.live) {
+        $('#current-song').text(status.name);
+        return;
+    }
+    if (!audioElement || $('#current-song').text() !== status.name) {
+        playTrack(status.name, false);
+    }
+
+    let position = status.position;
+    if (status.playing && clockOffset !== null) {
+        position += clientTime() + clockOffset - status.timestamp;
+    }
+    followingSeek = true;
+    audioElement.currentTime = Math.max(position, 0);
+    updateProgressBar();
+}
+
+function showFeatures(features) {
+    $('.bi-music-note-beamed').toggleClass('beat', features.is_beat);
+
+    // Progress of the player of another browser
+    if (audioElement && audioElement.paused && audioElement.duration && !isDragging) {
+        showProgress(features.position, audioElement.duration);
+    }
+}
+
 /* Mobile Responsiveness */ 
 function enableTouchClickFallback(selector, handler) {
     let touchMoved = false;
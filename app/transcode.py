@@ -0,0 +1,120 @@
+"""
+Transcode Cache
+---
+
+Compressed copies of the songs for streaming to the player: a WAV file needs
+about 1411 kbps, Opus or AAC sound the same at a tenth of that, so playback
+starts and seeks much faster over Wi-Fi.
+
+Songs are transcoded with a local ffmpeg in a background thread the first time a
+format is requested (or right after they were added to the library with
+`prefetch`), until then the original file is streamed. Transcoded files are
+stored in their own folder, keyed by path, size and mtime of the source, and
+evicted least-recently-used once the folder grows above `max_bytes`.
+"""
+
+import os
+import shutil
+import hashlib
+import subprocess
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+# format -> (file extension, mimetype, ffmpeg codec arguments)
+FORMATS = {
+    "opus": (".opus", "audio/ogg", ["-c:a", "libopus", "-vbr", "on"]),
+    "aac": (".m4a", "audio/mp4", ["-c:a", "aac", "-movflags", "+faststart"]),
+}
+MIMETYPES = {".wav": "audio/wav", ".flac": "audio/flac", ".opus": "audio/ogg", ".ogg": "audio/ogg",
+             ".m4a": "audio/mp4", ".mp3": "audio/mpeg"}
+
+
+def mimetype_of(path: str) -> str:
+    return MIMETYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+
+
+class TranscodeCache:
+    def __init__(self, folder: str, max_bytes: int, bitrate: int = 128, ffmpeg: str = "ffmpeg", workers: int = 1):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.bitrate = bitrate
+        self.ffmpeg = shutil.which(ffmpeg)
+        os.makedirs(self.folder, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcode")
+        self._lock = Lock()
+        self._running: Dict[str, object] = {}
+
+    @property
+    def available(self) -> bool:
+        return self.ffmpeg is not None
+
+    def path(self, source: str, fmt: str) -> str:
+        """Where the transcoded copy of source is stored"""
+        stat = os.stat(source)
+        key = hashlib.sha1(f"{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}:{self.bitrate}".encode()).hexdigest()[:20]
+        return os.path.join(self.folder, key + FORMATS[fmt][0])
+
+    def get(self, source: str, fmt: str) -> Optional[str]:
+        """Path of the song in format fmt, None (and transcoding it in the background) if there is none yet"""
+        if fmt not in FORMATS:
+            return None
+        if source.lower().endswith(FORMATS[fmt][0]):
+            return source  # already stored in this format
+        if not self.available:
+            return None
+        target = self.path(source, fmt)
+        if os.path.exists(target):
+            os.utime(target)  # mark as recently used
+            return target
+        self.prefetch(source, fmt)
+        return None
+
+    def prefetch(self, source: str, fmt: str) -> None:
+        """Transcode source in the background unless it is already cached or running"""
+        if fmt not in FORMATS or not self.available or source.lower().endswith(FORMATS[fmt][0]):
+            return
+        target = self.path(source, fmt)
+        with self._lock:
+            if target in self._running or os.path.exists(target):
+                return
+            self._running[target] = self._executor.submit(self._transcode, source, fmt, target)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _transcode(self, source: str, fmt: str, target: str) -> None:
+        tmp = f"{target}.{os.getpid()}.tmp{FORMATS[fmt][0]}"
+        try:
+            subprocess.run(
+                [self.ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", source, "-vn",
+                 *FORMATS[fmt][2], "-b:a", f"{self.bitrate}k", "-threads", "1", tmp],
+                check=True, capture_output=True)
+            os.replace(tmp, target)
+            self.evict()
+        except (OSError, subprocess.CalledProcessError) as e:
+            stderr = getattr(e, "stderr", b"") or b""
+            print(f"Could not transcode {os.path.basename(source)} to {fmt}: {stderr.decode(errors='replace').strip() or e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        finally:
+            with self._lock:
+                self._running.pop(target, None)
+
+    def evict(self) -> None:
+        """Delete least recently used files until the cache fits into max_bytes"""
+        files = []
+        total = 0
+        for entry in os.scandir(self.folder):
+            if ".tmp" in entry.name or not entry.is_file():
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
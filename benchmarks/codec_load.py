@@ -0,0 +1,80 @@
+"""
+Library format benchmark
+---
+
+Disk footprint and load time of a song stored as WAV, FLAC and Opus: time to
+read/decode the audio and to analyze it (what a song switch without a cached
+analysis costs) and the peak memory (RSS) of doing so. The compressed files are
+made from the same synthetic track with ffmpeg. Every format runs in a fresh
+process so the peak RSS values don't influence each other.
+
+Note that the files are read from the page cache here, on an SD card the time
+to read a file grows with its size on top of this.
+
+Usage: python -m benchmarks.codec_load [--minutes 4]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from benchmarks.synth import write_test_wav
+
+FORMATS = {
+    "wav": [],
+    "flac": ["-c:a", "flac"],
+    "opus": ["-c:a", "libopus", "-b:a", "128k"],
+}
+
+
+def run_format(path: str) -> None:
+    """Runs in a child process, prints 'read_seconds analysis_seconds peak_rss_kb'"""
+    from tools.analysis import TrackAnalysis
+    from tools.analysis.decode import read_audio
+
+    start = time.perf_counter()
+    sample_rate, data = read_audio(path)
+    read = time.perf_counter() - start
+    TrackAnalysis.from_audio(data, sample_rate).analyze(1.0)
+    analysis = time.perf_counter() - start - read
+    print(read, analysis, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=4.0)
+    parser.add_argument("--run", metavar="PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        return run_format(args.run)
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        sys.exit("ffmpeg is needed for this benchmark")
+
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, "benchmark.wav")
+        write_test_wav(source, args.minutes * 60)
+        print(f"{args.minutes:g} min stereo track")
+
+        for fmt, codec in FORMATS.items():
+            path = source
+            if codec:
+                path = os.path.join(folder, f"benchmark.{fmt}")
+                subprocess.run([ffmpeg, "-nostdin", "-loglevel", "error", "-i", source, *codec, path], check=True)
+
+            output = subprocess.run([sys.executable, "-m", "benchmarks.codec_load", "--run", path],
+                                    capture_output=True, text=True, check=True).stdout.split()
+            read, analysis, peak_kb = float(output[-3]), float(output[-2]), int(output[-1])
+            size_mb = os.path.getsize(path) / 2**20
+            print(f"{fmt:>5}: {size_mb:6.1f} MB on disk, read {read:5.2f} s + analysis {analysis:5.2f} s, "
+                  f"peak RSS {peak_kb / 1024:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Filterbank benchmark
+---
+
+Time per frame of band energies: the per-frame spectrum and boolean band masks
+(`compute_magnitude_spectrum` and the subband loop as they were before the
+`SpectralPlan`) against a plan for one frame at a time and for a block of frames
+in one matrix multiply, for the subbands and log/mel/Bark bands of several sizes.
+
+Usage: python -m benchmarks.filterbank [--bands 16 64 150] [--frames 256]
+"""
+
+import time
+import argparse
+import numpy as np
+from tools.analysis import SUBBAND_RANGES, ANALYSIS_WINDOW, _a_weighting
+from tools.analysis.filterbank import SpectralPlan, BAND_SCALES
+from benchmarks.synth import test_signal, SAMPLE_RATE
+
+
+def per_call_us(function, min_seconds: float = 0.5) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_seconds:
+        function()
+        calls += 1
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def masked_energies(frame: np.ndarray) -> dict:
+    """Spectrum and subband energies of one frame, recomputing window, frequencies, weights and masks"""
+    N = len(frame)
+    magnitude = np.abs(np.fft.fft(frame * np.hanning(N))[:N//2])
+    freqs = np.fft.fftfreq(N, d=1/SAMPLE_RATE)[:N//2]
+    weighted = magnitude * _a_weighting(freqs)
+    return {band: np.sum(weighted[(freqs >= low) & (freqs < high)]**2) for band, (low, high) in SUBBAND_RANGES.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bands", type=int, nargs="+", default=[16, 64, 150])
+    parser.add_argument("--frames", type=int, default=256, help="frames per block")
+    args = parser.parse_args()
+
+    frame_size = int(ANALYSIS_WINDOW * SAMPLE_RATE)
+    hop = frame_size // 2
+    samples = test_signal(0, (args.frames - 1) * hop + frame_size).astype(np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame_size)[::hop]
+
+    print(f"{'bands':<16} {'per frame (us)':>15} {'block (us/frame)':>17}")
+    print(f"{'masks (before)':<16} {per_call_us(lambda: masked_energies(frames[0])):15.1f}")
+    for scale in BAND_SCALES:
+        for n_bands in ([None] if scale == "subband" else args.bands):
+            plan = SpectralPlan(frame_size, SAMPLE_RATE, scale, n_bands, normalize=scale != "subband")
+            single = per_call_us(lambda: plan.bands(frames[0]))
+            block = per_call_us(lambda: plan.bands(frames)) / len(frames)
+            print(f"{scale + ('' if n_bands is None else f' {n_bands}'):<16} {single:15.1f} {block:17.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Frame allocation check
+---
+
+Memory allocated per frame in steady state by every stage of the frame path:
+the feature lookup (`analyze` into the dict of the last frame), `map_into` of
+every mapper, the frame ring of the pipeline and the pygame output (with the
+dummy video driver). Each stage runs a few frames to warm up, then the peak of
+the memory traced while it renders more frames must stay below --limit KiB,
+otherwise the exit code is 1.
+
+The in-place rewrites of the mappers also have to draw what they drew before,
+so the frames are checked too (e.g. that the highlighted column of the
+scrolling mapper is brightened with saturation instead of wrapping around).
+
+Usage: python -m benchmarks.frame_allocations [--size 150x1] [--frames 300] [--limit 4]
+"""
+
+import os
+import sys
+import argparse
+import tracemalloc
+import numpy as np
+from benchmarks.synth import test_signal, SAMPLE_RATE
+from benchmarks.suite import mapper_classes
+
+WARMUP_FRAMES = 60  # e.g. until the buffers of a mapper exist and the scrolling canvas is full
+FPS = 30
+
+
+def peak_kb(render, frames: int) -> float:
+    """Peak memory allocated above the steady state while render(i) runs for frames frames"""
+    for i in range(WARMUP_FRAMES):
+        render(i)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for i in range(WARMUP_FRAMES, WARMUP_FRAMES + frames):
+        render(i)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (peak - baseline) / 1024
+
+
+def stages(track, width: int, height: int):
+    """(name, render(i)) of every stage of the frame path"""
+    features = {}
+    yield "analyze", lambda i: track.analyze(i / FPS, out=features)
+
+    for name, mapper_cls in mapper_classes().items():
+        mapper = mapper_cls(width, height)
+        out = np.zeros_like(mapper.output)
+        feature_list = [track.analyze(i / FPS) for i in range(WARMUP_FRAMES + 1000)]
+        yield f"map_into {name}", lambda i, mapper=mapper, out=out, feature_list=feature_list: \
+            mapper.map_into(feature_list[i % len(feature_list)], out)
+
+    from tools.visualization.pipeline import FrameRing
+    ring = FrameRing(8)
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    shown = np.zeros_like(frame)
+    yield "frame ring", lambda i: (ring.put(i / FPS, frame), ring.get(i / FPS, shown))
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from tools.visualization.pygame_visualizer import PygameOutput
+    output = PygameOutput(max(width, 100), max(height, 50))
+    yield "pygame show", lambda i: (output.handle_events(), output.show(frame))
+
+
+def check_frames(track) -> list:
+    """Names of the frame checks that fail"""
+    from tools.mapping import ScrollingMapper
+    failed = []
+
+    # Highlighted column of the scrolling mapper: canvas + 40 saturated at 255, yellow at both ends
+    mapper = ScrollingMapper(64, 32)
+    out = np.zeros_like(mapper.output)
+    x = mapper.width - 10
+    for i in range(WARMUP_FRAMES):
+        features = dict(track.analyze(i / FPS), is_beat=True)  # white (255) beat line in the column
+        mapper.map_into(features, out)
+        column = mapper.canvas[:, (mapper.head + x) % mapper.width].astype(int)
+        expected = np.minimum(column + 40, 255)
+        expected[[0, -1]] = [255, 255, 0]
+        if not np.array_equal(out[:, x], expected):
+            failed.append("scrolling highlight")
+            break
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="150x1", help="canvas size")
+    parser.add_argument("--frames", type=int, default=300, help="frames measured per stage")
+    parser.add_argument("--limit", type=float, default=4, help="KiB a stage may allocate at most")
+    args = parser.parse_args()
+
+    from tools.analysis import TrackAnalysis
+    width, height = (int(value) for value in args.size.split("x"))
+    samples = (np.clip(test_signal(0, 60 * SAMPLE_RATE), -1, 1) * 32000).astype(np.int16)
+    track = TrackAnalysis.from_audio(samples, SAMPLE_RATE)
+
+    failed = []
+    for name, render in stages(track, width, height):
+        try:
+            peak = peak_kb(render, args.frames)
+        except Exception as e:
+            print(f"{name:<34} failed: {type(e).__name__}: {e}")
+            failed.append(name)
+            continue
+        mark = "" if peak <= args.limit else "  <- allocates"
+        if mark:
+            failed.append(name)
+        print(f"{name:<34} {peak:8.2f} KiB peak{mark}")
+
+    print(f"\n{len(failed)} of the stages above {args.limit:g} KiB")
+    for name in check_frames(track):
+        print(f"{name} draws a wrong frame")
+        failed.append(name)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
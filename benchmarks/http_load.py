@@ -0,0 +1,101 @@
+"""
+HTTP load test
+---
+
+Requests per second and latencies of `/api/songs` (search as you type) and
+`/api/play` (the first 256 KiB of a song, like a browser starting playback) for
+a growing number of concurrent clients, each with its own keep-alive connection.
+Start the server first, e.g. the development server (`python run.py`) or the
+production setup (`python -m app.service` and gunicorn, see wsgi.py).
+
+Usage: python -m benchmarks.http_load [--url http://localhost:5050] [--clients 1 8 32] [--seconds 5]
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+import numpy as np
+from urllib.parse import quote, urlsplit
+
+QUERIES = ["a", "th", "the", "love", "remix", "feat", "live", "night", "on", "me"]
+PLAY_BYTES = 256 * 1024
+
+
+def run_client(url, path_of, deadline: float, latencies: list, errors: list) -> None:
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    rng = random.Random()
+    while time.perf_counter() < deadline:
+        path, headers = path_of(rng)
+        start = time.perf_counter()
+        try:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+
+
+def measure(url: str, path_of, clients: int, seconds: float):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=run_client, args=(url, path_of, deadline, latencies, errors)) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies) / (time.perf_counter() - start), np.array(latencies) * 1000, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5050")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--song", help="song for /api/play (default: the first one of the library)")
+    parser.add_argument("--format", default="wav", help="format for /api/play: wav, opus or aac")
+    args = parser.parse_args()
+
+    song = args.song
+    if song is None:
+        parts = urlsplit(args.url)
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        connection.request("GET", "/api/songs/?q=&limit=1")
+        songs = json.loads(connection.getresponse().read())
+        song = songs[0] if songs else None
+
+    endpoints = {"/api/songs": lambda rng: (f"/api/songs/?q={quote(rng.choice(QUERIES))}&limit=50&fuzzy=1", {})}
+    if song is None:
+        print("No song in the library, /api/play is skipped")
+    else:
+        play = f"/api/play/?song={quote(song)}&format={args.format}"
+        if args.format != "wav":  # redirected once per playback to the file that is streamed
+            parts = urlsplit(args.url)
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            connection.request("GET", play)
+            response = connection.getresponse()
+            response.read()
+            play = urlsplit(response.getheader("Location", play))._replace(scheme="", netloc="").geturl()
+        endpoints["/api/play"] = lambda rng: (play, {"Range": f"bytes=0-{PLAY_BYTES - 1}"})
+
+    print(f"{'endpoint':<12} {'clients':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, path_of in endpoints.items():
+        for clients in args.clients:
+            rate, latencies, errors = measure(args.url, path_of, clients, args.seconds)
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (np.nan,) * 3
+            print(f"{name:<12} {clients:>7} {rate:>9.1f} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f} {len(errors):>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Mapper benchmark
+---
+
+Frames per second of a mapper's `map` for LED strips of different lengths,
+fed with the features of a synthetic track.
+
+Usage: python -m benchmarks.mapper_fps [--mapper FlowingEffectsMapper] [--widths 150 600 2400]
+"""
+
+import time
+import argparse
+import tools.mapping
+from benchmarks.synth import test_features
+
+
+def frames_per_second(mapper, features, min_seconds: float = 1.0) -> float:
+    frames = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_seconds:
+        for analysis_data in features:
+            mapper.map(analysis_data)
+        frames += len(features)
+    return frames / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mapper", default="FlowingEffectsMapper")
+    parser.add_argument("--widths", type=int, nargs="+", default=[150, 600, 2400])
+    args = parser.parse_args()
+
+    mapper_cls = getattr(tools.mapping, args.mapper)
+    features = test_features(seconds=10)
+
+    print(args.mapper)
+    for width in args.widths:
+        fps = frames_per_second(mapper_cls(width, 1), features)
+        print(f"{width:>6} LEDs: {fps:9.1f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
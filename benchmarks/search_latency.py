@@ -0,0 +1,65 @@
+"""
+Search benchmark
+---
+
+Latency of the library search for a large synthetic library, typing a few queries
+letter by letter like the player does, with the index vs. the former linear scan.
+
+Usage: python -m benchmarks.search_latency [--songs 50000] [--limit 50]
+"""
+
+import time
+import random
+import argparse
+from app.search import SongIndex
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "ne", "to", "su", "vi", "del", "mar", "son", "tri", "ght", "ove", "ea", "in"]
+QUERIES = ["lomi", "mar", "del son", "xyz"]
+
+
+def test_titles(count: int, seed: int = 0):
+    """Titles of 2 to 6 words from a vocabulary of about 2000 words"""
+    rng = random.Random(seed)
+    words = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(2000)]
+    return [" ".join(rng.choice(words).capitalize() for _ in range(rng.randint(2, 6))) + f" {i}" for i in range(count)]
+
+
+def linear_search(titles, query):
+    query = query.strip().lower()
+    matching_songs = [f for f in titles if query in f.lower()]
+    return sorted(matching_songs, key=lambda f: (f.lower().find(query), f.lower()))
+
+
+def typing_latency(search, queries) -> float:
+    """Average seconds per keystroke"""
+    keystrokes = 0
+    start = time.perf_counter()
+    for query in queries:
+        for i in range(1, len(query) + 1):
+            search(query[:i])
+            keystrokes += 1
+    return (time.perf_counter() - start) / keystrokes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--songs", type=int, default=50000)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    titles = test_titles(args.songs)
+    start = time.perf_counter()
+    index = SongIndex(titles)
+    index.search("")  # builds the arrays
+    print(f"{args.songs} songs, index built in {time.perf_counter() - start:.2f} s")
+
+    linear = typing_latency(lambda q: linear_search(titles, q), QUERIES)
+    indexed = typing_latency(lambda q: index.search(q, args.limit), QUERIES)
+    fuzzy = typing_latency(lambda q: index.search(q, args.limit, fuzzy=True), QUERIES)
+    print(f"linear scan:  {linear * 1000:8.2f} ms/keystroke")
+    print(f"index:        {indexed * 1000:8.2f} ms/keystroke")
+    print(f"index, fuzzy: {fuzzy * 1000:8.2f} ms/keystroke")
+
+
+if __name__ == "__main__":
+    main()
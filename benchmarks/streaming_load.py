@@ -0,0 +1,50 @@
+"""
+Streaming analysis benchmark
+---
+
+Time the `StreamingAnalyzer` needs per block of live input for different block
+sizes (as a share of the real time the block lasts) and how the causally
+detected beats and tempo compare to the analysis of the whole track.
+
+Usage: python -m benchmarks.streaming_load [--seconds 60] [--blocks 256 1024 4096]
+"""
+
+import time
+import argparse
+import numpy as np
+from tools.analysis import TrackAnalysis
+from tools.analysis.streaming import StreamingAnalyzer
+from benchmarks.synth import test_signal, SAMPLE_RATE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--blocks", type=int, nargs="+", default=[256, 1024, 4096])
+    args = parser.parse_args()
+
+    samples = (np.clip(test_signal(0, int(args.seconds * SAMPLE_RATE)), -1, 1) * 32000).astype(np.int16)
+    track = TrackAnalysis.from_audio(samples, SAMPLE_RATE)
+
+    for block_size in args.blocks:
+        analyzer = StreamingAnalyzer(SAMPLE_RATE)
+        times = []
+        for first in range(0, len(samples), block_size):
+            start = time.perf_counter()
+            analyzer.feed(samples[first:first + block_size])
+            times.append(time.perf_counter() - start)
+
+        times = np.array(times) * 1000
+        block_ms = block_size / SAMPLE_RATE * 1000
+        print(f"{block_size:>5} samples ({block_ms:5.1f} ms): {np.mean(times):6.3f} ms avg, {np.max(times):6.3f} ms max, "
+              f"{np.mean(times) / block_ms:6.1%} of real time")
+
+    # Every recent beat of the stream against the nearest beat of the whole track
+    beats = analyzer.beats
+    delays = [beat - track.beats[np.argmin(np.abs(track.beats - beat))] for beat in beats]
+    print(f"bpm {analyzer.bpm:.1f} (whole track {track.bpm:.1f}), beat delay {np.mean(delays) * 1000:.1f} ms "
+          f"over the last {len(beats)} beats")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Benchmark suite
+---
+
+Measures analysis and rendering on synthetic test audio and writes the results
+into a JSON file, so runs can be compared between commits or devices:
+- analysis: for tones, noise and click tracks of several lengths, time to read
+  and analyze the WAV file, to store and load the analysis in the cache, per
+  `analyze_segment` call and the peak RSS, each in a fresh process
+- mappers: time per `map` call (average and 99th percentile) and the peak memory
+  allocated while mapping, for every mapper of `tools.mapping` and canvas size
+- visualizer: a headless visualizer (pipeline and output loop without a device)
+  playing the test track in real time with every mapper: render and output time
+  per frame, dropped frames, resyncs and frames that weren't ready in time
+
+Every metric is better when it is lower. With --baseline the results are
+compared to an earlier run, changes larger than --threshold are listed as
+regressions and the exit code is 1.
+
+Results are written to benchmarks/results/ (ignored by git) unless --output
+names another file.
+
+Usage: python -m benchmarks.suite [--quick] [--output results.json] [--baseline old.json] [--threshold 0.1]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import inspect
+import argparse
+import platform
+import resource
+import tempfile
+import datetime
+import subprocess
+import tracemalloc
+import numpy as np
+from benchmarks.synth import write_test_wav, test_signal, test_features, SAMPLE_RATE
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ANALYSIS_SIGNALS = ("tone", "noise", "clicks")
+SEGMENT_CALLS = 10000  # analyze_segment calls at random positions per file
+# Smallest change of a metric (by the unit its name ends with) that can be a regression, smaller ones are noise
+NOISE_FLOORS = (("_s", 0.01), ("_ms_avg", 0.05), ("_us_avg", 5), ("_us_p99", 20), ("_kb", 4), ("_mb", 5))
+
+
+# === ANALYSIS ================================================================
+def run_analysis(path: str) -> None:
+    """Runs in a child process, prints the metrics of one file as JSON"""
+    from tools.analysis import TrackAnalysis, set_track, analyze_segment
+    from tools.analysis.cache import AnalysisCache
+    from tools.analysis.decode import read_audio
+
+    metrics = {}
+    start = time.perf_counter()
+    sample_rate, data = read_audio(path)
+    metrics["read_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    track = TrackAnalysis.from_audio(data, sample_rate)
+    metrics["analyze_s"] = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as folder:
+        cache = AnalysisCache(folder, 1 << 30)
+        start = time.perf_counter()
+        cache.store(path, track.timeline)
+        metrics["cache_store_s"] = time.perf_counter() - start
+        start = time.perf_counter()
+        cache.load(path)
+        metrics["cache_load_s"] = time.perf_counter() - start
+
+    set_track(track)
+    rng = random.Random(0)
+    positions = [rng.uniform(0, track.timeline.duration) for _ in range(SEGMENT_CALLS)]
+    times = np.empty(len(positions))
+    for i, position in enumerate(positions):
+        start = time.perf_counter()
+        analyze_segment(position)
+        times[i] = time.perf_counter() - start
+    metrics["segment_us_avg"] = float(np.mean(times) * 1e6)
+    metrics["segment_us_p99"] = float(np.percentile(times, 99) * 1e6)
+
+    metrics["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(metrics))
+
+
+def bench_analysis(minutes, signals) -> dict:
+    metrics = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for kind in signals:
+            for length in minutes:
+                path = os.path.join(folder, f"{kind}-{length:g}min.wav")
+                write_test_wav(path, length * 60, kind=kind)
+                output = subprocess.run([sys.executable, "-m", "benchmarks.suite", "--run-analysis", path],
+                                        capture_output=True, text=True, check=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                os.remove(path)
+                print(f"analysis {kind:>6} {length:>4g} min: analyze {result['analyze_s']:6.2f} s, "
+                      f"cache load {result['cache_load_s'] * 1000:6.1f} ms, segment {result['segment_us_avg']:6.1f} us, "
+                      f"peak RSS {result['peak_rss_mb']:6.1f} MB")
+                metrics.update({f"analysis/{kind}/{length:g}min/{key}": value for key, value in result.items()})
+    return metrics
+
+
+# === MAPPERS =================================================================
+def mapper_classes() -> dict:
+    import tools.mapping
+    return {name: cls for name, cls in vars(tools.mapping).items()
+            if inspect.isclass(cls) and issubclass(cls, tools.mapping.BaseMapper)}
+
+
+def bench_mappers(sizes, features) -> dict:
+    metrics = {}
+    for name, mapper_cls in mapper_classes().items():
+        for width, height in sizes:
+            try:
+                mapper = mapper_cls(width, height)
+                times = np.empty(len(features))
+                for i, analysis_data in enumerate(features):
+                    start = time.perf_counter()
+                    mapper.map(analysis_data)
+                    times[i] = time.perf_counter() - start
+
+                mapper = mapper_cls(width, height)
+                tracemalloc.start()
+                for analysis_data in features:
+                    mapper.map(analysis_data)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            except Exception as e:
+                tracemalloc.stop()
+                print(f"mapper {name} {width}x{height} failed: {type(e).__name__}: {e}")
+                continue
+
+            key = f"mapper/{name}/{width}x{height}"
+            metrics[f"{key}/map_us_avg"] = float(np.mean(times) * 1e6)
+            metrics[f"{key}/map_us_p99"] = float(np.percentile(times, 99) * 1e6)
+            metrics[f"{key}/alloc_peak_kb"] = peak / 1024
+            print(f"mapper {name:>22} {width:>4}x{height:<4}: {metrics[f'{key}/map_us_avg']:8.1f} us avg, "
+                  f"{metrics[f'{key}/map_us_p99']:8.1f} us p99, {peak / 1024:8.1f} KiB allocated at most")
+    return metrics
+
+
+# === VISUALIZER ==============================================================
+def headless_visualizer(width: int, height: int, mapper_cls):
+    from tools.visualization import BaseVisualizer
+
+    class HeadlessVisualizer(BaseVisualizer):
+        """Analysis, mapping and the output loop of a visualizer, without a device"""
+
+        def __init__(self):
+            super().__init__()
+            self.width, self.height = width, height
+            self.mapper = mapper_cls(width, height)
+            self.render_times = []
+            self.shown = 0
+            self.missing = 0  # playing, but the frame wasn't rendered in time
+
+        def render(self, track, timestamp):
+            start = time.perf_counter()
+            frame = super().render(track, timestamp)
+            self.render_times.append(time.perf_counter() - start)
+            return frame
+
+        def show(self, frame):
+            if frame is not None:
+                self.shown += 1
+            elif self.output_position() is not None:
+                self.missing += 1
+
+    return HeadlessVisualizer()
+
+
+def bench_visualizer(size, seconds: float, track) -> dict:
+    metrics = {}
+    width, height = size
+    for name, mapper_cls in mapper_classes().items():
+        vis = headless_visualizer(width, height, mapper_cls)
+        vis.song_name = "benchmark"
+        vis.track = track
+        vis.song_pos = 0.0
+        vis.song_timestamp = vis.server_time()
+        vis.song_playing = True
+        vis.start()
+        time.sleep(seconds)
+        vis.stop()
+
+        stats = vis.scheduler.stats()
+        key = f"visualizer/{name}/{width}x{height}"
+        render_times = np.array(vis.render_times or [np.nan])
+        metrics[f"{key}/render_us_avg"] = float(np.mean(render_times) * 1e6)
+        metrics[f"{key}/render_us_p99"] = float(np.percentile(render_times, 99) * 1e6)
+        metrics[f"{key}/output_ms_avg"] = stats["work_ms_avg"]
+        metrics[f"{key}/dropped"] = stats["dropped"]
+        metrics[f"{key}/resyncs"] = vis.pipeline.resyncs
+        metrics[f"{key}/missing"] = vis.missing
+        print(f"visualizer {name:>22}: render {metrics[f'{key}/render_us_avg']:8.1f} us avg, {stats['fps']:5.1f} fps, "
+              f"{stats['dropped']} dropped, {vis.pipeline.resyncs} resyncs, {vis.missing} missing of {vis.shown + vis.missing}")
+    return metrics
+
+
+# === RESULTS =================================================================
+def meta(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "args": {key: value for key, value in vars(args).items() if key not in ("baseline", "output", "run_analysis")},
+    }
+
+
+def noise_floor(key: str) -> float:
+    return next((floor for suffix, floor in NOISE_FLOORS if key.endswith(suffix)), 1)  # counts: more than one
+
+
+def compare(metrics: dict, baseline: dict, threshold: float) -> list:
+    """Prints the changes against a baseline, returns the metrics that got worse by more than threshold"""
+    regressions = []
+    print(f"\n{'metric':<60} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key in sorted(set(metrics) | set(baseline)):
+        old, new = baseline.get(key), metrics.get(key)
+        if old is None or new is None:
+            print(f"{key:<60} {'-' if old is None else f'{old:12.4g}':>12} {'-' if new is None else f'{new:12.4g}':>12}")
+            continue
+        change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+        mark = ""
+        if change > threshold and new - old > noise_floor(key):
+            regressions.append(key)
+            mark = "  <- regression"
+        print(f"{key:<60} {old:12.4g} {new:12.4g} {change:+8.1%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 5, 20], help="lengths of the analyzed test files")
+    parser.add_argument("--sizes", nargs="+", default=["150x1", "600x1", "64x32"], help="canvas sizes of the mappers")
+    parser.add_argument("--play-seconds", type=float, default=5, help="real time the headless visualizer plays per mapper")
+    parser.add_argument("--quick", action="store_true", help="1 minute files, one canvas size, 2 seconds per visualizer")
+    parser.add_argument("--output", default=os.path.join(RESULTS_FOLDER, "benchmark_results.json"))
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change that counts as a regression")
+    parser.add_argument("--run-analysis", metavar="PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_analysis:
+        return run_analysis(args.run_analysis)
+    if args.quick:
+        args.minutes, args.sizes, args.play_seconds = [1], args.sizes[:1], 2
+
+    sizes = [tuple(int(value) for value in size.split("x")) for size in args.sizes]
+    from tools.analysis import TrackAnalysis
+    samples = (np.clip(test_signal(0, 60 * SAMPLE_RATE), -1, 1) * 32000).astype(np.int16)
+    track = TrackAnalysis.from_audio(samples, SAMPLE_RATE)
+
+    metrics = {}
+    metrics.update(bench_analysis(args.minutes, ANALYSIS_SIGNALS))
+    metrics.update(bench_mappers(sizes, test_features(seconds=10)))
+    metrics.update(bench_visualizer(sizes[0], args.play_seconds, track))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"meta": meta(args), "metrics": metrics}, f, indent=1, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["metrics"]
+        regressions = compare(metrics, baseline, args.threshold)
+        print(f"\n{len(regressions)} regressions larger than {args.threshold:.0%}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
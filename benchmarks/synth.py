@@ -0,0 +1,48 @@
+"""Synthetic test audio for the benchmarks, so no music library is needed"""
+
+import wave
+import numpy as np
+
+SAMPLE_RATE = 44100
+SIGNALS = ("mix", "tone", "noise", "clicks")
+
+
+def test_signal(start: int, stop: int, sample_rate: int = SAMPLE_RATE, seed: int = 0, kind: str = "mix") -> np.ndarray:
+    """
+    Mono float samples [start, stop) of a kind of SIGNALS: a pulsing tone, noise,
+    a click track at 120 bpm or all three mixed
+    """
+    if kind not in SIGNALS:
+        raise ValueError(f"Unknown signal {kind}, expected one of {', '.join(SIGNALS)}")
+    rng = np.random.default_rng(seed + start)
+    t = np.arange(start, stop) / sample_rate
+    mono = np.zeros(len(t))
+    if kind in ("mix", "tone"):
+        mono += 0.3 * np.sin(2 * np.pi * 220 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 0.25 * t))
+    if kind in ("mix", "noise"):
+        mono += (0.05 if kind == "mix" else 0.3) * rng.standard_normal(len(t))
+    if kind in ("mix", "clicks"):
+        mono += 0.5 * (t % 0.5 < 0.01)
+    return mono
+
+
+def write_test_wav(path: str, seconds: float, channels: int = 2, block_seconds: int = 10, kind: str = "mix") -> None:
+    """int16 WAV of test_signal, written block by block so long files don't need much memory"""
+    total = int(seconds * SAMPLE_RATE)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        for start in range(0, total, block_seconds * SAMPLE_RATE):
+            mono = test_signal(start, min(start + block_seconds * SAMPLE_RATE, total), kind=kind)
+            samples = np.stack([mono * (1 - 0.2 * c) for c in range(channels)], axis=1)
+            f.writeframes((np.clip(samples, -1, 1) * 32000).astype("<i2").tobytes())
+
+
+def test_features(seconds: float = 30, fps: int = 30):
+    """Feature dicts of a synthetic track sampled at fps, as the mappers get them"""
+    from tools.analysis import TrackAnalysis
+
+    samples = (np.clip(test_signal(0, int(seconds * SAMPLE_RATE)), -1, 1) * 32000).astype(np.int16)
+    track = TrackAnalysis.from_audio(samples, SAMPLE_RATE)
+    return [track.analyze(i / fps) for i in range(int(seconds * fps))]
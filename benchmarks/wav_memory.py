@@ -0,0 +1,59 @@
+"""
+WAV loading benchmark
+---
+
+Compares peak memory (RSS) and time of analyzing a long stereo WAV file when it
+is read as a whole (`wav.read(path)`) and when it is memory-mapped
+(`wav.read(path, mmap=True)`, the default of `analyze_file`).
+Every mode runs in a fresh process so the peak RSS values don't influence each other.
+
+Usage: python -m benchmarks.wav_memory [--minutes 10]
+"""
+
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+from benchmarks.synth import write_test_wav
+
+
+def run_mode(mode: str, path: str) -> None:
+    """Runs in a child process, prints 'seconds peak_rss_kb'"""
+    import scipy.io.wavfile as wav
+    from tools.analysis import set_audio, analyze_segment
+
+    start = time.perf_counter()
+    sample_rate, data = wav.read(path, mmap=(mode == "mmap"))
+    set_audio(data, sample_rate)
+    analyze_segment(1.0)
+    seconds = time.perf_counter() - start
+    print(seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=10.0)
+    parser.add_argument("--run", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        return run_mode(*args.run)
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "benchmark.wav")
+        write_test_wav(path, args.minutes * 60)
+        size_mb = os.path.getsize(path) / 2**20
+        print(f"{args.minutes:g} min stereo WAV, {size_mb:.0f} MB")
+
+        for mode in ("read", "mmap"):
+            output = subprocess.run([sys.executable, "-m", "benchmarks.wav_memory", "--run", mode, path],
+                                    capture_output=True, text=True, check=True).stdout.split()
+            seconds, peak_kb = float(output[-2]), int(output[-1])
+            print(f"{mode:>5}: {seconds:6.2f} s, peak RSS {peak_kb / 1024:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
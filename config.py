@@ -9,19 +9,53 @@ class Config:
     VISUALIZER_CLASS = PygameVisualizer
     WIDTH = 150
     HEIGHT = 1
+    SEGMENTS = None # regions of the canvas drawn by mappers of their own with MAPPER_CLASS = SegmentMapper: [{'region': (x, y, width, height), 'mapper': ...}]
+    SPECTRUM_SCALE = 'log' # bands of the SpectrumMapper, one per column: 'log', 'mel' or 'bark' (see tools/analysis/filterbank.py)
+    LED_OUTPUTS = None # LED strips and matrices showing the canvas, see tools/visualization/layout.py, None: one strip on D18 along the first row
+    TARGET_FPS = 30 # frame rate of every visualizer loop
+    VISUALIZER_LOOKAHEAD = 0.2 # seconds frames are analyzed and mapped ahead of playback
+    VISUALIZER_LATENCY = 0.0 # seconds from showing a frame until it is visible on the output device
+    LIVE_INPUT = None # visualize live audio instead of the player: 'device' (or 'device:<name>') for a sound card, '-' for a WAV stream on stdin or an audio file replayed in real time
+    LIVE_SAMPLE_RATE = 44100 # of the sound card
+    LIVE_BLOCK_SIZE = 1024 # samples read from the live input at once
+    FRAME_BUS = 'jamplay-frames' # shared memory the BusVisualizer publishes its frames on for output processes (python -m tools.visualization.outputs)
+    FRAME_BUS_CAPACITY = 8 # frames kept on the bus, outputs further behind skip frames
+    FEATURE_EVENT_RATE = 10 # analysis features pushed to the players per second (/api/events), 0 disables them
+
+    # SERVER OPTIONS #
+    SERVICE_SOCKET = '/tmp/jamplay-service.sock' # Unix socket of the visualizer service for the workers of wsgi.py
+    SERVICE_KEY_FILE = os.path.join(os.path.abspath(os.path.dirname(__file__)), '.service-key') # random key that authenticates the workers at the service, created readable only by its owner
+    METRICS_ENABLED = True # time per stage, frame rate, sync error and cache hits at /api/metrics (Prometheus), False records nothing
 
     # DOWNLOAD OPTIONS #
     MUSIC_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'music')
-    ALLOWED_EXTENSION = '.wav'
-    SECRET_KEY = 'jampla-sctkey'
+    ALLOWED_EXTENSION = '.opus' # format of downloaded songs, opus keeps YouTube's audio without converting it
+    AUDIO_EXTENSIONS = ['.wav', '.flac', '.opus', '.ogg', '.m4a', '.mp3'] # formats of the library, earlier ones win for equal titles
+    SECRET_KEY = 'jampla-sctkey' 
     YTDL_OPTIONS = {
         'format': 'bestaudio/best',
         'postprocessors': [{
             'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'wav',
+            'preferredcodec': ALLOWED_EXTENSION[1:],
             'preferredquality': '192',
         }],
-        'outtmpl': 'music/___temp.%(ext)s',
+        'outtmpl': 'music/___temp.%(ext)s', # replaced by a temporary file per download
         'cookies': 'cookies.txt'
     }
+    DOWNLOAD_WORKERS = 2 # downloads running at the same time
+    CATALOG_PATH = os.path.join(MUSIC_FOLDER, '.catalog.sqlite3')
+    CATALOG_POLL_INTERVAL = 2.0 # seconds between checks of the music folder for changes
     FORBIDDEN_CHARS_IN_NAME = ["~", "“", "#", "%", "&", "*" ,":", "<", ">" ,"?", "/", "\\", "{", "|", "}"]
+
+    # STREAMING OPTIONS #
+    STREAM_MAX_AGE = 3600 # seconds browsers may use a cached song before revalidating it
+    TRANSCODE_FOLDER = os.path.join(MUSIC_FOLDER, '.transcode_cache') # None disables transcoding (also needs ffmpeg)
+    TRANSCODE_MAX_MB = 4096
+    TRANSCODE_BITRATE = 128 # kbps
+    TRANSCODE_PREFETCH = None # 'opus' or 'aac' transcodes every new song right away instead of on first play
+
+    # ANALYSIS OPTIONS #
+    ANALYSIS_CACHE_FOLDER = os.path.join(MUSIC_FOLDER, '.analysis_cache') # None disables the cache
+    ANALYSIS_CACHE_MAX_MB = 2048
+    RENDER_FOLDER = os.path.join(MUSIC_FOLDER, '.frames') # frame files of the offline renderer (python -m tools.visualization.offline), played instead of analyzing and mapping
+    ANALYSIS_WORKERS = max(1, (os.cpu_count() or 2) // 2) # processes for background analysis
@@ -1,6 +1,8 @@
 from app import create_app
 
-app = create_app()
-
+# Development server, see wsgi.py for production.
+# The app is only created in the main process: the analysis worker processes
+# import this module as well when they are spawned.
 if __name__ == '__main__':
+    app = create_app()
     app.run(host='0.0.0.0', port=5050, debug=True, use_reloader=False)
\ No newline at end of file
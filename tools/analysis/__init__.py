@@ -1,4 +1,6 @@
+import mmap
 import numpy as np
+from functools import lru_cache
 from typing import Dict, Tuple, Optional
 
 # === CONSTANTS =================================================================
@@ -17,6 +19,7 @@ DEFAULT_FEATURES = {
     "zero_crossing_rate": 0.0,
     "is_silent": True,
     "is_beat": False,
+    "beat_phase": 0.0,
     "bpm": 0.0,
     "spectral_centroid": 0.0,
     "normalized_magnitudes": np.array([]),
@@ -26,53 +29,93 @@ DEFAULT_FEATURES = {
 }
 
 ANALYSIS_WINDOW = 0.1  # Seconds for analysis frames
+TIMELINE_HOP = 0.05  # Seconds between two precomputed timeline frames
+TIMELINE_BLOCK = 256  # Frames per vectorized STFT block (bounds memory use)
 BEAT_MIN_INTERVAL = 0.3  # Minimum time between beats (200 BPM max)
+ONSET_FRAME, ONSET_HOP = 1024, 512  # Samples per onset strength frame / between two frames
+ONSET_MAX_FREQ = 500  # Hz, beats are mostly carried by kick drum and bass
+ONSET_THRESHOLD_WINDOW = 1.0  # Seconds around a frame for the adaptive beat threshold
+ONSET_THRESHOLD_STDS = 1.5  # Standard deviations above the local mean needed for a beat
+TEMPO_MIN_BPM = 50
+TEMPO_PRIOR_BPM = 120  # Most likely tempo, halves/doubles of it are weighted down
+TIMELINE_COLUMNS = ("rms", "zero_crossing_rate", "spectral_centroid", "spectral_flux", *SUBBAND_RANGES)
 SILENCE_THRESHOLD = 0.005  # RMS threshold for silence detection
 EPSILON = 1e-9  # Small value to prevent division by zero
 
 # === GLOBAL STATE =============================================================
-_audio_buffer: Optional[np.ndarray] = None
-_sample_rate: int = None
-_audio_length: float = 0.0
-_audio_props: Dict = {
-    "beats": [],
-    "bpm": None,
-    "subband_stats": {"means": {}, "stds": {}},
-}
-_global_calculated = False
+# The current track of the module level API. It is only ever replaced as a whole,
+# never modified, so readers in other threads always see a complete analysis.
+_current: Optional["TrackAnalysis"] = None
 
 # === CORE AUDIO HANDLING ======================================================
-def set_audio(data: np.ndarray, sample_rate: int) -> None:
-    """Initialize audio analysis system with normalized audio data"""
-    global _audio_buffer, _sample_rate, _audio_length, _global_calculated
-
-    _sample_rate = sample_rate
-    _audio_length = len(data) / sample_rate
-    _global_calculated = False
-    
-    # Convert stereo to mono if needed
-    if len(data.shape) == 2:
-        data = data.mean(axis=1).astype(data.dtype)
-    
-    _audio_buffer = _normalize_audio(data)
-    
-    _analyze_full_audio()
-
-def get_segment_at_time(timestamp: float, duration: float) -> np.ndarray:
-    """Extract audio segment with zero-padding if out of bounds"""
-    if _audio_buffer is None:
-        return np.zeros(int(duration * _sample_rate))
-    
-    start = int(timestamp * _sample_rate)
-    end = start + int(duration * _sample_rate)
-    segment = np.zeros(int(duration * _sample_rate))
-    
-    if 0 <= start < len(_audio_buffer):
-        available = _audio_buffer[start:min(end, len(_audio_buffer))]
-        segment[:len(available)] = available
-    
+def set_audio(data: np.ndarray, sample_rate: int) -> "TrackAnalysis":
+    """
+    Analyze raw audio data and make it the current track.
+    data is never copied as a whole (it can be memory-mapped, see wav.read(mmap=True)),
+    mono mixing and normalization happen block by block while analyzing.
+    """
+    return set_track(TrackAnalysis.from_audio(data, sample_rate))
+
+def set_track(track: Optional["TrackAnalysis"]) -> Optional["TrackAnalysis"]:
+    """Make an analyzed (e.g. cached or built in another thread) track the current track"""
+    global _current
+    _current = track
+    return track
+
+def get_track() -> Optional["TrackAnalysis"]:
+    """The current track (None while no audio is set)"""
+    return _current
+
+def get_segment_at_time(timestamp: float, duration: float, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Extract audio segment of the current track with zero-padding if out of bounds.
+    out is an optional float32 buffer of int(duration * sample_rate) samples to write the segment into.
+    """
+    track = _current
+    if track is None:
+        return np.zeros(0, dtype=np.float32)
+    return track.segment_at(timestamp, duration, out)
+
+def _read_mono(buffer: np.ndarray, start: int, end: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Normalized mono samples [start, end) of raw audio data, zero-padded if out of bounds (into out if given)"""
+    segment = np.empty(end - start, dtype=np.float32) if out is None else out
+    lo, hi = max(start, 0), min(end, len(buffer))
+    if lo < hi:
+        segment[:lo - start] = 0
+        segment[hi - start:] = 0
+        _normalize_into(buffer[lo:hi], segment[lo - start:hi - start])
+    else:
+        segment.fill(0)
     return segment
 
+def _release_pages(buffer: np.ndarray, end: int) -> None:
+    """
+    Drop the pages of a memory-mapped buffer before sample end from memory again,
+    so streaming through a mapped file keeps only the current block resident.
+    """
+    mapped = getattr(buffer, "_mmap", None)
+    if mapped is None or not hasattr(mapped, "madvise"):
+        return
+    # numpy maps the file from the allocation boundary before the data offset
+    length = buffer.offset % mmap.ALLOCATIONGRANULARITY + end * buffer.strides[0]
+    length -= length % mmap.PAGESIZE
+    if length > 0:
+        mapped.madvise(mmap.MADV_DONTNEED, 0, length)
+
+def _normalize_into(audio: np.ndarray, out: np.ndarray) -> None:
+    """Normalized (like _normalize_audio) and mono mixed samples written into the float32 array out"""
+    if audio.ndim == 2:  # Convert stereo to mono if needed
+        np.mean(audio, axis=1, dtype=np.float32, out=out)
+    else:
+        out[:] = audio
+    if audio.dtype == np.int16:
+        out /= 32768.0
+    elif audio.dtype == np.int32:
+        out /= 2147483648.0
+    elif audio.dtype == np.uint8:
+        out -= 128
+        out /= 128.0
+
 def _normalize_audio(audio: np.ndarray) -> np.ndarray:
     """Normalize different integer formats to [-1.0, 1.0] floats"""
     if audio.dtype == np.int16:
@@ -96,47 +139,28 @@ def _a_weighting(frequencies: np.ndarray) -> np.ndarray:
 
 def _compute_subband_energies(freqs: np.ndarray, magnitudes: np.ndarray) -> Dict[str, float]:
     """Calculate energy in each frequency band with A-weighting applied"""
-    weights = _a_weighting(freqs)
-    weighted = magnitudes * weights
-    
-    energies = {}
-    for band, (low, high) in SUBBAND_RANGES.items():
-        mask = (freqs >= low) & (freqs < high)
-        energies[band] = np.sum(weighted[mask]**2)
-    
-    return energies
-
-def _calculate_global_subband_stats() -> None:
-    """Pre-calculate subband statistics for the entire track"""
-    frame_size = int(ANALYSIS_WINDOW * _sample_rate)
-    energies = {band: [] for band in SUBBAND_RANGES}
-    
-    for i in range(0, len(_audio_buffer) - frame_size, frame_size):
-        frame = _audio_buffer[i:i+frame_size]
-        freqs, mag = compute_magnitude_spectrum(frame)
-        band_energy = _compute_subband_energies(freqs, mag)
-        
-        for band, energy in band_energy.items():
-            energies[band].append(energy)
-    
-    for band in SUBBAND_RANGES:
-        arr = np.array(energies[band])
-        _audio_props["subband_stats"]["means"][band] = np.mean(arr)
-        _audio_props["subband_stats"]["stds"][band] = np.std(arr) + EPSILON
+    weights, bank = _subband_filters(np.asarray(freqs, dtype=np.float64).tobytes())
+    energies = bank @ (np.square(magnitudes) * weights)
+    return dict(zip(SUBBAND_RANGES, energies.tolist()))
+
+@lru_cache(maxsize=16)
+def _subband_filters(freqs: bytes):
+    """Squared A-weights and (bands, bins) subband filterbank of the bin frequencies (as bytes, to be cached)"""
+    from tools.analysis.filterbank import filterbank
+    freqs = np.frombuffer(freqs, dtype=np.float64)
+    return _a_weighting(freqs) ** 2, filterbank(freqs).T.tocsr()
 
 # === FEATURE CALCULATIONS =====================================================
-def compute_magnitude_spectrum(audio: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-    """Compute frequency bins and magnitude spectrum for audio segment"""
+def compute_magnitude_spectrum(audio: np.ndarray, sample_rate: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute frequency bins and magnitude spectrum for audio segment (of the current track by default)"""
+    if sample_rate is None:
+        sample_rate = _current.sample_rate if _current else 1
     N = len(audio)
     if N == 0:
         return np.array([]), np.array([])
-    
-    windowed = audio * np.hanning(N)
-    spectrum = np.fft.fft(windowed)
-    magnitude = np.abs(spectrum[:N//2])
-    freqs = np.fft.fftfreq(N, d=1/_sample_rate)[:N//2]
-    
-    return freqs, magnitude
+
+    plan = _spectral_plan(N, sample_rate)
+    return plan.freqs, plan.magnitudes(audio)
 
 def compute_spectral_centroid(freqs: np.ndarray, magnitudes: np.ndarray) -> float:
     """Calculate spectral centroid from frequency spectrum"""
@@ -151,87 +175,333 @@ def compute_spectral_flux(current_mag: np.ndarray, previous_mag: np.ndarray) ->
     return np.sum(diff**2)
 
 # === TEMPO ANALYSIS ===========================================================
-def _detect_beats() -> None:
-    """Simple beat detection using energy thresholding"""
-    frame_size = 1024
-    hop_size = 512
-    energies = []
-    timestamps = []
-    
-    for i in range(0, len(_audio_buffer) - frame_size, hop_size):
-        frame = _audio_buffer[i:i+frame_size]
-        energies.append(compute_energy(frame))
-        timestamps.append(i / _sample_rate)
-    
-    energies = np.array(energies)
-    threshold = np.mean(energies) + 1.5 * np.std(energies)
-    
-    _audio_props["beats"] = [t for t, e in zip(timestamps, energies) if e > threshold]
-    
-    # Filter beats with minimum interval
-    filtered = []
-    for beat in _audio_props["beats"]:
-        if not filtered or (beat - filtered[-1]) >= BEAT_MIN_INTERVAL:
-            filtered.append(beat)
-    
-    # Calculate BPM from median interval
-    if len(filtered) > 1:
-        intervals = np.diff(filtered)
-        _audio_props["bpm"] = 60 / np.median(intervals)
-    else:
-        _audio_props["bpm"] = 0.0
+def _onset_strength(buffer: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Spectral flux of log-compressed low frequency magnitudes, one value every ONSET_HOP samples"""
+    n_frames = max(0, (len(buffer) - ONSET_FRAME) // ONSET_HOP + 1)
+    n_bins = max(2, int(ONSET_MAX_FREQ * ONSET_FRAME / sample_rate) + 1)
+    window = np.hanning(ONSET_FRAME).astype(np.float32)
+    onset = np.zeros(n_frames, dtype=np.float32)
+    previous = None
 
-# === MAIN ANALYSIS ENTRY POINTS ===============================================
-def _analyze_full_audio() -> None:
-    global _global_calculated
-    """Full audio preprocessing pipeline"""
-    _audio_props.update({"beats": [], "bpm": None, "subband_stats": {"means": {}, "stds": {}},})
-    _detect_beats()
-    _calculate_global_subband_stats()
-    _global_calculated = True
+    for first, frames in _frame_blocks(buffer, ONSET_FRAME, ONSET_HOP, n_frames, frames_per_block=1024):
+        onset[first:first + len(frames)], previous = _onset_frames(frames, window, n_bins, previous)
+
+    return onset
+
+def _onset_frames(frames: np.ndarray, window: np.ndarray, n_bins: int,
+                  previous: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Onset strength of consecutive frames and the magnitudes of the last one (previous of the next call)"""
+    mag = np.log1p(100 * np.abs(np.fft.rfft(frames * window, axis=1)[:, :n_bins]))
+    diff = np.diff(mag, axis=0, prepend=mag[:1] if previous is None else previous)
+    return np.mean(np.maximum(diff, 0), axis=1), mag[-1:]
+
+def _estimate_tempo(onset: np.ndarray, frame_rate: float) -> float:
+    """Tempo in BPM from the strongest periodicity of the onset strength (autocorrelation)"""
+    min_lag = int(frame_rate * BEAT_MIN_INTERVAL)
+    max_lag = int(np.ceil(frame_rate * 60 / TEMPO_MIN_BPM))
+    if len(onset) <= max_lag + 1:
+        return 0.0
+
+    x = onset - np.mean(onset)
+    n_fft = 1 << int(np.ceil(np.log2(2 * len(x))))
+    autocorr = np.fft.irfft(np.abs(np.fft.rfft(x, n_fft))**2, n_fft)[:max_lag + 2]
+    if autocorr[0] <= 0:
+        return 0.0
+
+    # Weight the candidates with a log-normal prior around TEMPO_PRIOR_BPM (like a tempogram)
+    lags = np.arange(min_lag, max_lag + 1)
+    prior = np.exp(-0.5 * np.log2(60 * frame_rate / lags / TEMPO_PRIOR_BPM)**2)
+    k = min_lag + int(np.argmax(autocorr[min_lag:max_lag + 1] * prior))
+
+    # Parabolic interpolation for a lag between two frames
+    left, center, right = autocorr[k - 1:k + 2]
+    curvature = left - 2 * center + right
+    lag = k + (0.5 * (left - right) / curvature if curvature < 0 else 0.0)
+    return 60 * frame_rate / lag
+
+def _moving_average(x: np.ndarray, size: int) -> np.ndarray:
+    size = min(size, len(x))  # "same" returns the length of the longer input, the window on short tracks
+    return np.convolve(x, np.full(size, 1 / size, dtype=x.dtype), mode="same")
+
+def _pick_peaks(x: np.ndarray, threshold: np.ndarray, distance: int) -> np.ndarray:
+    """Indices of values above threshold that are the maximum within +-distance"""
+    padded = np.pad(x, distance, mode="constant", constant_values=-np.inf)
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * distance + 1).max(axis=1)
+    peaks = np.flatnonzero((x >= local_max) & (x > threshold))
+    return peaks[np.diff(peaks, prepend=-distance - 1) > distance]  # plateaus count once
+
+def _detect_beats(buffer: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, float]:
+    """
+    Beat detection by peak picking on the onset strength with a local adaptive threshold.
+    Returns the sorted beat timestamps and the tempo in BPM.
+    """
+    onset = _onset_strength(buffer, sample_rate)
+    frame_rate = sample_rate / ONSET_HOP
+    if len(onset) == 0:
+        return np.zeros(0), 0.0
+
+    size = max(1, int(ONSET_THRESHOLD_WINDOW * frame_rate))
+    local_mean = _moving_average(onset, size)
+    local_std = np.sqrt(np.maximum(_moving_average(onset**2, size) - local_mean**2, 0))
+    threshold = np.maximum(local_mean + ONSET_THRESHOLD_STDS * local_std, EPSILON)
+
+    peaks = _pick_peaks(onset, threshold, max(1, int(BEAT_MIN_INTERVAL * frame_rate)))
+
+    return peaks * ONSET_HOP / sample_rate, _estimate_tempo(onset, frame_rate)
+
+# === FEATURE TIMELINE =========================================================
+class FeatureTimeline:
+    """
+    Frame-indexed features of a whole track, stored as column arrays.
+    Frame i describes the analysis window starting at i * hop seconds.
+    """
+    __slots__ = ("sample_rate", "hop", "duration", "columns", "magnitudes", "beats", "bpm",
+                 "band_means", "band_stds", "n_frames", "silence")
+
+    def __init__(self, sample_rate: int, hop: float, duration: float, columns: Dict[str, np.ndarray],
+                 magnitudes: np.ndarray, beats: np.ndarray, bpm: float, band_means: np.ndarray, band_stds: np.ndarray):
+        self.sample_rate = sample_rate
+        self.hop = hop
+        self.duration = duration
+        self.columns = columns
+        self.magnitudes = magnitudes  # (frames, bins) uint8, 255 = dominant frequency
+        self.beats = beats
+        self.bpm = bpm
+        self.band_means = band_means  # raw subband energy statistics, in SUBBAND_RANGES order
+        self.band_stds = band_stds
+        self.n_frames = len(magnitudes)
+
+        # Features of a window outside of the track
+        self.silence = DEFAULT_FEATURES.copy()
+        self.silence.update({band: float(np.tanh(-band_means[k] / (band_stds[k] * 3)))
+                             for k, band in enumerate(SUBBAND_RANGES)})
+        self.silence["normalized_magnitudes"] = np.zeros(magnitudes.shape[1], dtype=np.float32)
+        self.silence["normalized_magnitudes"].flags.writeable = False  # shared by every copy
 
-def analyze_segment(timestamp: float) -> Dict:
-    """Get audio features with progressive enhancement of global features"""
+    def beat_state(self, timestamp: float) -> Tuple[bool, float]:
+        """
+        (is_beat, beat_phase) at timestamp: whether a beat lies inside the analysis window
+        and the fraction of a beat period (from bpm) that passed since the last beat.
+        """
+        i = int(np.searchsorted(self.beats, timestamp))  # first beat >= timestamp
+        is_beat = i < len(self.beats) and self.beats[i] < timestamp + ANALYSIS_WINDOW
+        if i == 0 or not self.bpm:
+            return bool(is_beat), 0.0
+        return bool(is_beat), float((timestamp - self.beats[i - 1]) * self.bpm / 60 % 1.0)
 
-    result = DEFAULT_FEATURES.copy()
-    segment = get_segment_at_time(timestamp, ANALYSIS_WINDOW)
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """All data of the timeline as flat named arrays (e.g. for storing on disk)"""
+        return {
+            **self.columns,
+            "magnitudes": self.magnitudes,
+            "beats": self.beats,
+            "band_means": self.band_means,
+            "band_stds": self.band_stds,
+            "params": np.array([self.sample_rate, self.hop, self.duration, self.bpm], dtype=np.float64),
+        }
 
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "FeatureTimeline":
+        """Inverse of to_arrays"""
+        sample_rate, hop, duration, bpm = arrays["params"]
+        columns = {key: arrays[key] for key in TIMELINE_COLUMNS}
+        return cls(int(sample_rate), float(hop), float(duration), columns, arrays["magnitudes"], arrays["beats"],
+                   float(bpm), arrays["band_means"], arrays["band_stds"])
+
+    def lookup(self, timestamp: float, interpolate: bool = True, out: Optional[Dict] = None) -> Dict:
+        """
+        Features at timestamp, linearly interpolated between neighbouring frames.
+        out is an optional dict of an earlier lookup to write into, its magnitude array is reused.
+        """
+        pos = timestamp / self.hop
+        if pos < 0 or pos > self.n_frames - 1:
+            return _copy_features(self.silence, out)
+
+        i = int(pos + 1e-6)  # timestamps on the frame grid must not round down
+        frac = max(pos - i, 0.0) if interpolate and i + 1 < self.n_frames else 0.0
+        nearest = i + 1 if frac >= 0.5 else i
+
+        result = {} if out is None else out
+        for key, column in self.columns.items():
+            if frac:
+                result[key] = float(column[i] + (column[i + 1] - column[i]) * frac)
+            else:
+                result[key] = float(column[i])
+
+        result["is_silent"] = result["rms"] < SILENCE_THRESHOLD
+        result["is_beat"], result["beat_phase"] = self.beat_state(timestamp)
+        result["normalized_magnitudes"] = _normalized_magnitudes(self.magnitudes[nearest], out)
+        return result
+
+
+def _copy_features(features: Dict, out: Optional[Dict] = None) -> Dict:
+    """Copy of a feature dict, written into out if given"""
+    if out is None:
+        return features.copy()
+    out.update(features)
+    return out
+
+def _normalized_magnitudes(magnitudes: np.ndarray, out: Optional[Dict] = None) -> np.ndarray:
+    """8 bit magnitudes as floats from 0 to 1, in the normalized magnitude array of out if it fits"""
+    buffer = out.get("normalized_magnitudes") if out is not None else None
+    if not (isinstance(buffer, np.ndarray) and buffer.shape == magnitudes.shape
+            and buffer.dtype == np.float32 and buffer.flags.writeable):
+        buffer = np.empty(magnitudes.shape, dtype=np.float32)
+    np.copyto(buffer, magnitudes)
+    buffer /= np.float32(255.0)
+    return buffer
+
+
+def _frame_blocks(buffer: np.ndarray, frame_size: int, hop_size: int, n_frames: int,
+                  frames_per_block: int = TIMELINE_BLOCK):
+    """
+    Yield (first_frame, frames) blocks of strided frames of raw audio data.
+    Only one block of normalized mono samples exists at a time.
+    """
+    for first in range(0, n_frames, frames_per_block):
+        count = min(frames_per_block, n_frames - first)
+        start = first * hop_size
+        chunk = _read_mono(buffer, start, start + (count - 1) * hop_size + frame_size)
+
+        frames = np.lib.stride_tricks.sliding_window_view(chunk, frame_size)[::hop_size]
+        yield first, frames
+        _release_pages(buffer, start + count * hop_size)
+
+
+@lru_cache(maxsize=16)
+def _spectral_plan(frame_size: int, sample_rate: int) -> "SpectralPlan":
+    """Window, bin frequencies, A-weights and subband filterbank of frames of frame_size samples"""
+    from tools.analysis.filterbank import SpectralPlan
+    return SpectralPlan(frame_size, sample_rate)
+
+def _frame_features(frames: np.ndarray, plan: "SpectralPlan", rms: np.ndarray, zcr: np.ndarray,
+                    centroid: np.ndarray, magnitudes: np.ndarray, energies: np.ndarray) -> np.ndarray:
+    """
+    Features of a block of frames, written into the given output rows.
+    Returns the magnitude spectra (for the spectral flux).
+    """
     # Time-domain features
-    result.update({
-        "rms": compute_rms(segment),
-        "zero_crossing_rate": compute_zero_crossing_rate(segment),
-        "is_silent": is_silent(segment),
-        "sample_rate": _sample_rate
-    })
+    rms[:] = np.sqrt(np.mean(frames**2, axis=1))
+    zcr[:] = np.mean(np.abs(np.diff(np.sign(frames), axis=1)), axis=1)
 
     # Frequency-domain features
-    freqs, mag = compute_magnitude_spectrum(segment)
-    result.update({
-        "spectral_centroid": compute_spectral_centroid(freqs, mag),
-        "normalized_magnitudes": mag / (np.max(mag) + EPSILON)
-    })
-    if timestamp >= ANALYSIS_WINDOW:
-        prev_segment = get_segment_at_time(timestamp - ANALYSIS_WINDOW, ANALYSIS_WINDOW)
-        if len(prev_segment) > 0:
-            _, prev_mag = compute_magnitude_spectrum(prev_segment)
-            result["spectral_flux"] = compute_spectral_flux(mag, prev_mag)
-    
-    # If global features are calculated
-    if _global_calculated:
-        # Beat detection features
-        result.update({
-            "is_beat": _is_beat(timestamp),
-            "bpm": _audio_props["bpm"]
-        })
-        
-        # Subband features (only if frequency analysis succeeded)
-        raw_energies = _compute_subband_energies(freqs, mag)
-        for band, energy in raw_energies.items():
-            mean = _audio_props["subband_stats"]["means"][band]
-            std = _audio_props["subband_stats"]["stds"][band]
-            result[band] = np.tanh((energy - mean) / (std * 3))
-    
-    return result
+    mag = plan.magnitudes(frames).astype(np.float32)
+    total = np.sum(mag, axis=1)
+    centroid[:] = np.divide(mag @ plan.freqs, total, out=np.zeros_like(total), where=total > 0)
+    magnitudes[:] = np.rint(mag / (np.max(mag, axis=1, keepdims=True) + EPSILON) * 255)
+    energies[:] = plan.band_energies(mag)
+    return mag
+
+
+def _compute_feature_timeline(buffer: np.ndarray, sample_rate: int, beats: np.ndarray, bpm: float) -> FeatureTimeline:
+    """Compute all frame features of the track in one blockwise vectorized STFT pass"""
+    frame_size = int(ANALYSIS_WINDOW * sample_rate)
+    hop_size = int(TIMELINE_HOP * sample_rate)
+    flux_lag = max(1, round(frame_size / hop_size))  # frames between two adjacent windows
+    n_frames = max(1, -(-len(buffer) // hop_size))
+    n_bins = frame_size // 2
+
+    plan = _spectral_plan(frame_size, sample_rate)
+
+    rms = np.zeros(n_frames, dtype=np.float32)
+    zcr = np.zeros(n_frames, dtype=np.float32)
+    centroid = np.zeros(n_frames, dtype=np.float32)
+    flux = np.zeros(n_frames, dtype=np.float32)
+    energies = np.zeros((n_frames, len(SUBBAND_RANGES)), dtype=np.float64)
+    magnitudes = np.zeros((n_frames, n_bins), dtype=np.uint8)
+    previous = np.zeros((0, n_bins), dtype=np.float32)  # last frames of the previous block
+
+    for first, frames in _frame_blocks(buffer, frame_size, hop_size, n_frames):
+        block = slice(first, first + len(frames))
+
+        mag = _frame_features(frames, plan, rms[block], zcr[block], centroid[block], magnitudes[block], energies[block])
+
+        # Spectral flux against the window directly before each frame
+        history = np.concatenate([previous, mag])
+        offset = len(previous)
+        lagged = np.arange(offset, len(history)) - flux_lag
+        valid = lagged >= 0
+        diff = np.maximum(history[offset:][valid] - history[lagged[valid]], 0)
+        flux[first:first + len(frames)][valid] = np.sum(diff**2, axis=1)
+        previous = history[-flux_lag:]
+
+    # Band energies relative to the whole track (zero-padded frames at the end are left out)
+    complete = energies[:max(1, (len(buffer) - frame_size) // hop_size + 1)]
+    means = np.mean(complete, axis=0)
+    stds = np.std(complete, axis=0) + EPSILON
+    bands = np.tanh((energies - means) / (stds * 3)).astype(np.float32)
+
+    columns = {
+        "rms": rms,
+        "zero_crossing_rate": zcr,
+        "spectral_centroid": centroid,
+        "spectral_flux": flux,
+        **{band: bands[:, k] for k, band in enumerate(SUBBAND_RANGES)},
+    }
+
+    return FeatureTimeline(sample_rate, hop_size / sample_rate, len(buffer) / sample_rate, columns, magnitudes,
+                           np.asarray(beats, dtype=np.float64), bpm, means, stds)
+
+# === TRACK ANALYSIS ===========================================================
+class TrackAnalysis:
+    """
+    Analysis of a single track: the feature timeline and (optionally) the raw audio data.
+    It is not modified after construction, so it can be built in a worker thread or
+    process while another track is rendered and then swapped in by one assignment.
+    """
+    __slots__ = ("sample_rate", "duration", "timeline", "buffer")
+
+    def __init__(self, timeline: FeatureTimeline, buffer: Optional[np.ndarray] = None):
+        self.sample_rate = timeline.sample_rate
+        self.duration = timeline.duration
+        self.timeline = timeline
+        self.buffer = buffer  # raw (possibly memory-mapped, stereo) samples
+
+    @classmethod
+    def from_audio(cls, data: np.ndarray, sample_rate: int) -> "TrackAnalysis":
+        """Full audio preprocessing pipeline"""
+        beats, bpm = _detect_beats(data, sample_rate)
+        return cls(_compute_feature_timeline(data, sample_rate, beats, bpm), data)
+
+    @property
+    def beats(self) -> np.ndarray:
+        return self.timeline.beats
+
+    @property
+    def bpm(self) -> float:
+        return self.timeline.bpm
+
+    @property
+    def subband_stats(self) -> Dict:
+        return {
+            "means": dict(zip(SUBBAND_RANGES, self.timeline.band_means)),
+            "stds": dict(zip(SUBBAND_RANGES, self.timeline.band_stds)),
+        }
+
+    def analyze(self, timestamp: float, interpolate: bool = True, out: Optional[Dict] = None) -> Dict:
+        """Look up the precomputed audio features at timestamp (written into the dict out if given)"""
+        result = self.timeline.lookup(timestamp, interpolate, out)
+        result["bpm"] = self.timeline.bpm
+        result["sample_rate"] = self.sample_rate
+        return result
+
+    def segment_at(self, timestamp: float, duration: float, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Extract audio segment with zero-padding if out of bounds (empty without audio data)"""
+        if self.buffer is None:
+            return np.zeros(0, dtype=np.float32)
+        start = int(timestamp * self.sample_rate)
+        return _read_mono(self.buffer, start, start + int(duration * self.sample_rate), out)
+
+# === MAIN ANALYSIS ENTRY POINTS ===============================================
+def analyze_segment(timestamp: float, interpolate: bool = True, out: Optional[Dict] = None) -> Dict:
+    """
+    Audio features of the current track at timestamp. With out (the dict of an earlier
+    call) the features are written into it instead of a new dict, e.g. once per frame.
+    """
+    track = _current
+    if track is None:
+        return _copy_features(DEFAULT_FEATURES, out)
+    return track.analyze(timestamp, interpolate, out)
 
 # === UTILITY FUNCTIONS ========================================================
 def compute_rms(audio: np.ndarray) -> float:
@@ -245,9 +515,3 @@ def compute_zero_crossing_rate(audio: np.ndarray) -> float:
 
 def is_silent(audio: np.ndarray) -> bool:
     return compute_rms(audio) < SILENCE_THRESHOLD
-
-def _is_beat(timestamp: float) -> bool:
-    """Check if any beat occurs in current analysis window"""
-    window_start = timestamp
-    window_end = timestamp + ANALYSIS_WINDOW
-    return any(window_start <= beat < window_end for beat in _audio_props["beats"])
\ No newline at end of file
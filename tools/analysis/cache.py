@@ -0,0 +1,197 @@
+"""
+Analysis Cache
+---
+
+Stores the feature timeline of every analyzed track on disk, so replaying a
+track does not need to read and analyze the whole audio file again.
+
+Layout of the cache folder:
+- `<key>/` one folder per analyzed track, one `.npy` file per timeline array
+  (loaded memory-mapped) and a `meta.json`
+- `hashes.json` remembers the content hash of every file by path, size and mtime.
+  Every process merges its new hashes into the file as it is on disk, so the
+  pre-analysis workers don't drop each other's entries, and hashes of files that
+  no longer exist are pruned.
+
+The key combines the content hash of the audio file with the analysis parameters
+and `CACHE_VERSION`, so changing one of them never returns stale results.
+Entries are evicted least-recently-used once the folder grows above `max_bytes`.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from typing import Optional
+import tools.analysis as analysis
+from tools.analysis import FeatureTimeline, TrackAnalysis
+from tools.analysis.decode import read_audio
+from tools.metrics import metrics
+
+CACHE_VERSION = 2  # Increase when the content of the timeline changes
+HASH_CHUNK_SIZE = 1 << 20
+
+_cache_hits = metrics.counter("jamplay_analysis_cache_requests_total", "Analyses of songs requested from the cache", result="hit")
+_cache_misses = metrics.counter("jamplay_analysis_cache_requests_total", "Analyses of songs requested from the cache", result="miss")
+
+
+def _analysis_params() -> str:
+    """Fingerprint of every parameter that changes the analysis result"""
+    params = {
+        "version": CACHE_VERSION,
+        "window": analysis.ANALYSIS_WINDOW,
+        "hop": analysis.TIMELINE_HOP,
+        "beat_min_interval": analysis.BEAT_MIN_INTERVAL,
+        "onset": [analysis.ONSET_FRAME, analysis.ONSET_HOP, analysis.ONSET_MAX_FREQ,
+                  analysis.ONSET_THRESHOLD_WINDOW, analysis.ONSET_THRESHOLD_STDS],
+        "tempo": [analysis.TEMPO_MIN_BPM, analysis.TEMPO_PRIOR_BPM],
+        "subbands": analysis.SUBBAND_RANGES,
+    }
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:8]
+
+
+class AnalysisCache:
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.params = _analysis_params()
+        os.makedirs(self.folder, exist_ok=True)
+
+        self._hashes_lock = threading.Lock()  # the catalog and the song loader of the visualizer hash in their threads
+        self._hashes_path = os.path.join(self.folder, "hashes.json")
+        try:
+            with open(self._hashes_path) as f:
+                self._hashes = json.load(f)
+        except (OSError, ValueError):
+            self._hashes = {}
+
+    # === KEYS ==================================================================
+    def content_hash(self, path: str) -> str:
+        """SHA-1 of the file content, only recomputed when size or mtime changed"""
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        known = self._hashes.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+
+        with self._hashes_lock:
+            self._hashes = {known: entry for known, entry in self._read_hashes().items() if os.path.exists(known)}
+            self._hashes[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+            self._write_json(self._hashes_path, self._hashes)
+        return digest.hexdigest()
+
+    def _read_hashes(self) -> dict:
+        """hashes.json as other processes left it, merged with the hashes of this one"""
+        try:
+            with open(self._hashes_path) as f:
+                return {**self._hashes, **json.load(f)}
+        except (OSError, ValueError):
+            return dict(self._hashes)
+
+    def key(self, path: str) -> str:
+        return f"{self.content_hash(path)[:24]}-{self.params}"
+
+    # === LOAD / STORE ==========================================================
+    def contains(self, path: str) -> bool:
+        return os.path.exists(os.path.join(self.folder, self.key(path), "meta.json"))
+
+    def load(self, path: str) -> Optional[FeatureTimeline]:
+        """Cached timeline of the audio file at path or None"""
+        entry = os.path.join(self.folder, self.key(path))
+        meta_path = os.path.join(entry, "meta.json")
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            arrays = {name: np.load(os.path.join(entry, name + ".npy"), mmap_mode="r") for name in meta["arrays"]}
+            timeline = FeatureTimeline.from_arrays(arrays)
+            os.utime(meta_path)  # mark as recently used
+        except (OSError, ValueError, KeyError):  # e.g. evicted by another process in the meantime
+            return None
+        return timeline
+
+    def store(self, path: str, timeline: FeatureTimeline) -> None:
+        """Write the timeline of the audio file at path into the cache"""
+        key = self.key(path)
+        entry = os.path.join(self.folder, key)
+        if os.path.exists(entry):
+            return
+
+        # Write into a temporary folder of this call first so readers never see half an entry,
+        # threads of one process (song loader, catalog, offline renderer) may store the same key at once
+        tmp = tempfile.mkdtemp(dir=self.folder, prefix=f".{key}.")
+        try:
+            arrays = timeline.to_arrays()
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(array))
+            self._write_json(os.path.join(tmp, "meta.json"), {
+                "version": CACHE_VERSION,
+                "source": os.path.basename(path),
+                "created": time.time(),
+                "arrays": list(arrays),
+            })
+            os.rename(tmp, entry)
+        except OSError:  # stored concurrently by another thread or process
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict()
+
+    # === EVICTION ==============================================================
+    def evict(self) -> None:
+        """Delete least recently used entries until the cache fits into max_bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.folder):
+            entry = os.path.join(self.folder, name)
+            if name.startswith(".") or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry))
+                last_used = os.stat(os.path.join(entry, "meta.json")).st_mtime
+            except OSError:
+                continue
+            entries.append((last_used, size, entry))
+            total += size
+
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    # === HELPERS ===============================================================
+    @staticmethod
+    def _write_json(path: str, data) -> None:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+def analyze_file(path: str, cache: Optional[AnalysisCache] = None) -> TrackAnalysis:
+    """Analysis of the audio file at path, taken from the cache if possible"""
+    timeline = cache.load(path) if cache else None
+    if timeline is not None:
+        _cache_hits.inc()
+        return TrackAnalysis(timeline)
+    if cache:
+        _cache_misses.inc()
+
+    sample_rate, data = read_audio(path)
+    track = TrackAnalysis.from_audio(data, sample_rate)
+    if cache:
+        cache.store(path, track.timeline)
+    return track
@@ -0,0 +1,137 @@
+"""
+Audio Decoding
+---
+
+Reads the audio of a library file for the analysis. WAV files are memory-mapped
+(see README), every other format (FLAC, Opus, AAC, MP3, ...) is decoded by
+ffmpeg, the same one yt-dlp uses for downloads.
+
+ffmpeg mixes the audio down to mono 16 bit PCM at its original sample rate and
+streams it through a pipe straight into one preallocated array, sized from the
+duration reported by ffprobe, so decoding needs neither a temporary file nor a
+stereo or float copy of the track.
+"""
+
+import json
+import shutil
+import subprocess
+import numpy as np
+import scipy.io.wavfile as wav
+from typing import Optional, Tuple
+
+WAV_EXTENSIONS = (".wav",)
+DEFAULT_DURATION = 300  # seconds of samples preallocated when ffprobe can't tell the duration
+READ_CHUNK = 1 << 20
+WAV_DTYPES = {(1, 8): "u1", (1, 16): "<i2", (1, 32): "<i4", (3, 32): "<f4"}  # (format tag, bits) -> sample dtype
+
+
+def is_wav(path: str) -> bool:
+    return path.lower().endswith(WAV_EXTENSIONS)
+
+
+def read_wav(path: str):
+    """Memory-mapped (sample_rate, data) of a WAV file, falls back to reading it if it can't be mapped"""
+    try:
+        return wav.read(path, mmap=True)
+    except ValueError:
+        return wav.read(path)
+
+
+def probe(path: str) -> Tuple[Optional[float], Optional[int]]:
+    """(duration, sample_rate) of an audio file, None for what can't be read"""
+    if is_wav(path):
+        try:
+            sample_rate, data = read_wav(path)
+            return data.shape[0] / sample_rate, sample_rate
+        except Exception:
+            return None, None
+
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        return None, None
+    try:
+        output = subprocess.run(
+            [ffprobe, "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=sample_rate:format=duration",
+             "-of", "json", path], check=True, capture_output=True).stdout
+        info = json.loads(output)
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None, None
+    streams = info.get("streams") or [{}]
+    duration = info.get("format", {}).get("duration")
+    sample_rate = streams[0].get("sample_rate")
+    return (float(duration) if duration else None), (int(sample_rate) if sample_rate else None)
+
+
+def _read_exactly(stream, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise EOFError("ffmpeg output ended early")
+    return data
+
+
+def read_wav_header(stream) -> Tuple[int, int, np.dtype]:
+    """
+    Reads the header of a WAV stream (e.g. from a pipe) up to its samples,
+    returns the sample rate, the number of channels and the dtype of the samples.
+    """
+    if _read_exactly(stream, 12)[8:] != b"WAVE":
+        raise ValueError("Stream is not WAV")
+    fmt = None
+    while True:
+        chunk_id, size = _read_exactly(stream, 4), int.from_bytes(_read_exactly(stream, 4), "little")
+        if chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV stream without format")
+            return fmt
+        chunk = _read_exactly(stream, size + size % 2)
+        if chunk_id == b"fmt ":
+            tag, channels = int.from_bytes(chunk[0:2], "little"), int.from_bytes(chunk[2:4], "little")
+            sample_rate, bits = int.from_bytes(chunk[4:8], "little"), int.from_bytes(chunk[14:16], "little")
+            if tag == 0xFFFE:  # WAVE_FORMAT_EXTENSIBLE, the format is in the sub format
+                tag = int.from_bytes(chunk[24:26], "little")
+            if (tag, bits) not in WAV_DTYPES:
+                raise ValueError(f"Unsupported WAV format {tag} with {bits} bits")
+            fmt = sample_rate, channels, np.dtype(WAV_DTYPES[tag, bits])
+
+
+def decode(path: str) -> Tuple[int, np.ndarray]:
+    """(sample_rate, mono int16 samples) of any audio file ffmpeg can read"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise ValueError(f"ffmpeg is needed to read {path}")
+
+    duration, _ = probe(path)
+    # A WAV stream instead of raw samples: its header tells the sample rate, so nothing gets resampled
+    process = subprocess.Popen(
+        [ffmpeg, "-nostdin", "-loglevel", "error", "-i", path, "-vn", "-ac", "1", "-c:a", "pcm_s16le", "-f", "wav", "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    sample_rate, data, filled = None, None, 0
+    try:
+        sample_rate, _, _ = read_wav_header(process.stdout)
+
+        # Read the pipe into the array directly, it only grows if the duration was too short
+        data = np.empty(int((duration or DEFAULT_DURATION) * sample_rate) + sample_rate, dtype=np.int16)
+        raw = data.view(np.uint8)
+        while True:
+            if filled + READ_CHUNK > len(raw):
+                grown = np.empty(len(data) + len(data) // 2 + READ_CHUNK, dtype=np.int16)
+                grown.view(np.uint8)[:filled] = raw[:filled]
+                data, raw = grown, grown.view(np.uint8)
+            read = process.stdout.readinto(memoryview(raw)[filled:filled + READ_CHUNK])
+            if not read:
+                break
+            filled += read
+    except (EOFError, ValueError):
+        pass  # the error of ffmpeg explains it better
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read()
+
+    if process.wait() != 0 or filled == 0:
+        raise ValueError(f"Could not decode {path}: {stderr.decode(errors='replace').strip()}")
+    return sample_rate, data[:filled // 2]
+
+
+def read_audio(path: str):
+    """(sample_rate, data) of a library file for the analysis"""
+    return read_wav(path) if is_wav(path) else decode(path)
@@ -0,0 +1,138 @@
+"""
+Filterbank
+---
+
+A `SpectralPlan` holds everything about the spectra of frames of one size that
+doesn't depend on the audio: the window, the bin frequencies, the A-weights and
+a sparse filterbank matrix (bins x bands). Band energies of any number of frames
+are one matrix multiply with it, so a mapper can draw a spectrum bar per LED
+every frame for the cost of a single small product.
+
+Band scales:
+- `subband`: the seven `SUBBAND_RANGES` of the analysis (rectangular)
+- `log`: n bands with logarithmically spaced edges (rectangular)
+- `mel`, `bark`: n triangular bands evenly spaced on the mel or Bark scale
+
+Bands narrower than a bin take the bin nearest to their center, so there is a
+value for every band however small the frames are.
+"""
+
+import numpy as np
+import scipy.sparse
+from typing import Optional
+from tools.analysis import SUBBAND_RANGES, _a_weighting
+
+BAND_SCALES = ("subband", "log", "mel", "bark")
+
+
+# === SCALES ===================================================================
+def hz_to_mel(hz):
+    return 2595 * np.log10(1 + np.asarray(hz) / 700)
+
+def mel_to_hz(mel):
+    return 700 * (10 ** (np.asarray(mel) / 2595) - 1)
+
+def hz_to_bark(hz):
+    """Traunmüller's approximation of the Bark scale"""
+    hz = np.asarray(hz)
+    return 26.81 * hz / (1960 + hz) - 0.53
+
+def bark_to_hz(bark):
+    bark = np.asarray(bark)
+    return 1960 * (bark + 0.53) / (26.28 - bark)
+
+
+# === FILTERBANK ===============================================================
+def band_edges(scale: str, n_bands: int, fmin: float, fmax: float) -> np.ndarray:
+    """
+    Band edges in Hz: n_bands + 1 edges of rectangular (log) bands,
+    n_bands + 2 (lower end, centers, upper end) of triangular (mel, Bark) ones
+    """
+    if scale == "log":
+        return np.geomspace(fmin, fmax, n_bands + 1)
+    if scale == "mel":
+        return mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_bands + 2))
+    if scale == "bark":
+        return bark_to_hz(np.linspace(hz_to_bark(fmin), hz_to_bark(fmax), n_bands + 2))
+    raise ValueError(f"Unknown band scale {scale!r}, one of {', '.join(BAND_SCALES)}")
+
+
+def filterbank(freqs: np.ndarray, scale: str = "subband", n_bands: Optional[int] = None, fmin: float = 20.0,
+               fmax: Optional[float] = None, normalize: bool = False) -> scipy.sparse.csr_matrix:
+    """
+    Sparse (bins, bands) matrix of the weight of every bin in every band.
+    normalize makes the weights of a band sum to 1 (band energies become the mean
+    instead of the sum of their bins, so wide high bands don't outweigh narrow low ones).
+    """
+    if scale == "subband":
+        n_bands = len(SUBBAND_RANGES)
+    elif not n_bands or n_bands < 1:
+        raise ValueError(f"The {scale} scale needs a number of bands")
+    nyquist = freqs[-1] + (freqs[1] - freqs[0] if len(freqs) > 1 else 0) if len(freqs) else 0.0
+    fmax = min(fmax or nyquist, nyquist)
+    edges = list(SUBBAND_RANGES.values()) if scale == "subband" else band_edges(scale, n_bands, fmin, fmax)
+
+    rows, cols, values = [], [], []
+    for band in range(n_bands):
+        if scale == "subband":
+            (low, high), center = edges[band], None
+            bins = np.flatnonzero((freqs >= low) & (freqs < high))
+            weights = np.ones(len(bins))
+        elif scale == "log":
+            low, center, high = edges[band], None, edges[band + 1]
+            bins = np.flatnonzero((freqs >= low) & (freqs < high))
+            weights = np.ones(len(bins))
+        else:
+            low, center, high = edges[band:band + 3]
+            bins = np.flatnonzero((freqs > low) & (freqs < high))
+            weights = np.minimum((freqs[bins] - low) / (center - low), (high - freqs[bins]) / (high - center))
+        if len(bins) == 0:
+            if scale == "subband":
+                continue  # above the Nyquist frequency, the band stays empty like before
+            target = center if center is not None else np.sqrt(low * high)
+            bins, weights = np.array([np.argmin(np.abs(freqs - target))]), np.ones(1)
+        if normalize:
+            weights = weights / np.sum(weights)
+        rows.append(bins)
+        cols.append(np.full(len(bins), band))
+        values.append(weights)
+
+    if rows:
+        rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+    return scipy.sparse.csr_matrix((values, (rows, cols)), shape=(len(freqs), n_bands), dtype=np.float32)
+
+
+# === SPECTRAL PLAN ============================================================
+class SpectralPlan:
+    """Window, bin frequencies, A-weights and filterbank of the spectra of frames of frame_size samples"""
+
+    def __init__(self, frame_size: int, sample_rate: int, scale: str = "subband", n_bands: Optional[int] = None,
+                 fmin: float = 20.0, fmax: Optional[float] = None, a_weighting: bool = True, normalize: bool = False):
+        self.frame_size = frame_size
+        self.sample_rate = sample_rate
+        self.scale = scale
+        self.n_bins = frame_size // 2
+        self.window = np.hanning(frame_size).astype(np.float32)
+        self.freqs = np.fft.rfftfreq(frame_size, d=1/sample_rate)[:self.n_bins]
+        self.weights = (_a_weighting(self.freqs) ** 2).astype(np.float32) if a_weighting else None  # of the power
+        self.bank = filterbank(self.freqs, scale, n_bands, fmin, fmax, normalize)
+        self.n_bands = self.bank.shape[1]
+        self._bank_t = self.bank.T.tocsr()  # (bands, bins), multiplied from the left
+
+    def magnitudes(self, frames: np.ndarray) -> np.ndarray:
+        """Magnitude spectra of one frame (frame_size,) or many (n, frame_size)"""
+        return np.abs(np.fft.rfft(frames * self.window, axis=-1)[..., :self.n_bins])
+
+    def band_energies(self, magnitudes: np.ndarray, power: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        (A-weighted) energy per band of one magnitude spectrum (n_bins,) or many (n, n_bins).
+        power is an optional buffer of the shape of magnitudes for the weighted power spectrum.
+        """
+        power = np.square(magnitudes, out=power)
+        if self.weights is not None:
+            power *= self.weights
+        return (self._bank_t @ power.T).T
+
+    def bands(self, frames: np.ndarray) -> np.ndarray:
+        """Energy per band of one frame or many"""
+        return self.band_energies(self.magnitudes(frames))
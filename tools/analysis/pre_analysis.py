@@ -0,0 +1,121 @@
+"""
+Pre-Analysis
+---
+
+Analyzes tracks in the background (e.g. right after a download or for every
+uncached file of the library at startup) and writes the results into the
+analysis cache, so switching songs only has to load the cached timeline.
+
+The analysis is CPU-bound NumPy code, therefore the work is done by a pool of
+separate processes which run with a lower priority than the web server and the
+visualizer.
+"""
+
+import os
+import multiprocessing
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Callable, Dict, Iterable, List, Optional
+from tools.analysis.cache import AnalysisCache, analyze_file
+
+WORKER_NICENESS = 10
+
+
+def _init_worker() -> None:
+    try:
+        os.nice(WORKER_NICENESS)
+    except (AttributeError, OSError):
+        pass
+
+
+def _analyze_into_cache(path: str, cache_folder: str, max_bytes: int) -> float:
+    """Runs in a worker process, returns the duration of the track"""
+    return analyze_file(path, AnalysisCache(cache_folder, max_bytes)).duration
+
+
+class PreAnalyzer:
+    def __init__(self, cache: AnalysisCache, workers: int = 1):
+        self.cache = cache
+
+        # "spawn" instead of "fork": the server process runs threads (visualizer, pygame)
+        context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker)
+
+        self._lock = Lock()
+        self._jobs: Dict[str, Future] = {}  # queued or running, finished jobs only stay in the counters
+        self.submitted = 0
+        self.done = 0
+        self.failed = 0
+        self.errors: Dict[str, str] = {}
+        self.listeners: List[Callable[[str, bool], None]] = []  # listener(path, success) after every job
+
+    def submit(self, path: str) -> None:
+        """Queue the audio file at path for analysis, unless it is already queued or running"""
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._jobs and not self._jobs[path].done():
+                return
+            future = self._executor.submit(_analyze_into_cache, path, self.cache.folder, self.cache.max_bytes)
+            self._jobs[path] = future
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._finished(path, f))
+
+    def submit_all(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            self.submit(path)
+
+    def running(self, path: str) -> bool:
+        """True while the worker pool is currently analyzing the file at path"""
+        with self._lock:
+            future = self._jobs.get(os.path.abspath(path))
+        return future is not None and future.running()
+
+    def wait(self, path: str, timeout: Optional[float] = None) -> bool:
+        """Wait for the queued or running job of the file at path, True if it finished successfully"""
+        with self._lock:
+            future = self._jobs.get(os.path.abspath(path))
+        if future is None:
+            return False
+        try:
+            future.result(timeout)
+            return True
+        except Exception:
+            return False
+
+    def status(self) -> Dict:
+        with self._lock:
+            pending = [(path, future) for path, future in self._jobs.items() if not future.done()]
+            running = [os.path.basename(path) for path, future in pending if future.running()]
+            finished = self.done + self.failed
+            return {
+                "queued": len(pending) - len(running),
+                "running": running,
+                "done": self.done,
+                "failed": self.failed,
+                "total": self.submitted,
+                "progress": finished / self.submitted if self.submitted else 1.0,
+                "errors": dict(self.errors),
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finished(self, path: str, future: Future) -> None:
+        with self._lock:
+            if self._jobs.get(path) is future:
+                del self._jobs[path]
+            if future.cancelled():
+                return
+            success = future.exception() is None
+            if success:
+                self.done += 1
+                self.errors.pop(os.path.basename(path), None)  # failed before, e.g. while it was being copied
+            else:
+                self.failed += 1
+                self.errors[os.path.basename(path)] = str(future.exception())
+
+        for listener in self.listeners:
+            try:
+                listener(path, success)
+            except Exception as e:
+                print(f"Pre-analysis listener failed: {e}")
@@ -0,0 +1,381 @@
+"""
+Streaming Analysis
+---
+
+Real-time analysis of live audio (e.g. a DJ set on the input of a sound card),
+for which there is no file that could be analyzed ahead of time. Blocks of
+samples are fed into a `StreamingAnalyzer` as they arrive and every analysis
+window is analyzed as soon as its last sample arrived, with the same feature
+calculations as the feature timeline of a track:
+- the samples are kept in a ring buffer, so a window is read without copying
+  and the STFT only ever computes the windows that were completed by a block
+- band energies are relative to running statistics of roughly the last
+  `STATS_WINDOW` seconds instead of the statistics of the whole track
+- beats are detected causally: an onset strength above the adaptive threshold of
+  the past second is a beat the moment it happens. The tempo is estimated every
+  `TEMPO_INTERVAL` seconds from the onset strength of the last `TEMPO_WINDOW` seconds.
+
+A `StreamingAnalyzer` is used like a `TrackAnalysis` (`analyze(timestamp)` returns
+the same feature dict), so visualizers and mappers work with live input unchanged.
+Timestamps are seconds of audio since the start of the stream, every frame is
+stamped with the end of its window (the moment it could be analyzed).
+
+Sources are iterables of blocks of raw samples (any dtype, mono or one column per channel):
+- `FileSource`: an audio file replayed in real time (for testing without a sound card)
+- `WavStreamSource`: a WAV stream from a pipe, e.g. `arecord -f cd -t wav | python run.py`
+- `DeviceSource`: a sound card through PortAudio (needs `pip install sounddevice`)
+"""
+
+import os
+import sys
+import time
+import queue
+import numpy as np
+from threading import Lock
+from typing import Dict, Iterator, Optional, Tuple
+from tools.analysis import (ANALYSIS_WINDOW, TIMELINE_HOP, TIMELINE_COLUMNS, SUBBAND_RANGES, DEFAULT_FEATURES,
+                            BEAT_MIN_INTERVAL, ONSET_FRAME, ONSET_HOP, ONSET_MAX_FREQ, ONSET_THRESHOLD_WINDOW,
+                            ONSET_THRESHOLD_STDS, SILENCE_THRESHOLD, EPSILON, _normalize_audio, _spectral_plan,
+                            _frame_features, _onset_frames, _estimate_tempo, _copy_features, _normalized_magnitudes)
+from tools.analysis.decode import read_audio, read_wav_header
+
+try:
+    import sounddevice
+except (ImportError, OSError):  # OSError: sounddevice is installed, but PortAudio isn't
+    sounddevice = None
+
+STATS_WINDOW = 30.0  # seconds the running band statistics mostly depend on
+TEMPO_WINDOW = 8.0  # seconds of onset strength the tempo is estimated from
+TEMPO_INTERVAL = 1.0  # seconds between two tempo estimations
+HISTORY = 2.0  # seconds of samples and frames kept for lookups in the past
+
+
+# === RING BUFFER ==============================================================
+class RingBuffer:
+    """
+    The last capacity values of a stream. Every value is stored twice, so any
+    window of the last capacity values is a contiguous view and never wraps.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.values = np.zeros(2 * capacity, dtype=np.float32)
+        self.written = 0  # values since the start of the stream
+
+    def write(self, block: np.ndarray) -> None:
+        skipped = max(len(block) - self.capacity, 0)
+        block = block[skipped:]
+        self.written += skipped
+
+        start = self.written % self.capacity
+        head, tail = block[:self.capacity - start], block[self.capacity - start:]
+        for offset in (0, self.capacity):
+            self.values[offset + start:offset + start + len(head)] = head
+            self.values[offset:offset + len(tail)] = tail
+        self.written += len(block)
+
+    def window(self, start: int, stop: int) -> np.ndarray:
+        """View of the values [start, stop) of the stream, they must be among the last capacity values"""
+        if start < self.written - self.capacity or stop > self.written or stop - start > self.capacity:
+            raise IndexError(f"values {start}:{stop} are not in the ring buffer")
+        first = start % self.capacity
+        return self.values[first:first + stop - start]
+
+    def latest(self, count: int) -> np.ndarray:
+        count = min(count, self.written, self.capacity)
+        return self.window(self.written - count, self.written)
+
+
+# === STREAMING ANALYZER =======================================================
+class StreamingAnalyzer:
+    live = True  # the analysis only exists up to the newest block, nothing can be analyzed ahead
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.frame_size = int(ANALYSIS_WINDOW * sample_rate)
+        self.hop_size = int(TIMELINE_HOP * sample_rate)
+        self.flux_lag = max(1, round(self.frame_size / self.hop_size))
+        self.plan = _spectral_plan(self.frame_size, sample_rate)
+        n_bins = self.frame_size // 2
+
+        self.onset_window = np.hanning(ONSET_FRAME).astype(np.float32)
+        self.onset_bins = max(2, int(ONSET_MAX_FREQ * ONSET_FRAME / sample_rate) + 1)
+        self.onset_rate = sample_rate / ONSET_HOP
+
+        self._lock = Lock()
+        self._samples = RingBuffer(max(int(HISTORY * sample_rate), 4 * max(self.frame_size, ONSET_FRAME)))
+        self._frames = 0  # analysis frames since the start of the stream
+        self._previous = np.zeros((0, n_bins), dtype=np.float32)  # magnitudes of the last flux_lag frames
+
+        # Running (exponentially weighted) band energy statistics
+        self.band_means = np.zeros(len(SUBBAND_RANGES))
+        self.band_vars = np.zeros(len(SUBBAND_RANGES))
+
+        # The features of the last HISTORY seconds of frames, frame k is stored in slot k % capacity
+        self._capacity = max(2, int(HISTORY / TIMELINE_HOP))
+        self._columns = {key: np.zeros(self._capacity, dtype=np.float32) for key in TIMELINE_COLUMNS}
+        self._magnitudes = np.zeros((self._capacity, n_bins), dtype=np.uint8)
+
+        # Causal beat detection on the onset strength
+        self._onsets = RingBuffer(max(int(TEMPO_WINDOW * self.onset_rate), 2))
+        self._onset_previous = None
+        self._threshold_size = max(1, int(ONSET_THRESHOLD_WINDOW * self.onset_rate))
+        self._beat_distance = max(1, int(BEAT_MIN_INTERVAL * self.onset_rate))
+        self._last_beat = -self._beat_distance  # onset frame of the last beat
+        self._beats = []  # timestamps of the beats in the last HISTORY seconds
+        self._tempo_due = int(TEMPO_INTERVAL * self.onset_rate)
+        self.bpm = 0.0
+
+        self.silence = DEFAULT_FEATURES.copy()
+        self.silence.update({"normalized_magnitudes": np.zeros(n_bins, dtype=np.float32), "sample_rate": sample_rate})
+        self.silence["normalized_magnitudes"].flags.writeable = False  # shared by every copy
+
+    @property
+    def duration(self) -> float:
+        """Timestamp of the newest frame (seconds of audio analyzed)"""
+        return self._frame_time(self._frames - 1) if self._frames else 0.0
+
+    @property
+    def beats(self) -> np.ndarray:
+        with self._lock:
+            return np.array(self._beats)
+
+    @property
+    def subband_stats(self) -> Dict:
+        return {
+            "means": dict(zip(SUBBAND_RANGES, self.band_means)),
+            "stds": dict(zip(SUBBAND_RANGES, np.sqrt(self.band_vars) + EPSILON)),
+        }
+
+    def _frame_time(self, frame: int) -> float:
+        return (frame * self.hop_size + self.frame_size) / self.sample_rate
+
+    # === FEEDING ===============================================================
+    def feed(self, block: np.ndarray) -> None:
+        """Analyze the next block of raw samples of the stream"""
+        samples = _normalize_audio(np.asarray(block))
+        if samples.ndim == 2:  # Convert stereo to mono if needed
+            samples = samples.mean(axis=1)
+
+        # Blocks longer than half the ring buffer are analyzed in parts, so no window is overwritten before it was analyzed
+        part = self._samples.capacity // 2
+        with self._lock:
+            for start in range(0, len(samples), part):
+                self._samples.write(samples[start:start + part])
+                self._analyze_onsets()
+                self._analyze_frames()
+
+    def _analyze_onsets(self) -> None:
+        first = self._onsets.written
+        count = (self._samples.written - ONSET_FRAME) // ONSET_HOP + 1 - first
+        if count <= 0:
+            return
+        chunk = self._samples.window(first * ONSET_HOP, (first + count - 1) * ONSET_HOP + ONSET_FRAME)
+        frames = np.lib.stride_tricks.sliding_window_view(chunk, ONSET_FRAME)[::ONSET_HOP]
+        onsets, self._onset_previous = _onset_frames(frames, self.onset_window, self.onset_bins, self._onset_previous)
+
+        for i, onset in enumerate(onsets, first):
+            self._onsets.write(onset[None])
+
+            # Adaptive threshold of the past second, a beat is reported as soon as the onset crosses it
+            recent = self._onsets.latest(self._threshold_size)
+            threshold = max(np.mean(recent) + ONSET_THRESHOLD_STDS * np.std(recent), EPSILON)
+            if onset > threshold and i - self._last_beat > self._beat_distance:
+                self._last_beat = i
+                self._beats.append((i * ONSET_HOP + ONSET_FRAME) / self.sample_rate)
+
+            self._tempo_due -= 1
+            if self._tempo_due <= 0:
+                self._tempo_due = int(TEMPO_INTERVAL * self.onset_rate)
+                self.bpm = _estimate_tempo(self._onsets.latest(self._onsets.capacity), self.onset_rate)
+
+        oldest = self._samples.written / self.sample_rate - HISTORY
+        while self._beats and self._beats[0] < oldest:
+            self._beats.pop(0)
+
+    def _analyze_frames(self) -> None:
+        first = self._frames
+        count = (self._samples.written - self.frame_size) // self.hop_size + 1 - first
+        if count <= 0:
+            return
+        chunk = self._samples.window(first * self.hop_size, (first + count - 1) * self.hop_size + self.frame_size)
+        frames = np.lib.stride_tricks.sliding_window_view(chunk, self.frame_size)[::self.hop_size]
+
+        rms, zcr, centroid = np.zeros((3, count), dtype=np.float32)
+        magnitudes = np.zeros((count, self.plan.n_bins), dtype=np.uint8)
+        energies = np.zeros((count, len(SUBBAND_RANGES)))
+        mag = _frame_features(frames, self.plan, rms, zcr, centroid, magnitudes, energies)
+
+        # Spectral flux against the window directly before each frame
+        history = np.concatenate([self._previous, mag])
+        offset = len(self._previous)
+        lagged = np.arange(offset, len(history)) - self.flux_lag
+        valid = lagged >= 0
+        flux = np.zeros(count, dtype=np.float32)
+        flux[valid] = np.sum(np.maximum(history[offset:][valid] - history[lagged[valid]], 0)**2, axis=1)
+        self._previous = history[-self.flux_lag:]
+
+        for i in range(count):
+            # Exponentially weighted statistics, a plain average until there are STATS_WINDOW seconds of frames
+            alpha = max(1 / (first + i + 1), TIMELINE_HOP / STATS_WINDOW)
+            delta = energies[i] - self.band_means
+            self.band_means += alpha * delta
+            self.band_vars = (1 - alpha) * (self.band_vars + alpha * delta**2)
+            bands = np.tanh((energies[i] - self.band_means) / ((np.sqrt(self.band_vars) + EPSILON) * 3))
+
+            slot = (first + i) % self._capacity
+            values = {"rms": rms[i], "zero_crossing_rate": zcr[i], "spectral_centroid": centroid[i], "spectral_flux": flux[i],
+                      **{band: bands[k] for k, band in enumerate(SUBBAND_RANGES)}}
+            for key, column in self._columns.items():
+                column[slot] = values[key]
+            self._magnitudes[slot] = magnitudes[i]
+
+        self._frames += count
+
+    # === LOOKUP ================================================================
+    def analyze(self, timestamp: float, interpolate: bool = True, out: Optional[Dict] = None) -> Dict:
+        """
+        Features of the frame at timestamp: the newest frame for timestamps that weren't
+        analyzed yet, the oldest kept frame for timestamps more than HISTORY seconds ago.
+        interpolate is ignored, frames of live input are shown as soon as they exist.
+        out is an optional dict of an earlier call to write into, like TrackAnalysis.analyze.
+        """
+        with self._lock:
+            frame = int(np.floor((timestamp * self.sample_rate - self.frame_size) / self.hop_size + 1e-6))
+            if frame < 0 or not self._frames:
+                return _copy_features(self.silence, out)
+            frame = min(max(frame, self._frames - self._capacity), self._frames - 1)
+            slot = frame % self._capacity
+
+            result = {} if out is None else out
+            for key, column in self._columns.items():
+                result[key] = float(column[slot])
+            result["is_silent"] = result["rms"] < SILENCE_THRESHOLD
+            result["is_beat"], result["beat_phase"] = self._beat_state(self._frame_time(frame), timestamp)
+            result["normalized_magnitudes"] = _normalized_magnitudes(self._magnitudes[slot], out)
+            result["bpm"] = self.bpm
+            result["sample_rate"] = self.sample_rate
+            return result
+
+    def _beat_state(self, frame_time: float, timestamp: float) -> Tuple[bool, float]:
+        """Whether a beat lies inside the window of the frame and the beat phase at timestamp"""
+        last = next((beat for beat in reversed(self._beats) if beat <= frame_time), None)
+        if last is None:
+            return False, 0.0
+        is_beat = last > frame_time - ANALYSIS_WINDOW
+        phase = float((max(timestamp, frame_time) - last) * self.bpm / 60 % 1.0) if self.bpm else 0.0
+        return bool(is_beat), phase
+
+    def segment_at(self, timestamp: float, duration: float, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Samples of the last HISTORY seconds, zero-padded where there are none (into out if given)"""
+        start = int(timestamp * self.sample_rate)
+        segment = np.zeros(int(duration * self.sample_rate), dtype=np.float32) if out is None else out
+        if out is not None:
+            segment.fill(0)
+        with self._lock:
+            lo = max(start, self._samples.written - self._samples.capacity)
+            hi = min(start + len(segment), self._samples.written)
+            if lo < hi:
+                segment[lo - start:hi - start] = self._samples.window(lo, hi)
+        return segment
+
+
+# === SOURCES ==================================================================
+class FileSource:
+    """An audio file replayed in real time: every block is yielded when it would have been recorded"""
+
+    def __init__(self, path: str, block_size: int = 1024, realtime: bool = True):
+        self.name = os.path.basename(path)
+        self.sample_rate, self.data = read_audio(path)
+        self.block_size = block_size
+        self.realtime = realtime
+        self.closed = False
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        start = time.monotonic()
+        for first in range(0, len(self.data), self.block_size):
+            if self.closed:
+                return
+            block = self.data[first:first + self.block_size]
+            if self.realtime:
+                delay = start + (first + len(block)) / self.sample_rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield block
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class WavStreamSource:
+    """A WAV stream from a pipe (or any binary file object), e.g. stdin"""
+
+    def __init__(self, stream, block_size: int = 1024, name: str = "stream"):
+        self.name = name
+        self.stream = stream
+        self.sample_rate, self.channels, self.dtype = read_wav_header(stream)
+        self.block_size = block_size
+        self.closed = False
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        frame_bytes = self.channels * self.dtype.itemsize
+        while not self.closed:
+            data = self.stream.read(self.block_size * frame_bytes)
+            usable = len(data) - len(data) % frame_bytes
+            if usable:
+                yield np.frombuffer(data[:usable], dtype=self.dtype).reshape(-1, self.channels)
+            if len(data) < self.block_size * frame_bytes:
+                return  # end of the stream
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class DeviceSource:
+    """Input of a sound card (ALSA, PulseAudio, CoreAudio, ... through PortAudio)"""
+
+    MAX_QUEUED = 64  # blocks buffered when the analysis falls behind, older ones are dropped
+
+    def __init__(self, device=None, sample_rate: int = 44100, channels: int = 1, block_size: int = 1024):
+        if sounddevice is None:
+            raise RuntimeError("sounddevice is not installed, it is needed for live input from a sound card")
+        self.name = str(device if device is not None else "default input")
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self.closed = False
+        self._blocks = queue.Queue(self.MAX_QUEUED)
+        self._stream = sounddevice.InputStream(device=device, channels=channels, samplerate=sample_rate,
+                                               blocksize=block_size, dtype="float32", callback=self._callback)
+
+    def _callback(self, indata, frames, time_info, status) -> None:
+        try:
+            self._blocks.put_nowait(indata.copy())
+        except queue.Full:
+            self.dropped += 1
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        self._stream.start()
+        try:
+            while not self.closed:
+                try:
+                    yield self._blocks.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+        finally:
+            self._stream.stop()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def open_source(spec: str, block_size: int = 1024, sample_rate: int = 44100):
+    """
+    Source of a LIVE_INPUT setting: 'device' or 'device:<name or index>' for a sound card,
+    '-' for a WAV stream on stdin, everything else is a file replayed in real time.
+    """
+    if spec == "-":
+        return WavStreamSource(sys.stdin.buffer, block_size, name="stdin")
+    if spec == "device" or spec.startswith("device:"):
+        device = spec[len("device:"):] or None
+        return DeviceSource(int(device) if device and device.isdigit() else device, sample_rate, block_size=block_size)
+    return FileSource(spec, block_size)
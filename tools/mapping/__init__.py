@@ -1,4 +1,6 @@
 from .base_mapper import BaseMapper
 from .scrolling_mapper import ScrollingMapper
 from .feelgood_mapper import FeelGoodMapper
-from .flowing_effects_mapper import FlowingEffectsMapper
\ No newline at end of file
+from .flowing_effects_mapper import FlowingEffectsMapper
+from .segment_mapper import SegmentMapper
+from .spectrum_mapper import SpectrumMapper
@@ -1,6 +1,12 @@
 import numpy as np
 
 class BaseMapper:
+    """
+    Turns analysis features into RGB frames. Subclasses override map_into and allocate
+    their buffers once instead of every frame, map is the same with the mapper's own output.
+    """
+    _in_map = False  # an overridden map is running (see map_into)
+
     def __init__(self, width, height):
         self.width = width
         self.height = height
@@ -9,6 +15,39 @@ class BaseMapper:
     def map(self, analysis_data):
         """
         Returns an (H, W, 3) RGB array based on the analysis data.
-        Should be overridden by subclasses.
+        The array belongs to the mapper and is overwritten by the next call.
+        """
+        return self.map_into(analysis_data, self.output)
+
+    def map_into(self, analysis_data, out):
+        """
+        Writes the (H, W, 3) uint8 RGB frame of the analysis data into out and returns it.
+        Older mappers that only override map still work, their frame is copied into out.
+        Their map may call super().map, which then gets the frame of BaseMapper instead of
+        calling the overridden map again.
+        """
+        if type(self).map is not BaseMapper.map and not self._in_map:
+            self._in_map = True
+            try:
+                frame = self.map(analysis_data)
+            finally:
+                self._in_map = False
+            np.copyto(out, frame)  # (1, W, 3) frames are repeated over the rows
+        elif out is not self.output:
+            out.fill(0)
+        return out
+
+    def settings(self):
+        """
+        Settings besides the canvas size that change the frames of the mapper, as JSON values.
+        They are stored with pre-rendered frames, which are only played with the same settings.
+        """
+        return {}
+
+    def warmup_frames(self):
+        """
+        Number of frames the mapper has to see before a frame to map it like in a continuous run:
+        0 for mappers without state, None if the state depends on every earlier frame.
+        The offline renderer uses it to render chunks of a track in parallel.
         """
-        return self.output
\ No newline at end of file
+        return None
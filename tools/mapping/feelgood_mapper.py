@@ -25,13 +25,11 @@ class FeelGoodMapper(BaseMapper):
 
     def __init__(self, width, height):
         super().__init__(width, height)
-        self.output = np.zeros((1, width, 3), dtype=np.uint8)
+        self.color = np.zeros(3)
 
         self.ALPHA = 0.1
     
-    def map(self, analysis_data):
-        print(analysis_data)
-        self.last_output = self.output.copy()
+    def map_into(self, analysis_data, out):
         # --- Available Features ------
         spectral_centroid = analysis_data["spectral_centroid"]
         loudness = analysis_data["rms"]
@@ -41,17 +39,22 @@ class FeelGoodMapper(BaseMapper):
 
         # --- Artists Part ------------
         centroid_color = int(np.clip(spectral_centroid / freq_range, 0, 255))
-        color = [spectral_centroid, loudness * 20 * 255, 255 - centroid_color]
+        color = self.color
+        color[:] = spectral_centroid, loudness * 20 * 255, 255 - centroid_color
 
         if is_beat:
-            color = [200, 200, 200]
-        
-        self.output[:] = color
-        self.output = (self.output / 20).astype(np.uint8)
+            color[:] = 200, 200, 200
+
+        np.clip(color, 0, 255, out=color)
+        np.floor_divide(color, 20, out=color)
 
         # --- Final Filter ------------
-        #self.output = lerp_frames(self.last_output, self.output, alpha=np.clip(0.5 + flux/10000, 0.1, 0.9))
-        return np.tile(self.output, (self.height, 1)) # return as 2d-array
+        #out[:] = lerp_frames(last_output, out, alpha=np.clip(0.5 + flux/10000, 0.1, 0.9))
+        out[:] = color  # the same on every pixel
+        return out
+
+    def warmup_frames(self):
+        return 0  # every frame is mapped from its features only
 
 
 # === HELP FUNCTIONS ============================================================
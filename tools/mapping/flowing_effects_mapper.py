@@ -8,45 +8,54 @@ from collections import deque
 # - mood more influence
 # ---
 class FlowingEffectsMapper(BaseMapper):
+    HISTORY_KEYS = ("bass", "mid", "high", "loudness", "centroid")
+
     def __init__(self, width, height=1, history_length=10):
         super().__init__(width, height)
         self.history = deque(maxlen=history_length)
+        self.history_sum = np.zeros(len(self.HISTORY_KEYS))  # rolling sum over self.history
         self.phase = 0.0  # Controls movement
-
-    def map(self, analysis_data):
+        self.beat_phase = 0.0
+        self.beat_decay = 0.0
+
+        # Per-pixel constants
+        self.positions = 2 * np.pi * np.arange(width) / width
+        self.pixels = np.arange(width, dtype=np.float64)
+
+        # Per-frame buffers, reused instead of allocated every frame
+        self.wave = np.zeros(width)
+        self.beat_wave = np.zeros(width)
+        self.rgb = np.zeros((3, width))  # one row per channel
+        self.rgb8 = np.zeros((3, width), dtype=np.uint8)
+        self.jitter = np.zeros(width)
+        self.jitter_x = np.zeros(width, dtype=np.intp)
+        self.rng = np.random.default_rng()
+
+    def map_into(self, analysis_data, out):
         width = self.width
-        output = np.zeros((1, width, 3), dtype=np.uint8)
 
         # === Audio Features ===
         bass = analysis_data["band_bass"]
         mid = analysis_data["band_mid"]
         high = analysis_data["band_high_mid"]
-        loudness = np.clip(analysis_data["rms"], 0.0, 1.0)
+        loudness = min(max(analysis_data["rms"], 0.0), 1.0)
         centroid = analysis_data["spectral_centroid"]
         flux = np.log1p(analysis_data["spectral_flux"])
         is_beat = analysis_data["is_beat"]
 
-        # === History
-        self.history.append({
-            "bass": bass,
-            "mid": mid,
-            "high": high,
-            "loudness": loudness,
-            "centroid": centroid
-        })
-
-        avg = lambda key: np.mean([h[key] for h in self.history])
+        # === History (averages from a rolling sum instead of iterating the deque)
+        entry = np.array([bass, mid, high, loudness, centroid], dtype=np.float64)
+        if len(self.history) == self.history.maxlen:
+            self.history_sum -= self.history[0]
+        self.history.append(entry)
+        self.history_sum += entry
+        avg_bass, avg_mid, avg_high, avg_loudness, avg_centroid = self.history_sum / len(self.history)
 
         # === Main wave phase (based on spectral centroid)
-        wave_speed = 0.2 + avg("centroid") / 5000.0
+        wave_speed = 0.2 + avg_centroid / 5000.0
         self.phase += wave_speed
 
         # === Beat phase (moves backwards on each beat)
-        if not hasattr(self, "beat_phase"):
-            self.beat_phase = 0.0
-        if not hasattr(self, "beat_decay"):
-            self.beat_decay = 0.0
-
         # Trigger counter-wave on beat
         if is_beat:
             self.beat_decay = 1.0  # full strength
@@ -55,40 +64,57 @@ class FlowingEffectsMapper(BaseMapper):
 
         self.beat_phase -= 0.6 * self.beat_decay  # backward movement
 
-        for x in range(width):
-            pos = x / width
-
-            # === Main wave (rightward)
-            main_wave = 0.5 + 0.5 * np.sin(2 * np.pi * pos + self.phase)
-
-            # === Beat wave (leftward)
-            beat_wave = 0.5 + 0.5 * np.sin(2 * np.pi * pos + self.beat_phase)
-
-            # === Blend both waves
-            wave = main_wave * (1.0 - self.beat_decay) + beat_wave * self.beat_decay
-
-            # === Audio-based RGB
-            r = int(np.clip((avg("high") + wave) * 128, 0, 255))
-            g = int(np.clip((avg("mid") + wave) * 128, 0, 255))
-            b = int(np.clip((avg("bass") + wave) * 128, 0, 255))
-
-            # === Brightness
-            brightness = np.clip((avg("loudness") * 3) ** 0.7, 0.05, 1.0)
-            color = np.array([r, g, b]) * brightness
-
-            if analysis_data["bpm"] != 0 and False:
-                bpm_color = bpm_to_color(analysis_data["bpm"])  # float RGB
-                # Am Ende bei der Farbmischung:
-                color = color / 255.0
-                color *= bpm_color  # modulate by BPM color
-                color = (color * 255).astype(np.uint8)
-
-            # === Flux jitter
-            flux_jitter = int(min(flux * 10, 5))
-            jitter = np.random.randint(-flux_jitter, flux_jitter + 1)
-            j_x = np.clip(x + jitter, 0, width - 1)
-
-            output[0, j_x] = np.clip(color, 0, 255)
+        # === Main wave (rightward) and beat wave (leftward) for all pixels at once
+        wave, beat_wave = self.wave, self.beat_wave
+        for buffer, phase in ((wave, self.phase), (beat_wave, self.beat_phase)):
+            np.add(self.positions, phase, out=buffer)
+            np.sin(buffer, out=buffer)
+            buffer *= 0.5
+            buffer += 0.5
+
+        # === Blend both waves
+        wave *= 1.0 - self.beat_decay
+        beat_wave *= self.beat_decay
+        wave += beat_wave
+
+        # === Audio-based RGB (truncated to integers like int() per pixel)
+        rgb = self.rgb
+        for channel, level in zip(rgb, (avg_high, avg_mid, avg_bass)):
+            np.add(wave, level, out=channel)
+        rgb *= 128
+        np.clip(rgb, 0, 255, out=rgb)
+        np.trunc(rgb, out=rgb)
+
+        # === Brightness
+        brightness = min(max((avg_loudness * 3) ** 0.7, 0.05), 1.0)
+        rgb *= brightness
+        color = rgb
+
+        if analysis_data["bpm"] != 0 and False:
+            bpm_color = bpm_to_color(analysis_data["bpm"])  # float RGB
+            # Am Ende bei der Farbmischung:
+            color = color / 255.0
+            color *= bpm_color  # modulate by BPM color
+            color = (color * 255).astype(np.uint8)
+
+        # === Flux jitter (one batch of random offsets, later pixels win like in a loop)
+        flux_jitter = int(min(flux * 10, 5))
+        row = out[0]
+        if flux_jitter > 0:
+            jitter = self.jitter
+            self.rng.random(out=jitter)  # uniform integers from -flux_jitter to flux_jitter
+            jitter *= 2 * flux_jitter + 1
+            np.floor(jitter, out=jitter)
+            jitter -= flux_jitter
+            jitter += self.pixels
+            np.clip(jitter, 0, width - 1, out=jitter)
+            self.jitter_x[:] = jitter
+            np.copyto(self.rgb8, color, casting="unsafe")
+            row.fill(0)  # pixels no other pixel jittered onto stay black
+            for c in range(3):
+                row[:, c][self.jitter_x] = self.rgb8[c]
+        else:
+            row[:] = color.T
 
         #if is_beat:
         #    strength = int(50 * avg("loudness"))
@@ -96,8 +122,8 @@ class FlowingEffectsMapper(BaseMapper):
         # linear mixing
         # output = (0.4 * self.output + 0.6 * output).astype(np.uint8)
 
-        self.output = output
-        return self.output.copy()
+        out[1:] = row  # the same on every row
+        return out
 
 def bpm_to_color(bpm):
     # Normalize BPM (assume typical range 60–180)
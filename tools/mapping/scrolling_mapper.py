@@ -6,14 +6,20 @@ class ScrollingMapper(BaseMapper):
     def __init__(self, width, height):
         super().__init__(width, height)
         self.scroll_x = 0
+        # Circular canvas, screen column s is canvas column (head + s) % width,
+        # so scrolling moves head instead of every pixel
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.head = 0
 
-    def map(self, analysis_data):
+    def map_into(self, analysis_data, out):
         # Scroll canvas left by 1 pixel
-        self.output[:, :-1] = self.output[:, 1:]
-        self.output[:, -1] = 0  # Clear new rightmost column
+        width = self.width
+        self.head = (self.head + 1) % width
+        self.canvas[:, (self.head - 1) % width] = 0  # Clear new rightmost column
 
         height = self.height
         x = self.width - 10  # Rightmost column
+        column = self.canvas[:, (self.head + x) % width]
 
         # === Feature Extraction ===
         bass = analysis_data["band_bass"]
@@ -31,13 +37,13 @@ class ScrollingMapper(BaseMapper):
         mid_y = int((1+mid)/2 * height)
         high_y = int((1+high)/2 * height)
 
-        self.output[bass_y, x] = [0, 0, 200]
-        self.output[mid_y, x] = [0, 200, 0]
-        self.output[high_y, x] = [200, 0, 0]
+        column[bass_y] = [0, 0, 200]
+        column[mid_y] = [0, 200, 0]
+        column[high_y] = [200, 0, 0]
 
         # === Beat detection: white vertical line ===
         if is_beat:
-            self.output[:int(height/4), x] = [255, 255, 255]
+            column[:int(height/4)] = [255, 255, 255]
 
         # === Loudness: Color bar from bottom based on spectral centroid ===
         bar_height = int(loudness * height)  # max at half screen
@@ -49,7 +55,7 @@ class ScrollingMapper(BaseMapper):
 
         # Fill the loudness bar with the calculated color
         if bar_height > 0:
-            self.output[height - bar_height:height, x] = color  # Gradient color
+            column[height - bar_height:height] = color  # Gradient color
 
         # === Spectral Flux: Blue bar from bottom with 1/4 max height ===
         normalized_flux = np.log1p(spectral_flux)
@@ -57,13 +63,20 @@ class ScrollingMapper(BaseMapper):
 
         # Blue bar for spectral flux
         if flux_height > 0:
-            self.output[height - flux_height: height, x] = [0, 255, 255]  # Blue
+            column[height - flux_height: height] = [0, 255, 255]  # Blue
 
-        vis_output = self.output.copy()
+        # Unroll the canvas into out
+        out[:, :width - self.head] = self.canvas[:, self.head:]
+        out[:, width - self.head:] = self.canvas[:, :self.head]
 
         # Add highlight to indicate current
-        vis_output[:, x] = np.clip(vis_output[:, x] + 40, 0, 255)  # Brighten
-        vis_output[0, x] = [255, 255, 0]  # Yellow top
-        vis_output[-1, x] = [255, 255, 0]  # Yellow bottom
+        highlight = out[:, x]
+        np.minimum(highlight, 255 - 40, out=highlight)  # Brighten, saturating at 255 without a temporary
+        highlight += 40
+        out[0, x] = [255, 255, 0]  # Yellow top
+        out[-1, x] = [255, 255, 0]  # Yellow bottom
 
-        return vis_output
+        return out
+
+    def warmup_frames(self):
+        return self.width  # every column has scrolled out after width frames
@@ -0,0 +1,43 @@
+import numpy as np
+from tools.mapping import BaseMapper
+
+
+class SegmentMapper(BaseMapper):
+    """
+    Draws regions of the canvas with mappers of their own, e.g. a flowing effect on a
+    strip and scrolling bands on a matrix. Segments come from Config.SEGMENTS:
+    [{'region': (x, y, width, height), 'mapper': FlowingEffectsMapper}, ...],
+    later segments are drawn over earlier ones, the rest of the canvas stays black.
+    """
+
+    def __init__(self, width, height, segments=None):
+        super().__init__(width, height)
+        if segments is None:
+            from config import Config
+            segments = Config.SEGMENTS or []
+
+        self.segments = []
+        covered = np.zeros((height, width), dtype=bool)
+        for segment in segments:
+            x, y, w, h = segment['region']
+            if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > width or y + h > height:
+                raise ValueError(f"Segment {tuple(segment['region'])} is not inside the canvas of {width}x{height}")
+            self.segments.append((slice(y, y + h), slice(x, x + w), segment['mapper'](w, h)))
+            covered[y:y + h, x:x + w] = True
+        self.covers_canvas = bool(covered.all())
+
+    def map_into(self, analysis_data, out):
+        if not self.covers_canvas:
+            out.fill(0)
+        for rows, columns, mapper in self.segments:
+            mapper.map_into(analysis_data, out[rows, columns])  # drawn right into the region
+        return out
+
+    def settings(self):
+        return {"segments": [{"region": [columns.start, rows.start, columns.stop - columns.start, rows.stop - rows.start],
+                              "mapper": type(mapper).__name__, "settings": mapper.settings()}
+                             for rows, columns, mapper in self.segments]}
+
+    def warmup_frames(self):
+        frames = [mapper.warmup_frames() for _, _, mapper in self.segments]
+        return None if None in frames else max(frames, default=0)
@@ -0,0 +1,79 @@
+import numpy as np
+from tools.mapping import BaseMapper
+from tools.analysis import ANALYSIS_WINDOW
+
+
+class SpectrumMapper(BaseMapper):
+    """
+    Spectrum analyzer with one bar per column of the canvas (per LED on a strip). The bars are the
+    band energies of a log, mel or Bark filterbank (Config.SPECTRUM_SCALE) over the normalized
+    magnitudes, computed with one sparse matrix product per frame. On a strip the level of a band
+    is the brightness of its LED, on a matrix the bars grow upwards. Bars fall slowly like on a hi-fi.
+    """
+    DB_RANGE = 60  # dB below the loudest bin that are still shown
+    DECAY = 0.85  # of the bars per frame while they fall
+    FMIN = 30  # Hz, lower end of the first band
+
+    def __init__(self, width, height, scale=None):
+        super().__init__(width, height)
+        if scale is None:
+            from config import Config
+            scale = Config.SPECTRUM_SCALE
+        self.scale = scale
+        self.plan = None  # built from the first spectrum, it depends on the sample rate
+        self.levels = np.zeros(width, dtype=np.float32)
+
+        # Red for the lowest band to violet for the highest, one (height, width) plane per channel
+        hue = np.linspace(0, 0.8, width)[:, None] * 6 + np.array([0, 4, 2])
+        colors = np.clip(np.abs(hue % 6 - 3) - 1, 0, 1).astype(np.float32) * 255
+        self.colors = np.ascontiguousarray(np.broadcast_to(colors.T[:, None], (3, height, width)))
+        self.rows = (height - 1 - np.arange(height)).tolist()  # bar height below each row
+
+        # Per-frame buffers, every operation on them has operands of one shape and type
+        self._new_levels = np.zeros(width, dtype=np.float32)
+        self._bars = np.zeros(width, dtype=np.float32)
+        self._fill = np.zeros((height, width), dtype=np.float32)
+        self._rgb = np.zeros((3, height, width), dtype=np.float32)
+        self._power = None
+
+    def _plan_for(self, n_bins, sample_rate):
+        from tools.analysis.filterbank import SpectralPlan
+        frame_size = int(ANALYSIS_WINDOW * sample_rate)
+        if frame_size // 2 != n_bins:
+            frame_size = 2 * n_bins
+        return SpectralPlan(frame_size, sample_rate, self.scale, self.width, fmin=self.FMIN, normalize=True)
+
+    def map_into(self, analysis_data, out):
+        magnitudes = analysis_data["normalized_magnitudes"]
+        sample_rate = analysis_data.get("sample_rate")
+        levels = self._new_levels
+        levels.fill(0)
+        if len(magnitudes) and sample_rate:
+            if self.plan is None or self.plan.n_bins != len(magnitudes) or self.plan.sample_rate != sample_rate:
+                self.plan = self._plan_for(len(magnitudes), sample_rate)
+                self._power = np.zeros(len(magnitudes), dtype=np.float32)
+            energies = self.plan.band_energies(magnitudes, self._power)
+            energies += 1e-12
+            np.log10(energies, out=energies)
+            energies *= 10 / self.DB_RANGE
+            levels[:] = energies
+            levels += 1
+        np.clip(levels, 0, 1, out=levels)
+        self.levels *= self.DECAY
+        np.maximum(levels, self.levels, out=self.levels)
+
+        # Fraction of every pixel covered by its bar (the top pixel of a bar is dimmed)
+        np.multiply(self.levels, self.height, out=self._bars)
+        for row, below in zip(self._fill, self.rows):
+            np.subtract(self._bars, below, out=row)
+        np.clip(self._fill, 0, 1, out=self._fill)
+        for channel, color in zip(self._rgb, self.colors):
+            np.multiply(self._fill, color, out=channel)
+        np.copyto(out, self._rgb.transpose(1, 2, 0), casting="unsafe")
+        return out
+
+    def settings(self):
+        return {"scale": self.scale}
+
+    def warmup_frames(self):
+        return int(np.ceil(np.log(1 / 255) / np.log(self.DECAY)))  # until a bar has fallen to black
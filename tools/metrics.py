@@ -0,0 +1,130 @@
+"""
+Metrics
+---
+
+Low-overhead runtime metrics of the visualizer (time per stage, frame rate,
+dropped frames, sync error, analysis cache hits), rendered in the Prometheus
+text format at `/api/metrics`.
+
+Recording a value is a bisect and a few additions under a lock, metrics that
+already exist elsewhere (e.g. the frame counters of the `FrameScheduler`) are
+read by callbacks only when the metrics are rendered. With `enabled = False`
+(`METRICS_ENABLED` in the `config.py`) nothing is recorded.
+"""
+
+import bisect
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+# Upper bounds of the histogram buckets in seconds, from a mapped frame to the analysis of a whole song
+SECONDS_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, registry: "Metrics", buckets: Tuple[float, ...]):
+        self.registry = registry
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name: str, labels: str):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket in zip((*self.buckets, "+Inf"), counts):
+            cumulative += bucket
+            le = 'le="%s"' % bound
+            yield f"{name}_bucket{_labels(labels, le)} {cumulative}"
+        yield f"{name}_sum{_labels(labels)} {total}"
+        yield f"{name}_count{_labels(labels)} {count}"
+
+
+class Counter:
+    def __init__(self, registry: "Metrics"):
+        self.registry = registry
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name: str, labels: str):
+        yield f"{name}{_labels(labels)} {self.value}"
+
+
+class Callback:
+    """Counter or gauge whose value is read when the metrics are rendered"""
+
+    def __init__(self, function: Callable[[], float]):
+        self.function = function
+
+    def samples(self, name: str, labels: str):
+        try:
+            value = self.function()
+        except Exception:
+            return  # e.g. the visualizer isn't running
+        if value is not None:
+            yield f"{name}{_labels(labels)} {float(value)}"
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._families: Dict[str, Tuple[str, str, Dict[str, object]]] = {}  # name -> (type, help, {labels: metric})
+
+    def _get(self, kind: str, name: str, help: str, labels: Dict[str, str], create):
+        key = ",".join(f'{label}="{value}"' for label, value in sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help, {}))
+            if family[0] != kind:
+                raise ValueError(f"Metric {name} is a {family[0]}, not a {kind}")
+            if key not in family[2]:
+                family[2][key] = create()
+            return family[2][key]
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels) -> Histogram:
+        return self._get("histogram", name, help, labels, lambda: Histogram(self, buckets))
+
+    def counter(self, name: str, help: str, **labels) -> Counter:
+        return self._get("counter", name, help, labels, lambda: Counter(self))
+
+    def callback(self, kind: str, name: str, help: str, function: Callable[[], Optional[float]], **labels) -> None:
+        """Registers (or replaces) a counter or gauge read from function"""
+        callback = self._get(kind, name, help, labels, lambda: Callback(function))
+        callback.function = function
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format"""
+        with self._lock:
+            families = [(name, kind, help, list(metrics.items())) for name, (kind, help, metrics) in sorted(self._families.items())]
+        lines = []
+        for name, kind, help, metrics in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in metrics:
+                lines.extend(metric.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+def _labels(*labels: str) -> str:
+    labels = ",".join(label for label in labels if label)
+    return f"{{{labels}}}" if labels else ""
+
+
+metrics = Metrics()  # of this process
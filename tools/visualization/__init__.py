@@ -1,7 +1,10 @@
+from .frame_scheduler import FrameScheduler
+from .pipeline import FrameRing, FramePipeline
 from .base_visualizer import BaseVisualizer
-from .pygame_visualizer import PygameVisualizer
+from .pygame_visualizer import PygameOutput, PygameVisualizer
+from .bus_visualizer import BusVisualizer
 
 try:
-    from .led_visualizer import LEDVisualizer
+    from .led_visualizer import LEDOutput, LEDVisualizer
 except:
     print("NeoPixel not installed. This is only an error if you want to use the LEDVisualizer")
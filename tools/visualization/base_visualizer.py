@@ -1,13 +1,27 @@
 import os
 import time
 import threading
-import scipy.io.wavfile as wav
-from tools.analysis import analyze_segment, set_audio
+import numpy as np
+from tools.analysis.cache import AnalysisCache, analyze_file
+from tools.analysis.streaming import StreamingAnalyzer
+from tools.metrics import metrics
+from tools.visualization.frame_scheduler import FrameScheduler
+from tools.visualization.pipeline import FramePipeline
+from tools.visualization.frame_file import FrameFile, render_meta, frame_file_path
 
 class BaseVisualizer:
+    MAX_TRANSIT_TIME = 2.0  # status messages older than this are stamped with their arrival instead
+
     def __init__(self):
         from config import Config
         self.music_folder = Config.MUSIC_FOLDER
+        self.audio_extensions = Config.AUDIO_EXTENSIONS
+        self.analysis_cache = None
+        if Config.ANALYSIS_CACHE_FOLDER:
+            self.analysis_cache = AnalysisCache(Config.ANALYSIS_CACHE_FOLDER, Config.ANALYSIS_CACHE_MAX_MB * 1024 * 1024)
+        self.pre_analyzer = None  # optional tools.analysis.pre_analysis.PreAnalyzer
+        self.render_folder = Config.RENDER_FOLDER
+        self.fps = Config.TARGET_FPS
 
         self.song_name = None
         self.song_pos = 0.0
@@ -17,45 +31,182 @@ class BaseVisualizer:
 
         self.thread = None
         self.elapsed_time = None
+        self.output_latency = Config.VISUALIZER_LATENCY
+        self.scheduler = FrameScheduler(Config.TARGET_FPS)
+        self.pipeline = FramePipeline(self, Config.TARGET_FPS, Config.VISUALIZER_LOOKAHEAD)
 
         self.music_file = None
         self.sample_rate = None
+        self.track = None  # TrackAnalysis of the current song (StreamingAnalyzer of live input), replaced as a whole
+        self.live = None  # source of the live input while listening to one
+        self.frame_file = None  # pre-rendered frames of the current song, played instead of analyzing and mapping
+        self._song_generation = 0
 
         self.width, self.height = 0, 0
         self.mapper = None
+        self._features = {}  # feature dict and frame the render stage writes into every frame
+        self._frame = None
+
+        # === Metrics (/api/metrics)
+        stage = lambda name: metrics.histogram("jamplay_stage_seconds", "Time per visualizer stage", stage=name)
+        self._load_time, self._analyze_time, self._map_time = stage("load"), stage("analyze"), stage("map")
+        self._output_time, self._live_time = stage("output"), stage("live_analysis")
+        self._sync_error = metrics.histogram("jamplay_sync_error_seconds", "Distance between the reported song position and the one the visualizer extrapolated")
+        self._missing = metrics.counter("jamplay_visualizer_missing_frames_total", "Frames due while playing that weren't rendered in time")
+        metrics.callback("gauge", "jamplay_visualizer_fps", "Achieved frame rate of the output loop", lambda: self.scheduler.stats()["fps"] if self.running else None)
+        metrics.callback("counter", "jamplay_visualizer_frames_total", "Frames of the output loop", lambda: self.scheduler.frames)
+        metrics.callback("counter", "jamplay_visualizer_dropped_frames_total", "Frames skipped because the output loop overran", lambda: self.scheduler.dropped)
+        metrics.callback("counter", "jamplay_pipeline_resyncs_total", "Times the pipeline restarted at the playback position", lambda: self.pipeline.resyncs)
     
     def set_song_file(self):
-        try: 
-            path = os.path.join(self.music_folder, self.song_name + ".wav")
-            self.sample_rate, self.music_file = wav.read(path)
-            
-            set_audio(self.music_file, self.sample_rate)
-            if self.mapper:
-                self.mapper.__init__(self.mapper.width, self.mapper.height)
-        except:
+        """
+        Loads the analysis of the current song in a background thread,
+        so neither the request nor the visualization loop has to wait for it.
+        """
+        self.track = None
+        self.frame_file = None
+        self._song_generation += 1
+        loader = threading.Thread(target=self._load_song, args=(self.song_name, self._song_generation), daemon=True)
+        loader.start()
+
+    def _load_song(self, song_name, generation):
+        try:
+            path = self.find_song_file(song_name)
+            if self.pre_analyzer and self.pre_analyzer.running(path):
+                self.pre_analyzer.wait(path)  # already analyzed in the background, don't do it twice
+
+            start = time.perf_counter()
+            track = analyze_file(path, self.analysis_cache)
+            self._load_time.observe(time.perf_counter() - start)
+            if generation != self._song_generation:
+                return  # song changed in the meantime
+
+            self.music_file = path
+            self.sample_rate = track.sample_rate
+            self.frame_file = self.find_frame_file(song_name)
+            self.track = track
+        except Exception as e:
+            print(f"Could not load analysis for {song_name}: {e}")
             self.music_file = None
         
     
+    def find_song_file(self, song_name):
+        """
+        Path of the song in the music folder, in the first format of AUDIO_EXTENSIONS it exists in.
+        """
+        for extension in self.audio_extensions:
+            path = os.path.join(self.music_folder, song_name + extension)
+            if os.path.exists(path):
+                return path
+        raise FileNotFoundError(f"{song_name} is not in the music folder")
+
+    def find_frame_file(self, song_name):
+        """
+        Frame file of the offline renderer for the song and the mapper of the visualizer, None if there is none.
+        """
+        if not self.render_folder or self.mapper is None:
+            return None
+        path = frame_file_path(self.render_folder, song_name, type(self.mapper).__name__)
+        if not os.path.exists(path):
+            return None
+        try:
+            frame_file = FrameFile(path)
+        except (OSError, ValueError) as e:
+            print(f"Could not open frame file {path}: {e}")
+            return None
+        if frame_file.shape != self.mapper.output.shape:
+            print(f"Frame file {path} has frames of {frame_file.shape}, the mapper {self.mapper.output.shape}. Render it again")
+            return None
+        meta = render_meta(self.mapper, self.fps)
+        if frame_file.meta != meta:
+            print(f"Frame file {path} was rendered with {frame_file.meta}, the visualizer runs with {meta}. Render it again")
+            return None
+        return frame_file
+
     def update(self, data_dict):
         """
         Updates the song metadata for visualization.
+
+        Clients that synchronized their clock with `server_time()` also send the time
+        the position was read (`time`, seconds on the client clock), their
+        `clock_offset` to the server clock and the `output_latency` of their audio
+        device, so the position can be extrapolated from the moment it was read
+        instead of the moment it arrived.
+
+        Ignored while listening to live input.
         """ 
+        if self.live is not None:
+            return
+        received = self.server_time()
+        sent = received
+        if data_dict.get("clock_offset") is not None and data_dict.get("time") is not None:
+            sent = float(data_dict["time"]) + float(data_dict["clock_offset"])
+            if not received - self.MAX_TRANSIT_TIME <= sent <= received:
+                sent = received  # clocks are out of sync, don't trust the timestamp
 
-        self.song_pos = float(data_dict["position"])
+        position = float(data_dict["position"]) - float(data_dict.get("output_latency") or 0.0)
+        if self.song_playing and data_dict["playing"] and self.song_name == str(data_dict["name"]):
+            self._sync_error.observe(abs(self.song_pos + sent - self.song_timestamp - position))
+
+        self.song_pos = position
         self.song_playing = bool(data_dict["playing"])
-        self.song_timestamp = time.time() 
+        self.song_timestamp = sent
 
         if self.song_name != str(data_dict["name"]):
             self.song_name = str(data_dict["name"])
             self.song_pos = 0.0  # Reset position when switching songs
             self.set_song_file()
     
+    def listen(self, source):
+        """
+        Visualizes live input instead of the songs of the player, source is one
+        of tools.analysis.streaming (e.g. open_source(Config.LIVE_INPUT)).
+        """
+        self.stop_listening()
+        analyzer = StreamingAnalyzer(source.sample_rate)
+        self._song_generation += 1  # a song that is still loading must not replace the live input
+
+        self.live = source
+        self.frame_file = None
+        self.song_name = f"Live: {source.name}"
+        self.music_file = None
+        self.sample_rate = source.sample_rate
+        self.song_pos = 0.0
+        self.song_timestamp = self.server_time()  # the position runs with the clock, the analyzer follows it
+        self.song_playing = True
+        self.track = analyzer
+        threading.Thread(target=self._listen, args=(source, analyzer), daemon=True).start()
+
+    def _listen(self, source, analyzer):
+        try:
+            for block in source:
+                if self.live is not source:
+                    break
+                start = time.perf_counter()
+                analyzer.feed(block)
+                self._live_time.observe(time.perf_counter() - start)
+        except Exception as e:
+            print(f"Live input {source.name} failed: {e}")
+        if self.live is source:
+            self.live = None
+            self.song_playing = False
+
+    def stop_listening(self):
+        """
+        Ends the live input, the visualizer follows the player again.
+        """
+        source, self.live = self.live, None
+        if source is not None:
+            source.close()
+            self.song_playing = False
+
     def start(self):
         """
         Starts the visualization in a separate thread.
         """
         if not self.running:
             self.running = True
+            self.scheduler.reset()
             self.thread = threading.Thread(target=self.visualize, daemon=True)
             self.thread.start()
     
@@ -67,29 +218,90 @@ class BaseVisualizer:
         if self.thread:
             self.thread.join()
     
+    def output_position(self):
+        """
+        Song position that should be visible right now, None while nothing is playing.
+        """
+        if not (self.song_name and self.song_playing and self.track is not None):
+            return None
+        return self.server_time() - self.song_timestamp + self.song_pos + self.output_latency
+
+    @staticmethod
+    def server_time():
+        """
+        Clock used for the position extrapolation, shared with the clients via /api/clock.
+        """
+        return time.monotonic()
+
+    def reset_mapper(self):
+        """
+        Clears the state of the mapper, called by the pipeline when the song changed.
+        """
+        if self.mapper:
+            self.mapper.__init__(self.mapper.width, self.mapper.height)
+
+    def render(self, track, timestamp):
+        """
+        Analysis and mapping stage, returns the frame for the timestamp (or None).
+        The frame is overwritten by the next call, the pipeline copies it into its ring.
+        """
+        if self.mapper is None:
+            return None
+        frame_file = self.frame_file
+        if frame_file is not None and track is self.track:
+            return frame_file.frame_at(timestamp)
+        start = time.perf_counter()
+        analysis_data = track.analyze(timestamp, out=self._features)
+        mapped = time.perf_counter()
+        if self._frame is None or self._frame.shape != self.mapper.output.shape:
+            self._frame = np.zeros_like(self.mapper.output)
+        frame = self.mapper.map_into(analysis_data, self._frame)
+        self._analyze_time.observe(mapped - start)
+        self._map_time.observe(time.perf_counter() - mapped)
+        return frame
+
+    def handle_events(self):
+        """
+        Called once per frame by the output stage, returns False to end the visualization.
+        """
+        return True
+
+    def show(self, frame):
+        """
+        Output stage, frame is None while nothing is playing.
+        """
+        pass
+
+    def close(self):
+        """
+        Called after the visualization loop ended.
+        """
+        pass
+
     def visualize(self):
         """
-        Runs the visualization loop in a separate thread.
+        Runs the output stage of the visualization in a separate thread,
+        analysis and mapping run ahead in the thread of the pipeline.
         """
-        previous_segment = None  # Placeholder for audio segment caching
-        
-        while self.running:
-            # Display song info
-            if self.song_name:
-                #print(f"Now Playing: {self.song_name}")
-                
-                if self.song_playing:
-                    self.elapsed_time = time.time() - (self.song_timestamp) + self.song_pos
-                #time_text = f"Time: {self.elapsed_time:.2f} sec"
-                #print(time_text)
-
-
-                if self.music_file is not None:
-                    # Perform Analysis at current tiemstamp
-                    analysis_data = analyze_segment(self.elapsed_time)
-                    print("Current Analysis Data:")
-                    for key, value in analysis_data.items():
-                        print(f"{key}: {value}")
-            
-            time.sleep(0.1)  # Avoid maxing out the CPU
+        self.pipeline.start()
+
+        while self.running and self.handle_events():
+            position = self.output_position()
+            if position is not None:
+                self.elapsed_time = position
 
+            try:
+                frame = self.pipeline.frame_at(position)
+                if frame is None and position is not None:
+                    self._missing.inc()
+                start = time.perf_counter()
+                self.show(frame)
+                self._output_time.observe(time.perf_counter() - start)
+            except Exception as e:
+                print(e)
+
+            self.scheduler.wait()
+
+        self.running = False
+        self.pipeline.stop()
+        self.close()
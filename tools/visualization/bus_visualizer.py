@@ -0,0 +1,33 @@
+import numpy as np
+from tools.visualization import BaseVisualizer
+from tools.visualization.frame_bus import FrameBus
+from tools.mapping import *
+
+class BusVisualizer(BaseVisualizer):
+    """
+    Analyzes and maps like every visualizer, but publishes the frames on a shared memory
+    FrameBus instead of owning an output device. The devices run in processes of their
+    own, any number of them at once: python -m tools.visualization.outputs pygame|led|record
+    """
+
+    def __init__(self, width, height, mapper_cls=BaseMapper):
+        super().__init__()
+        from config import Config
+
+        self.width = width
+        self.height = height
+        self.mapper = mapper_cls(width, height)
+        self.bus = FrameBus(Config.FRAME_BUS, height, width, Config.FRAME_BUS_CAPACITY)
+        self._blank = np.zeros((height, width, 3), dtype=np.uint8)
+        self._idle = False
+
+    def show(self, frame):
+        if frame is None:
+            if self._idle:
+                return  # the outputs still show the black frame
+            frame = self._blank
+        self._idle = frame is self._blank
+        self.bus.put(self.server_time(), frame, np.nan if self._idle else self.elapsed_time)
+
+    def close(self):
+        self.bus.close()
@@ -0,0 +1,250 @@
+"""
+Frame Bus
+---
+
+A ring of mapped RGB frames in shared memory, written by one visualizer process
+and read by any number of output processes (LED strip, pygame window,
+recorder, see `outputs.py`). An output that crashes or blocks doesn't affect
+the analysis, the web server or the other outputs.
+
+Layout of the shared memory block:
+- header: magic number, capacity, frame height and width, frames written so far,
+  a random generation of the block and whether its writer closed it
+- per slot: sequence number, timestamp (monotonic clock, when the frame was
+  published), song position and the frame itself (height x width x 3 bytes)
+
+Every slot is guarded by a sequence lock: the writer makes the sequence number
+odd before it writes a slot and even again afterwards. A reader that saw the
+same even number before and after using a slot knows the frame was complete
+and unchanged, so readers never block the writer. Frames can be used as
+zero-copy NumPy views into the shared memory (`view` + `unchanged`) or copied
+into a buffer of the reader (`read`).
+
+A writer that restarts (e.g. after a crash) creates a new block under the same
+name. Readers notice it while they wait for frames, because the old block is
+marked closed or another generation is found under the name, and attach to the
+new block. Their frame numbers keep counting on from the old one.
+"""
+
+import time
+import secrets
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+MAGIC = 0x4A414D42  # "JAMB"
+HEADER_SIZE = 64
+_MAGIC, _CAPACITY, _HEIGHT, _WIDTH, _HEAD, _GENERATION, _CLOSED = range(7)
+READ_RETRIES = 8  # attempts to read a slot the writer is writing at the same time
+REATTACH_INTERVAL = 1.0  # seconds without frames after which a reader checks for a new writer
+
+
+def _layout(buffer, capacity: int, height: int, width: int):
+    """Header, sequence numbers, timestamps, positions and frames as views of the shared memory"""
+    offset = HEADER_SIZE
+    seqs = np.ndarray(capacity, dtype=np.uint64, buffer=buffer, offset=offset)
+    offset += seqs.nbytes
+    timestamps = np.ndarray(capacity, dtype=np.float64, buffer=buffer, offset=offset)
+    offset += timestamps.nbytes
+    positions = np.ndarray(capacity, dtype=np.float64, buffer=buffer, offset=offset)
+    offset += positions.nbytes
+    frames = np.ndarray((capacity, height, width, 3), dtype=np.uint8, buffer=buffer, offset=offset)
+    return seqs, timestamps, positions, frames
+
+
+def _size(capacity: int, height: int, width: int) -> int:
+    return HEADER_SIZE + capacity * (24 + height * width * 3)
+
+
+class FrameBus:
+    """Writer side, creates the shared memory block"""
+
+    def __init__(self, name: str, height: int, width: int, capacity: int = 8):
+        self.name = name
+        self.shape = (height, width, 3)
+        self.capacity = capacity
+        try:
+            self._memory = shared_memory.SharedMemory(name, create=True, size=_size(capacity, height, width))
+        except FileExistsError:
+            # left over from a writer that crashed, its readers move to the new block
+            stale = shared_memory.SharedMemory(name)
+            if stale.size >= HEADER_SIZE:
+                np.ndarray(HEADER_SIZE // 8, dtype=np.int64, buffer=stale.buf)[_CLOSED] = 1
+            stale.close()
+            stale.unlink()
+            self._memory = shared_memory.SharedMemory(name, create=True, size=_size(capacity, height, width))
+
+        self._header = np.ndarray(HEADER_SIZE // 8, dtype=np.int64, buffer=self._memory.buf)
+        self._seqs, self._timestamps, self._positions, self._frames = _layout(self._memory.buf, capacity, height, width)
+        self._seqs[:] = 0
+        self._header[:] = 0
+        self._header[[_CAPACITY, _HEIGHT, _WIDTH]] = capacity, height, width
+        self._header[_GENERATION] = secrets.randbits(62)
+        self._header[_MAGIC] = MAGIC  # written last, readers check it
+
+    @property
+    def written(self) -> int:
+        return int(self._header[_HEAD])
+
+    def put(self, timestamp: float, frame: np.ndarray, position: float = np.nan) -> None:
+        """Publish a frame, position is the song position it shows"""
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame of shape {frame.shape} doesn't fit the frame bus {self.shape}")
+        head = int(self._header[_HEAD])
+        slot = head % self.capacity
+        self._seqs[slot] += 1  # odd: being written
+        self._frames[slot] = frame
+        self._timestamps[slot] = timestamp
+        self._positions[slot] = position
+        self._seqs[slot] += 1
+        self._header[_HEAD] = head + 1
+
+    def close(self) -> None:
+        """Remove the frame bus, attached readers keep their mapping until a new writer starts"""
+        self._header[_CLOSED] = 1
+        self._header = self._seqs = self._timestamps = self._positions = self._frames = None
+        self._memory.close()
+        self._memory.unlink()
+
+
+class FrameBusReader:
+    """Reader side, attaches to the shared memory block of a running FrameBus"""
+
+    def __init__(self, name: str, timeout: float = 10.0):
+        self.name = name
+        self._memory = None
+        self._base = 0  # frames of the blocks of earlier writers
+        self._attach(timeout)
+        self._checked = time.monotonic()
+
+    def _attach(self, timeout: float) -> None:
+        """Attach to the block under the name, waiting up to timeout for a writer to create and initialize it"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                memory = _attach(self.name)
+                header = np.ndarray(HEADER_SIZE // 8, dtype=np.int64, buffer=memory.buf) if memory.size >= HEADER_SIZE else None
+                if header is not None and header[_MAGIC] == MAGIC and not header[_CLOSED]:
+                    break
+                header = None
+                memory.close()  # created but not initialized yet (or closed), the magic number is written last
+                error = ValueError(f"{self.name} is not a frame bus")
+            except FileNotFoundError:
+                error = FileNotFoundError(f"No frame bus {self.name}, is the BusVisualizer running?")
+            if time.monotonic() >= deadline:
+                raise error
+            time.sleep(0.1)
+
+        if self._memory is not None:
+            self._base = self.written
+            self.close()
+        self._memory = memory
+        self._header = header
+        self.generation = int(header[_GENERATION])
+        self.capacity, height, width = (int(value) for value in header[[_CAPACITY, _HEIGHT, _WIDTH]])
+        self.shape = (height, width, 3)
+        self._seqs, self._timestamps, self._positions, self._frames = _layout(memory.buf, self.capacity, height, width)
+
+    def _replaced(self) -> bool:
+        """True if the writer closed the block or another block is under the name now"""
+        if self._header[_CLOSED]:
+            return True
+        try:
+            memory = _attach(self.name)
+        except FileNotFoundError:
+            return False  # the writer crashed and no new one started yet
+        try:
+            if memory.size < HEADER_SIZE:
+                return False
+            header = np.ndarray(HEADER_SIZE // 8, dtype=np.int64, buffer=memory.buf)
+            replaced = header[_MAGIC] == MAGIC and int(header[_GENERATION]) != self.generation
+            del header
+            return replaced
+        finally:
+            memory.close()
+
+    @property
+    def written(self) -> int:
+        """
+        Number of frames published so far, frame n is in slot (n - base) % capacity until it is overwritten.
+        Counts on over writer restarts.
+        """
+        return self._base + int(self._header[_HEAD])
+
+    def wait(self, seen: int, timeout: Optional[float] = None, interval: float = 0.001) -> int:
+        """
+        Wait until more than seen frames were published, returns written (seen again after the timeout).
+        Moves to the block of a restarted writer, the shape of the frames may change then.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            written = self.written
+            now = time.monotonic()
+            if written > seen:
+                self._checked = now
+                return written
+            if now - self._checked >= REATTACH_INTERVAL:
+                self._checked = now
+                if self._replaced():
+                    try:
+                        self._attach(0.0)
+                    except (FileNotFoundError, ValueError):
+                        pass  # the new writer isn't ready yet, checked again later
+                    continue
+            if deadline is not None and now >= deadline:
+                return written
+            time.sleep(interval)
+
+    # === ZERO-COPY =============================================================
+    def view(self, n: Optional[int] = None) -> Optional[Tuple[np.ndarray, float, float, int]]:
+        """
+        (frame view, timestamp, position, token) of frame n (the newest by default),
+        None if it was overwritten or nothing was published yet. The view stays valid
+        as long as unchanged(n, token) is True, check it after using the frame.
+        """
+        written = self.written
+        n = written - 1 if n is None else n
+        if n < max(written - self.capacity, self._base) or n >= written:
+            return None
+        local = n - self._base
+        slot = local % self.capacity
+        seq = int(self._seqs[slot])
+        if seq % 2 or seq != 2 * (local // self.capacity + 1):
+            return None  # being written or already a newer frame
+        return self._frames[slot], float(self._timestamps[slot]), float(self._positions[slot]), seq
+
+    def unchanged(self, n: int, token: int) -> bool:
+        return int(self._seqs[(n - self._base) % self.capacity]) == token
+
+    # === COPY ==================================================================
+    def read(self, out: np.ndarray, n: Optional[int] = None) -> Optional[Tuple[float, float]]:
+        """
+        Copy frame n (the newest by default) into out, returns its (timestamp, position),
+        None if it was overwritten or nothing was published yet.
+        """
+        for _ in range(READ_RETRIES):
+            index = self.written - 1 if n is None else n
+            entry = self.view(index)
+            if entry is not None:
+                frame, timestamp, position, token = entry
+                np.copyto(out, frame)
+                if self.unchanged(index, token):
+                    return timestamp, position
+            if n is not None and index < self.written - self.capacity:
+                return None  # overwritten, it won't come back
+        return None
+
+    def close(self) -> None:
+        self._header = self._seqs = self._timestamps = self._positions = self._frames = None
+        self._memory.close()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach without registering the block at the resource tracker, which would remove it when the reader exits"""
+    try:
+        return shared_memory.SharedMemory(name, track=False)  # Python 3.13+
+    except TypeError:
+        from multiprocessing import resource_tracker
+        memory = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
@@ -0,0 +1,57 @@
+"""
+Frame File
+---
+
+Frames of a track stored ahead of time, written by the offline renderer
+(`offline.py`) or the recorder of `outputs.py`: a `.npy` file of shape
+(frames, height, width, 3) and `<name>.times.npy` with the timestamp (only
+known for recordings) and song position of every frame. Rendered frame files
+also have `<name>.meta.json` with the frame rate, the mapper and its settings
+they were rendered with, so they aren't played after one of them changed.
+"""
+
+import os
+import json
+import numpy as np
+from typing import Optional
+
+
+def times_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".times.npy"
+
+
+def meta_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".meta.json"
+
+
+def render_meta(mapper, fps: float) -> dict:
+    """What the frames of mapper at fps depend on besides the canvas size (which is the shape of the frames)"""
+    meta = {"fps": float(fps), "mapper": type(mapper).__name__, "settings": mapper.settings()}
+    return json.loads(json.dumps(meta))  # like it is read back, e.g. with lists instead of tuples
+
+
+def frame_file_path(folder: str, song_name: str, mapper_name: str) -> str:
+    return os.path.join(folder, f"{song_name}.{mapper_name}.npy")
+
+
+class FrameFile:
+    """A memory-mapped frame file, frames are looked up by song position"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.frames = np.load(path, mmap_mode="r")
+        self.positions = np.load(times_path(path))[:, 1]
+        if len(self.positions) != len(self.frames):
+            raise ValueError(f"{path} has {len(self.frames)} frames but {len(self.positions)} positions")
+        if np.any(np.diff(self.positions) < 0):
+            raise ValueError(f"The positions of {path} are not in order, it can't be played by position")
+        self.shape = self.frames.shape[1:]
+        self.meta = None  # render_meta of rendered frames, None for recordings
+        if os.path.exists(meta_path(path)):
+            with open(meta_path(path)) as f:
+                self.meta = json.load(f)
+
+    def frame_at(self, position: float) -> Optional[np.ndarray]:
+        """View of the last frame at or before position, None before the first one"""
+        index = int(np.searchsorted(self.positions, position, side="right")) - 1
+        return self.frames[index] if index >= 0 else None
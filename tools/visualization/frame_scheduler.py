@@ -0,0 +1,67 @@
+import time
+from collections import deque
+
+
+class FrameScheduler:
+    """
+    Paces a render loop to a fixed frame rate.
+
+    Frames are due on a fixed grid of deadlines on the monotonic clock, so time spent
+    rendering doesn't add up as drift. A frame that overran by less than a period is
+    caught up immediately, if whole periods were missed they are skipped (dropped)
+    instead of being rendered late.
+    """
+
+    def __init__(self, fps: float, stats_window: int = 120):
+        self.fps = fps
+        self.period = 1.0 / fps
+        self.frames = 0
+        self.dropped = 0
+
+        self._deadline = None  # start time of the next frame
+        self._frame_start = None
+        self._starts = deque(maxlen=stats_window)
+        self._work = deque(maxlen=stats_window)
+
+    def reset(self) -> None:
+        self._deadline = None
+        self._frame_start = None
+
+    def wait(self) -> int:
+        """
+        Call once per frame after it was rendered. Sleeps until the next frame is due
+        and returns the number of frames that were skipped because of an overrun.
+        """
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now
+        if self._frame_start is not None:
+            self._work.append(now - self._frame_start)
+
+        skipped = 0
+        if now < self._deadline:
+            time.sleep(self._deadline - now)
+        else:
+            skipped = int((now - self._deadline) // self.period)
+            self._deadline += skipped * self.period
+            self.dropped += skipped
+
+        self._frame_start = time.monotonic()
+        self._starts.append(self._frame_start)
+        self._deadline += self.period
+        self.frames += 1
+        return skipped
+
+    def stats(self) -> dict:
+        """Timing of the recent frames"""
+        starts, work = list(self._starts), list(self._work)
+        achieved = (len(starts) - 1) / (starts[-1] - starts[0]) if len(starts) > 1 and starts[-1] > starts[0] else 0.0
+        return {
+            "target_fps": self.fps,
+            "fps": achieved,
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "work_ms_avg": 1000 * sum(work) / len(work) if work else 0.0,
+            "work_ms_max": 1000 * max(work) if work else 0.0,
+            "load": sum(work) / len(work) / self.period if work else 0.0,
+        }
@@ -0,0 +1,99 @@
+"""
+LED Layout
+---
+
+Maps the canvas of the mappers (`WIDTH` x `HEIGHT`) to physical LED outputs.
+An output is one data pin driving a chain of LEDs, the chain can run through
+several regions of the canvas (e.g. strips connected one after another, or a
+matrix wired row by row), configured in `LED_OUTPUTS` of the `config.py`:
+
+    LED_OUTPUTS = {
+        'bar': {'pin': 'D18', 'region': (0, 0, 150, 1)},
+        'matrix': {'pin': 'D21', 'pixel_order': 'GRB', 'brightness': 0.5, 'chain': [
+            {'region': (0, 1, 16, 16), 'order': 'serpentine'},  # x, y, width, height
+            {'region': (16, 1, 16, 16), 'order': 'serpentine', 'flip_y': True},
+        ]},
+    }
+
+Orders: 'rows' (every row from left to right), 'serpentine' (every other row
+wired backwards, the usual LED matrix), 'columns' and 'column_serpentine'.
+flip_x and flip_y move the first LED to the right or bottom of its region.
+
+Where every LED takes its color from is computed once per output, as the index
+of every byte the output sends (in the byte order of the LEDs) into the flat
+frame. A frame is then remapped with a single gather into a buffer that is
+reused for every frame.
+"""
+
+import numpy as np
+from typing import Dict, Optional
+
+ORDERS = ("rows", "serpentine", "columns", "column_serpentine")
+
+
+def region_indices(canvas_width: int, canvas_height: int, region, order: str = "rows",
+                   flip_x: bool = False, flip_y: bool = False) -> np.ndarray:
+    """Index of the canvas pixel (row * canvas_width + column) of every LED of a region, in the order they are wired"""
+    x, y, width, height = region
+    if width <= 0 or height <= 0 or x < 0 or y < 0 or x + width > canvas_width or y + height > canvas_height:
+        raise ValueError(f"Region {tuple(region)} is not inside the canvas of {canvas_width}x{canvas_height}")
+    if order not in ORDERS:
+        raise ValueError(f"Unknown order {order}, expected one of {', '.join(ORDERS)}")
+
+    columns = np.arange(x, x + width)[::-1 if flip_x else 1]
+    rows = np.arange(y, y + height)[::-1 if flip_y else 1]
+    lines = rows[:, None] * canvas_width + columns[None, :]  # one line per row
+    if order.startswith("column"):
+        lines = lines.T
+    if order.endswith("serpentine"):
+        lines[1::2] = lines[1::2, ::-1]
+    return lines.ravel()
+
+
+class LEDOutput:
+    def __init__(self, name: str, canvas_width: int, canvas_height: int, pin: str = "D18", chain=None,
+                 pixel_order: str = "GRB", brightness: float = 1.0, **segment):
+        if sorted(pixel_order) != ["B", "G", "R"]:
+            raise ValueError(f"Pixel order {pixel_order} of {name} is not an order of R, G and B")
+        self.name = name
+        self.pin = pin
+        self.pixel_order = pixel_order
+        self.shape = (canvas_height, canvas_width, 3)
+
+        chain = chain if chain is not None else [segment]
+        self.pixels = np.concatenate([region_indices(canvas_width, canvas_height, **part) for part in chain])
+        channels = np.array(["RGB".index(color) for color in pixel_order])
+        self.byte_index = (self.pixels[:, None] * 3 + channels[None, :]).ravel()
+
+        # Brightness as a lookup table, applied in the same pass
+        brightness = float(np.clip(brightness, 0.0, 1.0))
+        self.levels = None if brightness == 1.0 else (np.arange(256) * brightness + 0.5).astype(np.uint8)
+        self._colors = np.empty(len(self.byte_index), dtype=np.uint8)
+
+        self.buffer = bytearray(len(self.byte_index))  # always the same object, the NeoPixel driver is set up for it
+        self._bytes = np.frombuffer(self.buffer, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.pixels)
+
+    def render(self, frame: Optional[np.ndarray]) -> bytearray:
+        """Bytes to send to the LEDs for a frame of the canvas (all off for None)"""
+        if frame is None:
+            self._bytes[:] = 0
+        else:
+            if frame.shape != self.shape:
+                raise ValueError(f"Frame of shape {frame.shape} doesn't fit the canvas {self.shape} of {self.name}")
+            flat = frame.reshape(-1)
+            if self.levels is None:
+                np.take(flat, self.byte_index, out=self._bytes)
+            else:
+                np.take(flat, self.byte_index, out=self._colors)
+                np.take(self.levels, self._colors, out=self._bytes)
+        return self.buffer
+
+
+def led_outputs(width: int, height: int, outputs: Optional[Dict] = None) -> Dict[str, LEDOutput]:
+    """The LEDOutputs of a configuration, one strip on D18 along the first row of the canvas by default"""
+    if not outputs:
+        outputs = {"strip": {"pin": "D18", "region": (0, 0, width, 1)}}
+    return {name: LEDOutput(name, width, height, **spec) for name, spec in outputs.items()}
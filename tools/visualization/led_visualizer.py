@@ -1,42 +1,58 @@
 from tools.visualization import BaseVisualizer
-from tools.analysis import analyze_segment, set_audio
+from tools.visualization.layout import led_outputs
 from tools.mapping import *
-import time
-import neopixel
+from neopixel_write import neopixel_write
+import digitalio
 import board
 
-class LEDVisualizer(BaseVisualizer):
-    def __init__(self, led_count, _, mapper_cls=BaseMapper):
-        super().__init__()
-
-        self.led_count = led_count
-        self.mapper = mapper_cls(led_count, 1)
-        self.led_strip = neopixel.NeoPixel(board.D18, self.led_count, auto_write = False)
-        self.led_strip.fill((0, 0, 0))
-        self.led_strip.show()
-        
-    
-    def visualize(self):
-        while self.running:
-            
-            self.led_strip.fill((0, 0, 0))
-            
-            
-            if self.song_name and self.song_playing and self.music_file is not None:
-                self.elapsed_time = time.time() - (self.song_timestamp) + self.song_pos + 0.1
-
-                try:
-                    analysis = analyze_segment(self.elapsed_time)
-                    if self.mapper:
-                        color_line = self.mapper.map(analysis)[0]  # -> RGB 2D array (height x 1)
-
-                        self.led_strip[0:len(color_line)-1] = color_line[0:len(color_line)-1]
-                except Exception as e:
-                    print(e)
-            
-            self.led_strip.show()
-        
-        self.led_strip.fill((0, 0, 0))
-        self.led_strip.show()
+class LEDOutput:
+    """
+    Output stage of the LEDVisualizer: shows the canvas on the LED outputs of Config.LED_OUTPUTS
+    (see layout.py), names selects some of them. Needs nothing of the player side, output
+    processes (outputs.py) use it on its own.
+    """
 
+    def __init__(self, width, height, names=None):
+        from config import Config
 
+        self.width = width
+        self.height = height
+
+        outputs = led_outputs(width, height, Config.LED_OUTPUTS)
+        if names:
+            unknown = set(names) - set(outputs)
+            if unknown:
+                raise ValueError(f"No LED output {', '.join(sorted(unknown))} in LED_OUTPUTS")
+            outputs = {name: outputs[name] for name in names}
+        self.outputs = list(outputs.values())
+
+        self.pins = []
+        for output in self.outputs:
+            pin = digitalio.DigitalInOut(getattr(board, output.pin))
+            pin.direction = digitalio.Direction.OUTPUT
+            self.pins.append(pin)
+        self.show(None)
+
+    def handle_events(self):
+        return True
+
+    def show(self, frame):
+        for output, pin in zip(self.outputs, self.pins):
+            neopixel_write(pin, output.render(frame))
+
+    def close(self):
+        self.show(None)
+        for pin in self.pins:
+            pin.deinit()
+
+
+class LEDVisualizer(LEDOutput, BaseVisualizer):
+    """
+    A Raspberry Pi can only drive one output per process, run several
+    with the BusVisualizer: python -m tools.visualization.outputs led --output <name>
+    """
+
+    def __init__(self, width, height, mapper_cls=BaseMapper, names=None):
+        BaseVisualizer.__init__(self)
+        LEDOutput.__init__(self, width, height, names)
+        self.mapper = mapper_cls(width, height)
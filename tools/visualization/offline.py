@@ -0,0 +1,120 @@
+"""
+Offline Renderer
+---
+
+Renders all frames of a track at a fixed frame rate ahead of time into a frame
+file: a `.npy` file of shape (frames, height, width, 3) and the song position of
+every frame in `<name>.times.npy` (the same format the recorder of `outputs.py`
+writes). A visualizer plays a frame file by looking up the frame of the playback
+position in the memory-mapped file instead of analyzing and mapping, which
+leaves a slow device like a Raspberry Pi with nearly nothing to do per frame.
+
+Frame files in `RENDER_FOLDER` named `<song>.<mapper class>.npy` are played
+automatically when the song plays with that mapper, the canvas size, the frame
+rate and the mapper settings (e.g. `SEGMENTS`, `SPECTRUM_SCALE`) they were
+rendered with:
+
+    python -m tools.visualization.offline music/song.opus [--mapper FlowingEffectsMapper] [--fps 30] [--workers 4]
+
+Mappers without state, or whose state only depends on the last few frames (see
+`BaseMapper.warmup_frames`), are rendered in chunks by several processes that
+write straight into the memory-mapped file, the others in one pass.
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from tools.analysis.cache import AnalysisCache, analyze_file
+from tools.visualization.frame_file import times_path, meta_path, render_meta, frame_file_path
+
+MIN_CHUNK = 256  # frames per parallel job at least
+
+
+def _render_range(track, mapper_cls, width: int, height: int, fps: float, frames: np.ndarray, start: int, stop: int) -> None:
+    """Maps frames [start, stop) into frames, after mapping the warm-up frames before start without keeping them"""
+    mapper = mapper_cls(width, height)
+    warmup = mapper.warmup_frames() or 0
+    features = {}
+    for index in range(max(start - warmup, 0), stop):
+        out = frames[index] if index >= start else mapper.output  # right into the memory-mapped file
+        mapper.map_into(track.analyze(index / fps, out=features), out)
+
+
+def _render_chunk(song_path: str, cache_folder: str, mapper_cls, width: int, height: int, fps: float,
+                  out_path: str, start: int, stop: int) -> None:
+    """Runs in a worker process, the analysis is loaded memory-mapped from the cache the parent wrote it into"""
+    track = analyze_file(song_path, AnalysisCache(cache_folder, 1 << 40))
+    frames = np.load(out_path, mmap_mode="r+")
+    _render_range(track, mapper_cls, width, height, fps, frames, start, stop)
+    frames.flush()
+
+
+def render_track(song_path: str, out_path: str, mapper_cls, width: int, height: int, fps: float = 30,
+                 workers: int = 1, cache: Optional[AnalysisCache] = None) -> int:
+    """Renders the whole track into the frame file at out_path, returns the number of frames"""
+    with tempfile.TemporaryDirectory() as folder:
+        cache = cache or AnalysisCache(folder, 1 << 40)  # the workers load the analysis from here
+        track = analyze_file(song_path, cache)
+        count = int(track.duration * fps) + 1
+
+        mapper = mapper_cls(width, height)
+        frames = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.uint8, shape=(count, *mapper.output.shape))
+
+        warmup = mapper.warmup_frames()
+        chunks = min(workers, count // MIN_CHUNK) if warmup is not None else 1
+        if chunks <= 1:
+            _render_range(track, mapper_cls, width, height, fps, frames, 0, count)
+        else:
+            bounds = np.linspace(0, count, chunks + 1).astype(int)
+            frames.flush()
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=chunks, mp_context=context) as executor:
+                jobs = [executor.submit(_render_chunk, song_path, cache.folder, mapper_cls, width, height, fps,
+                                        out_path, int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+                for job in jobs:
+                    job.result()
+        frames.flush()
+        del frames
+
+    times = np.full((count, 2), np.nan)  # timestamp (only known for recordings), position
+    times[:, 1] = np.arange(count) / fps
+    np.save(times_path(out_path), times)
+    with open(meta_path(out_path), "w") as f:
+        json.dump(render_meta(mapper, fps), f)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("songs", nargs="+", help="audio files to render")
+    parser.add_argument("--mapper", help="mapper class (default: MAPPER_CLASS of the config)")
+    parser.add_argument("--fps", type=float, help="frames per second (default: TARGET_FPS of the config)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--folder", help="where to write the frame files (default: RENDER_FOLDER of the config)")
+    args = parser.parse_args()
+
+    from config import Config
+    import tools.mapping
+    mapper_cls = getattr(tools.mapping, args.mapper) if args.mapper else Config.MAPPER_CLASS
+    folder = args.folder or Config.RENDER_FOLDER or "."
+    os.makedirs(folder, exist_ok=True)
+    cache = AnalysisCache(Config.ANALYSIS_CACHE_FOLDER, Config.ANALYSIS_CACHE_MAX_MB * 1024 * 1024) if Config.ANALYSIS_CACHE_FOLDER else None
+
+    for song_path in args.songs:
+        song_name = os.path.splitext(os.path.basename(song_path))[0]
+        out_path = frame_file_path(folder, song_name, mapper_cls.__name__)
+        start = time.perf_counter()
+        count = render_track(song_path, out_path, mapper_cls, Config.WIDTH, Config.HEIGHT, args.fps or Config.TARGET_FPS,
+                             args.workers, cache)
+        seconds = time.perf_counter() - start
+        print(f"{song_name}: {count} frames in {seconds:.1f} s ({count / seconds:.0f} frames/s) -> {out_path}")
+
+
+if __name__ == "__main__":
+    main()
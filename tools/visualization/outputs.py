@@ -0,0 +1,142 @@
+"""
+Output Processes
+---
+
+Output devices that show the frames of a `BusVisualizer` (see `frame_bus.py`),
+each in a process of its own. Start as many as you like while the player runs:
+
+    python -m tools.visualization.outputs pygame [--window 800x200]
+    python -m tools.visualization.outputs led [--output bar]
+    python -m tools.visualization.outputs record frames.npy
+
+The devices are the output stages of the visualizers the player would otherwise
+run itself (`PygameOutput`, `LEDOutput`: `handle_events`, `show`, `close`)
+without their player side. Devices show a copy of the newest complete frame
+(frames are copied with `FrameBusReader.read`, so a frame the visualizer is
+overwriting meanwhile never reaches the device), the recorder copies every frame
+into a `.npy` file of shape (frames, height, width, 3) and their timestamps and
+song positions (NaN while nothing played) into `<name>.times.npy`.
+"""
+
+import os
+import sys
+import signal
+import argparse
+import numpy as np
+from tools.visualization.frame_bus import FrameBusReader
+from tools.visualization.frame_file import times_path
+
+EVENT_INTERVAL = 0.05  # seconds between two handle_events calls while no frames arrive
+RECORD_CHUNK = 1024  # frames copied at once when the recording is finished
+
+
+class FrameRecorder:
+    def __init__(self, path: str, shape):
+        self.path = path
+        self.shape = tuple(shape)
+        self.frames = 0
+        self._part = open(path + '.part', 'wb')
+        self._times = []
+
+    def write(self, frame: np.ndarray, timestamp: float, position: float) -> None:
+        self._part.write(frame)
+        self._times.append((timestamp, position))
+        self.frames += 1
+
+    def close(self) -> None:
+        """Turns the frames written so far into the .npy file"""
+        self._part.close()
+        part = self.path + '.part'
+        if self.frames:
+            out = np.lib.format.open_memmap(self.path, mode='w+', dtype=np.uint8, shape=(self.frames,) + self.shape)
+            with open(part, 'rb') as f:
+                for start in range(0, self.frames, RECORD_CHUNK):
+                    f.readinto(out[start:start + RECORD_CHUNK])
+            out.flush()
+            del out
+        else:
+            np.save(self.path, np.zeros((0,) + self.shape, dtype=np.uint8))
+        np.save(times_path(self.path), np.array(self._times, dtype=np.float64).reshape(-1, 2))
+        os.remove(part)
+
+
+def show_frames(output, reader: FrameBusReader) -> None:
+    """Shows the newest frame of the bus on an output stage until its handle_events returns False"""
+    seen = 0
+    frame = np.empty(reader.shape, dtype=np.uint8)
+    try:
+        while output.handle_events():
+            written = reader.wait(seen, timeout=EVENT_INTERVAL)
+            if written == seen:
+                continue
+            seen = written
+            if frame.shape != reader.shape:  # a restarted visualizer with another canvas
+                frame = np.empty(reader.shape, dtype=np.uint8)
+            if reader.read(frame) is not None:  # None if every try was torn by the writer, the next frame is soon
+                output.show(frame)
+    finally:
+        output.close()
+
+
+def record_frames(recorder: FrameRecorder, reader: FrameBusReader) -> None:
+    """Records every frame published on the bus until the process is stopped"""
+    seen = reader.written
+    missed = 0
+    frame = np.empty(reader.shape, dtype=np.uint8)
+    try:
+        while True:
+            written = reader.wait(seen, timeout=EVENT_INTERVAL)
+            first = max(seen, written - reader.capacity)
+            missed += first - seen
+            if reader.shape != recorder.shape:  # a restarted visualizer with another canvas
+                missed += written - first
+                seen = written
+                continue
+            for n in range(first, written):
+                stamps = reader.read(frame, n)
+                if stamps is None:
+                    missed += 1
+                else:
+                    recorder.write(frame, *stamps)
+            seen = written
+    finally:
+        recorder.close()
+        print(f"Recorded {recorder.frames} frames to {recorder.path}, missed {missed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("device", choices=["pygame", "led", "record"])
+    parser.add_argument("path", nargs="?", default="frames.npy", help="file of the recorder")
+    parser.add_argument("--bus", help="name of the frame bus (default: FRAME_BUS of the config)")
+    parser.add_argument("--window", default=None, help="size of the pygame window, e.g. 800x200")
+    parser.add_argument("--output", nargs="+", help="LED outputs of LED_OUTPUTS to drive (default: all)")
+    args = parser.parse_args()
+
+    from config import Config
+    reader = FrameBusReader(args.bus or Config.FRAME_BUS)
+    height, width, _ = reader.shape
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # clean up like on Ctrl+C
+
+    try:
+        if args.device == "record":
+            record_frames(FrameRecorder(args.path, reader.shape), reader)
+        elif args.device == "pygame":
+            from tools.visualization.pygame_visualizer import PygameOutput
+            window = tuple(int(size) for size in args.window.split("x")) if args.window else (width, height)
+            show_frames(PygameOutput(*window), reader)
+        else:
+            try:
+                from tools.visualization.led_visualizer import LEDOutput
+            except ImportError as e:
+                print(f"NeoPixel not installed, the LED output is not available: {e}")
+                return
+            show_frames(LEDOutput(width, height, names=args.output), reader)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Frame Pipeline
+---
+
+Splits a visualizer into two stages running in separate threads:
+- the producer analyzes and maps the frames of the song ahead of time
+  (`lookahead` seconds before they are due) and writes them into a `FrameRing`
+- the output stage (the visualizer loop) takes the frame whose timestamp matches
+  the current playback position and shows it
+
+Slow outputs (SPI writes to a NeoPixel strip, flipping a large window) therefore
+no longer slow down the analysis and the other way round.
+"""
+
+import math
+import time
+import numpy as np
+from threading import Lock, Thread
+from typing import Optional
+
+
+class FrameRing:
+    """Fixed number of preallocated frames, each tagged with the song position it shows"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.frames = None  # allocated on the first put, once the frame shape is known
+        self.timestamps = np.full(capacity, np.nan)
+        self._next = 0
+        self._lock = Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.timestamps.fill(np.nan)
+
+    def put(self, timestamp: float, frame: np.ndarray) -> None:
+        """Copy frame into the oldest slot"""
+        with self._lock:
+            if self.frames is None or self.frames.shape[1:] != frame.shape or self.frames.dtype != frame.dtype:
+                self.frames = np.zeros((self.capacity, *frame.shape), dtype=frame.dtype)
+                self.timestamps.fill(np.nan)
+            slot = self._next
+            self.frames[slot] = frame
+            self.timestamps[slot] = timestamp
+            self._next = (slot + 1) % self.capacity
+
+    def get(self, timestamp: float, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Copy of the newest frame that is due at timestamp, None if there is none"""
+        with self._lock:
+            due = np.where(self.timestamps <= timestamp, self.timestamps, -np.inf)
+            slot = int(np.argmax(due))
+            if due[slot] == -np.inf:
+                return None
+            if out is None or out.shape != self.frames.shape[1:]:
+                out = np.empty_like(self.frames[slot])
+            np.copyto(out, self.frames[slot])
+            return out
+
+    def newest(self) -> Optional[float]:
+        with self._lock:
+            return None if np.isnan(self.timestamps).all() else float(np.nanmax(self.timestamps))
+
+
+class FramePipeline:
+    def __init__(self, visualizer, fps: float, lookahead: float):
+        self.visualizer = visualizer
+        self.period = 1.0 / fps
+        self.lookahead = lookahead
+        self.ring = FrameRing(math.ceil(lookahead / self.period) + 3)
+
+        self.produced = 0
+        self.resyncs = 0
+        self.running = False
+        self.thread = None
+        self._out = None
+
+    def start(self) -> None:
+        if not self.running:
+            self.running = True
+            self.thread = Thread(target=self._produce, daemon=True)
+            self.thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        if self.thread:
+            self.thread.join()
+
+    def frame_at(self, position: Optional[float]) -> Optional[np.ndarray]:
+        """Frame to show at the playback position, the returned array is reused by the next call"""
+        if position is None:
+            return None
+        frame = self.ring.get(position, self._out)
+        if frame is not None:
+            self._out = frame
+        return frame
+
+    def stats(self) -> dict:
+        position = self.visualizer.output_position()
+        newest = self.ring.newest()
+        return {
+            "lookahead": self.lookahead,
+            "lead": newest - position if newest is not None and position is not None else 0.0,
+            "produced": self.produced,
+            "resyncs": self.resyncs,
+        }
+
+    def _produce(self) -> None:
+        next_time = None
+        track = None
+        while self.running:
+            position = self.visualizer.output_position()
+            if position is None or self.visualizer.track is not track:
+                # paused or the song changed, frames in the ring are useless now
+                if self.visualizer.track is not track:
+                    track = self.visualizer.track
+                    self.visualizer.reset_mapper()
+                self.ring.clear()
+                next_time = None
+                if position is None:
+                    time.sleep(self.period)
+                    continue
+
+            # live input can't be analyzed ahead of time, its frames are mapped as soon as they are due
+            lookahead = 0.0 if getattr(track, "live", False) else self.lookahead
+            if next_time is None or next_time < position - self.period or next_time > position + lookahead + self.period:
+                # fell behind or the song was seeked: start again at the playback position
+                if next_time is not None:
+                    self.resyncs += 1
+                    self.ring.clear()
+                next_time = position
+
+            if next_time > position + lookahead:
+                time.sleep(min(next_time - position - lookahead, self.period))
+                continue
+
+            try:
+                frame = self.visualizer.render(track, next_time)
+                if frame is not None:
+                    self.ring.put(next_time, frame)
+                    self.produced += 1
+            except Exception as e:
+                print(e)
+            next_time += self.period
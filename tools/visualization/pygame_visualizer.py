@@ -1,51 +1,56 @@
 import pygame
-import time
 from tools.visualization import BaseVisualizer
-from tools.analysis import analyze_segment, set_audio
 from tools.mapping import *
-import numpy as np
 
-class PygameVisualizer(BaseVisualizer):
-    def __init__(self, width, height, mapper_cls=BaseMapper):
-        super().__init__()
+class PygameOutput:
+    """
+    Output stage of the PygameVisualizer: a resizable window the frames are scaled into.
+    Needs nothing of the player side, output processes (outputs.py) use it on its own.
+    """
 
+    def __init__(self, width, height):
         self.width = width
         self.height = height
-        self.mapper = mapper_cls(width, height)
 
         pygame.init()
         self.screen = pygame.display.set_mode((self.width, self.height), pygame.RESIZABLE)
         pygame.display.set_caption("Music Visualizer")
         self.font = pygame.font.Font(None, 36)
-        self.clock = pygame.time.Clock()
-
-    def visualize(self):
-        while self.running:
+        self.frame_surface = None  # frame sized, the frames are blitted into it
+        self.scaled_surface = None  # window sized, the frame surface is scaled into it
+
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
+            elif event.type == pygame.VIDEORESIZE:
+                self.width, self.height = event.size
+                self.screen = pygame.display.set_mode((self.width, self.height), pygame.RESIZABLE)
+        return True
+
+    def show(self, frame):
+        if frame is None:
             self.screen.fill((0, 0, 0))  # Clear screen
+        else:
+            # Surfaces are only created again when the frame or window size changed
+            size = (frame.shape[1], frame.shape[0])
+            if self.frame_surface is None or self.frame_surface.get_size() != size:
+                self.frame_surface = pygame.Surface(size, 0, self.screen)
+            if self.scaled_surface is None or self.scaled_surface.get_size() != self.screen.get_size():
+                self.scaled_surface = pygame.Surface(self.screen.get_size(), 0, self.screen)
 
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.stop()
-                    return
-                elif event.type == pygame.VIDEORESIZE:
-                    self.width, self.height = event.size
-                    self.screen = pygame.display.set_mode((self.width, self.height), pygame.RESIZABLE)
+            pygame.surfarray.blit_array(self.frame_surface, frame.swapaxes(0, 1))  # a view, surfaces are (x, y)
+            pygame.transform.scale(self.frame_surface, self.scaled_surface.get_size(), self.scaled_surface)
+            self.screen.blit(self.scaled_surface, (0, 0))
 
-            if self.song_name and self.song_playing and self.music_file is not None:
-                self.elapsed_time = time.time() - (self.song_timestamp) + self.song_pos + 0.1
+        pygame.display.flip()
 
-                try:
-                    analysis = analyze_segment(self.elapsed_time)
-                    if self.mapper:
-                        frame_array = self.mapper.map(analysis)  # -> RGB 2D array (height x width x 3)
-                        surface = pygame.surfarray.make_surface(np.transpose(frame_array, (1, 0, 2)))
-                        scaled_surface = pygame.transform.scale(surface, self.screen.get_size())
-                        self.screen.blit(scaled_surface, (0, 0))
-                except Exception as e:
-                    print(e)
+    def close(self):
+        pygame.quit()
 
-            pygame.display.flip()
-            self.clock.tick(30)
 
-
-        pygame.quit()
\ No newline at end of file
+class PygameVisualizer(PygameOutput, BaseVisualizer):
+    def __init__(self, width, height, mapper_cls=BaseMapper):
+        BaseVisualizer.__init__(self)
+        PygameOutput.__init__(self, width, height)
+        self.mapper = mapper_cls(width, height)
@@ -0,0 +1,18 @@
+"""
+Production entry point
+---
+
+The visualizer runs in a process of its own, the web server can then run as
+many worker processes as it wants:
+
+    python -m app.service
+    gunicorn -w 4 -k gthread --threads 32 -b 0.0.0.0:5050 wsgi:app
+
+Threaded workers are needed for the event streams of the players (/api/events),
+every open player keeps one request running.
+"""
+
+from config import Config
+from app import create_app
+
+app = create_app(Config.SERVICE_SOCKET)